@@ -0,0 +1,96 @@
+"""
+Saved calls against missed detections for the cascade analyzer mode.
+
+Replays every image recorded in the Rekognition fixtures through all five
+analyses, then applies the cascade's gates to the labels and moderation
+results. For each image it shows what the cascade would skip and whether
+the skipped analysis found anything in the full run (a missed detection).
+The totals give the Rekognition calls saved and the detections lost.
+
+The latency columns are the critical path from the replay's median
+latencies: full runs all five calls at once, cascade runs labels and
+moderation first and then the gated calls.
+
+Record fixtures from real images with emulator/rekognition_replay.py's
+RecordingRekognition and point --fixture-dir at them to evaluate the gates
+on your own traffic.
+
+Usage: python backend/benchmarks/bench_cascade.py [--fixture-dir DIR] [--min-confidence 70]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'emulator'))
+
+import cascade
+from rekognition_analysis import ANALYSES
+from rekognition_replay import DEFAULT_LATENCY_MS, FIXTURE_DIR, ReplayRekognition
+
+OPERATIONS = {
+    'labels': 'DetectLabels',
+    'moderation': 'DetectModerationLabels',
+    'faces': 'DetectFaces',
+    'celebrities': 'RecognizeCelebrities',
+    'text': 'DetectText'
+}
+
+def found_something(name, result):
+    """
+    Whether a gated analysis detected anything worth keeping
+    """
+    if name == 'faces':
+        return result.get('faceCount', 0) > 0
+    if name == 'celebrities':
+        return result.get('celebrityCount', 0) > 0
+    if name == 'text':
+        return result.get('hasText', False)
+    return False
+
+def critical_path_ms(names):
+    return max((DEFAULT_LATENCY_MS[OPERATIONS[name]] for name in names), default=0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--fixture-dir', default=FIXTURE_DIR)
+    parser.add_argument('--min-confidence', type=float, default=cascade.CASCADE_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    rekognition = ReplayRekognition(fixture_dir=args.fixture_dir, latency_scale=0)
+    images = sorted({name for fixture in rekognition.fixtures.values() for name in fixture['responses']})
+
+    print(f"{'image':<16}{'skipped (reason)':<68}{'missed':<24}{'full ms':>9}{'cascade ms':>12}")
+    totals = {'calls': 0, 'cascade calls': 0, 'missed': 0, 'full ms': 0, 'cascade ms': 0}
+
+    for image in images:
+        key = f"{image}.jpg"
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = {name: analyze(rekognition, 'fixtures', key) for name, analyze in ANALYSES}
+        skipped = cascade.plan_cascade(results['labels'], results['moderation'], args.min_confidence)
+
+        missed = [name for name in skipped if found_something(name, results[name])]
+        second_stage = [name for name in cascade.GATES if name not in skipped]
+        full_ms = critical_path_ms(OPERATIONS)
+        cascade_ms = critical_path_ms(cascade.FIRST_STAGE) + critical_path_ms(second_stage)
+
+        totals['calls'] += len(ANALYSES)
+        totals['cascade calls'] += len(ANALYSES) - len(skipped)
+        totals['missed'] += len(missed)
+        totals['full ms'] += full_ms
+        totals['cascade ms'] += cascade_ms
+
+        described = ', '.join(f"{name} ({reason})" for name, reason in skipped.items()) or '-'
+        print(f"{image:<16}{described:<68}{', '.join(missed) or '-':<24}{full_ms:>9}{cascade_ms:>12}")
+
+    saved = totals['calls'] - totals['cascade calls']
+    print(f"\n{len(images)} images: {totals['cascade calls']}/{totals['calls']} Rekognition calls "
+          f"({saved} saved, {saved / max(1, totals['calls']):.0%}), {totals['missed']} missed detections, "
+          f"mean critical path {totals['full ms'] / max(1, len(images)):.0f} ms full, "
+          f"{totals['cascade ms'] / max(1, len(images)):.0f} ms cascade")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Import-time and cold-start benchmark for every Lambda function.
+
+Each sample runs in a fresh interpreter, as a new Lambda container does, and
+measures:
+- import: importing the handler module (the function's init phase);
+- clients: then building every AWS client and resource the module holds,
+  which is what the first invocation pays when clients are created lazily;
+- total: the two together, the cold-start overhead before handler code runs.
+No AWS calls are made; dummy credentials and a region are set so client
+construction does not try to reach the instance metadata service.
+
+With --ref the same measurement is taken on another commit (exported with
+git archive), so a change can be compared against its baseline:
+
+  python backend/benchmarks/bench_cold_start.py --ref HEAD~1
+
+Needs boto3 and Pillow importable, as in the CommonDependenciesLayer.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+FUNCTIONS = [
+    'auth_handler',
+    'image_handler',
+    'workflow_trigger',
+    'image_validation',
+    'image_normalization',
+    'detect_labels',
+    'detect_moderation',
+    'detect_faces',
+    'recognize_celebrities',
+    'detect_text',
+    'fused_analyzer',
+    'results_processor',
+    's3_notification_setup'
+]
+
+ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'AKIDEXAMPLE',
+    'AWS_SECRET_ACCESS_KEY': 'wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY',
+    'AWS_EC2_METADATA_DISABLED': 'true',
+    'IMAGE_BUCKET': 'bench-images',
+    'RESULTS_TABLE': 'bench-results',
+    'ANALYSIS_CACHE_TABLE': 'bench-analysis-cache',
+    'USER_POOL_ID': 'us-east-1_bench',
+    'CLIENT_ID': 'bench-client'
+}
+
+# Runs in the fresh interpreter: import the module, then touch every client
+# it holds ('meta' exists on clients and resources, and builds lazy ones)
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+for value in list(vars(module).values()):
+    if type(value).__module__ in ('botocore.client', 'boto3.resources.factory', 'metrics'):
+        value.meta
+built = time.perf_counter()
+print(json.dumps({'import': imported - start, 'clients': built - imported}))
+"""
+
+def measure(backend_dir, function, runs):
+    """
+    Median import/clients seconds over 'runs' fresh interpreters
+    """
+    env = dict(os.environ, **ENV)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+        os.path.join(backend_dir, 'functions', function),
+        os.path.join(backend_dir, 'layers', 'shared', 'python'),
+        os.environ.get('PYTHONPATH')
+    ]))
+    # Lambda runs without bytecode written by a previous run
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, function],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {phase: statistics.median(sample[phase] for sample in samples) for phase in ('import', 'clients')}
+
+def export_ref(ref, target):
+    """
+    Extract backend/ at git 'ref' into 'target' and return its path
+    """
+    archive = subprocess.run(
+        ['git', 'archive', '--prefix=backend/', f"{ref}:backend"],
+        cwd=os.path.join(BACKEND_DIR, '..'), capture_output=True, check=True
+    ).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return os.path.join(target, 'backend')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters per function')
+    parser.add_argument('--ref', help='git ref to compare against')
+    parser.add_argument('functions', nargs='*', default=FUNCTIONS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_dir = export_ref(args.ref, tmp) if args.ref else None
+
+        header = f"{'function':<24}{'import ms':>11}{'clients ms':>12}{'total ms':>10}"
+        if baseline_dir:
+            header += f"{args.ref + ' ms':>16}{'change':>9}"
+        print(f"Median of {args.runs} fresh interpreters")
+        print(header)
+
+        for function in args.functions:
+            current = measure(BACKEND_DIR, function, args.runs)
+            total = current['import'] + current['clients']
+            line = f"{function:<24}{current['import'] * 1000:>11.1f}{current['clients'] * 1000:>12.1f}{total * 1000:>10.1f}"
+            if baseline_dir:
+                baseline = measure(baseline_dir, function, args.runs)
+                baseline_total = baseline['import'] + baseline['clients']
+                line += f"{baseline_total * 1000:>16.1f}{(total / baseline_total - 1) * 100:>+8.0f}%"
+            print(line)
+
+if __name__ == '__main__':
+    main()
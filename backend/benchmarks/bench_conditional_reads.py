@@ -0,0 +1,129 @@
+"""
+Cost of a repeated gallery load with and without the ETag.
+
+Seeds a user with N images in the emulator's in-memory tables, then calls
+the image handler's list_images and get_image_results the way a polling
+client does: once unconditionally and then with the If-None-Match of the
+first response. Reports DynamoDB calls, items read, response bytes and
+handler time per request. A final request after a status change checks that
+the ETag moves with the data.
+
+Usage: python backend/benchmarks/bench_conditional_reads.py [--images 50] [--repeat 200]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from decimal import Decimal
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'emulator'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'functions', 'image_handler'))
+
+os.environ.update({
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'IMAGE_BUCKET': 'bench-images',
+    'RESULTS_TABLE': 'bench-results',
+    'USER_VERSIONS_TABLE': 'bench-user-versions'
+})
+
+import boto3
+from aws_stubs import DynamoDBStub, S3Stub, TableStub
+
+USER_ID = 'bench-user'
+
+class CountingTable(TableStub):
+    """
+    Table stub counting read calls and the items they return
+    """
+    calls = 0
+    items_read = 0
+
+    def get_item(self, **kwargs):
+        response = super().get_item(**kwargs)
+        CountingTable.calls += 1
+        CountingTable.items_read += 1 if 'Item' in response else 0
+        return response
+
+    def query(self, **kwargs):
+        response = super().query(**kwargs)
+        CountingTable.calls += 1
+        CountingTable.items_read += len(response['Items'])
+        return response
+
+def seed(dynamodb, count):
+    results = dynamodb.tables[os.environ['RESULTS_TABLE']]
+    labels = [{'name': f"Label {i}", 'confidence': Decimal(90 - i), 'parents': ['Thing']} for i in range(20)]
+    for i in range(count):
+        results.put_item(Item={
+            'userId': USER_ID,
+            'imageId': f"image-{i:04d}",
+            'imageKey': f"{USER_ID}/image-{i:04d}.jpg",
+            'fileName': f"photo-{i}.jpg",
+            'createdAt': 1700000000 + i,
+            'status': 'completed',
+            'analysisProfile': 'full',
+            'results': {'labels': {'labels': labels, 'labelCount': len(labels)}}
+        })
+
+def measure(label, call, repeat):
+    CountingTable.calls = CountingTable.items_read = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            response = call()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<30}{response['statusCode']:>6}{CountingTable.calls / repeat:>12.1f}"
+          f"{CountingTable.items_read / repeat:>12.1f}{len(response['body'].encode('utf-8')):>10}"
+          f"{elapsed / repeat * 1000:>12.3f}")
+    return response
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    dynamodb = DynamoDBStub()
+    for name, hash_key, range_key, indexes in (
+        (os.environ['RESULTS_TABLE'], 'userId', 'imageId', {'userId-createdAt-index': ('userId', 'createdAt')}),
+        (os.environ['USER_VERSIONS_TABLE'], 'userId', None, None)
+    ):
+        dynamodb.tables[name] = CountingTable(name, hash_key, range_key, indexes)
+    s3 = S3Stub()
+    boto3.client = lambda service_name, *a, **k: s3
+    boto3.resource = lambda service_name, *a, **k: dynamodb
+
+    import image_handler
+    from collection_version import bump_version
+
+    seed(dynamodb, args.images)
+    bump_version(USER_ID)
+
+    print(f"{args.images} images, {args.repeat} requests each")
+    print(f"  {'request':<30}{'status':>6}{'DDB calls':>12}{'items read':>12}{'bytes':>10}{'ms':>12}")
+
+    listing = measure('list_images', lambda: image_handler.list_images(USER_ID, {}), args.repeat)
+    etag = listing['headers']['ETag']
+    measure('list_images (If-None-Match)', lambda: image_handler.list_images(USER_ID, {}, etag), args.repeat)
+
+    image_id = 'image-0000'
+    results = measure('get_image_results', lambda: image_handler.get_image_results(USER_ID, image_id), args.repeat)
+    results_etag = results['headers']['ETag']
+    measure('results (If-None-Match)', lambda: image_handler.get_image_results(USER_ID, image_id, results_etag), args.repeat)
+
+    # A write moves the version: the stale ETag must get a full response
+    dynamodb.tables[os.environ['RESULTS_TABLE']].update_item(
+        Key={'userId': USER_ID, 'imageId': image_id},
+        UpdateExpression='SET #status = :status',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':status': 'processing'}
+    )
+    bump_version(USER_ID)
+    measure('list_images after a write', lambda: image_handler.list_images(USER_ID, {}, etag), 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Near-duplicate lookup at scale: multi-index hashing against a BK-tree and a
+linear scan.
+
+Part 1 hashes a synthetic photo and versions of it with perceptual_hash.dhash:
+- re-encoded;
+- resized;
+- re-exported as PNG;
+- cropped;
+- rotated.
+It prints each version's Hamming distance from the original, next to the
+distance between unrelated images.
+
+Part 2 indexes N random 64-bit hashes (1M by default) three ways:
+- the chunk buckets the duplicate detector keeps in HASH_INDEX_TABLE, held
+  in dicts;
+- a BK-tree;
+- a plain list.
+It then looks up queries planted at distances 0 to MAX_DISTANCE from indexed
+hashes, plus unrelated queries. Reports build time, time per lookup,
+hashes compared per lookup (for the buckets, the postings a lookup reads
+from DynamoDB) and recall against the linear scan.
+
+Random hashes spread evenly over the buckets. Real photo hashes are
+somewhat clumpier, and MAX_BUCKET_ITEMS bounds the worst buckets.
+
+Usage: python backend/benchmarks/bench_near_duplicates.py [--hashes 1000000] [--queries 200]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from perceptual_hash import CHUNKS, MAX_DISTANCE, chunk_values, dhash, hamming
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance
+    """
+    def __init__(self):
+        self.root = None
+
+    def add(self, value):
+        if self.root is None:
+            self.root = (value, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        (matches, hashes compared)
+        """
+        matches = []
+        compared = 0
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming(value, node_value)
+            compared += 1
+            if distance <= radius:
+                matches.append(node_value)
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return matches, compared
+
+class ChunkIndex:
+    """
+    The HASH_INDEX_TABLE layout in memory: one bucket per (chunk, value)
+    """
+    def __init__(self):
+        self.buckets = [{} for _ in range(CHUNKS)]
+
+    def add(self, value):
+        for chunk, bucket in zip(chunk_values(value), self.buckets):
+            bucket.setdefault(chunk, []).append(value)
+
+    def search(self, value, radius):
+        candidates = set()
+        compared = 0
+        for chunk, bucket in zip(chunk_values(value), self.buckets):
+            postings = bucket.get(chunk, [])
+            compared += len(postings)
+            candidates.update(postings)
+        return [other for other in candidates if hamming(value, other) <= radius], compared
+
+def linear_search(hashes, value, radius):
+    return [other for other in hashes if hamming(value, other) <= radius], len(hashes)
+
+def synthetic_photo(rng, size=(1600, 1200)):
+    """
+    Smooth shapes over a gradient, blurred, so it downsamples like a photo
+    """
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    top, bottom = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(2)]
+    for y in range(size[1]):
+        mix = y / size[1]
+        draw.line([(0, y), (size[0], y)], fill=tuple(int(a + (b - a) * mix) for a, b in zip(top, bottom)))
+    for _ in range(25):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        radius = rng.randrange(40, 300)
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image.filter(ImageFilter.GaussianBlur(6))
+
+def reopen(image, image_format, **options):
+    output = io.BytesIO()
+    image.save(output, format=image_format, **options)
+    return Image.open(io.BytesIO(output.getvalue()))
+
+def hash_robustness(rng):
+    photo = synthetic_photo(rng)
+    original = dhash(reopen(photo, 'JPEG', quality=90))
+    width, height = photo.size
+    versions = [
+        ('JPEG quality 60', lambda: reopen(photo, 'JPEG', quality=60)),
+        ('JPEG quality 30', lambda: reopen(photo, 'JPEG', quality=30)),
+        ('resized to 50%', lambda: reopen(photo.resize((width // 2, height // 2), Image.LANCZOS), 'JPEG', quality=85)),
+        ('resized to 20%', lambda: reopen(photo.resize((width // 5, height // 5), Image.LANCZOS), 'JPEG', quality=85)),
+        ('PNG export', lambda: reopen(photo, 'PNG')),
+        ('cropped 5% each side', lambda: reopen(photo.crop((width // 20, height // 20, width - width // 20, height - height // 20)), 'JPEG', quality=85)),
+        ('rotated 90 degrees', lambda: reopen(photo.rotate(90, expand=True), 'JPEG', quality=85)),
+        ('unrelated photo', lambda: reopen(synthetic_photo(rng), 'JPEG', quality=90))
+    ]
+    print(f"dHash distance from the original (near-duplicate at <= {MAX_DISTANCE})")
+    for label, make in versions:
+        distance = hamming(original, dhash(make()))
+        print(f"  {label:<24}{distance:>4}{'  near-duplicate' if distance <= MAX_DISTANCE else ''}")
+    print()
+
+def measure(search, queries, radius):
+    times = []
+    compared = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        matches, count = search(query, radius)
+        times.append((time.perf_counter() - start) * 1000)
+        compared.append(count)
+        found.append(set(matches))
+    return times, compared, found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--hashes', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--linear-queries', type=int, default=20, help='queries also run through the linear scan')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hash_robustness(rng)
+
+    hashes = [rng.getrandbits(64) for _ in range(args.hashes)]
+
+    # Half the queries are indexed hashes with a few bits flipped, half unrelated
+    queries = []
+    for i in range(args.queries):
+        if i % 2:
+            queries.append(rng.getrandbits(64))
+        else:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, MAX_DISTANCE)):
+                value ^= 1 << bit
+            queries.append(value)
+
+    print(f"{args.hashes} hashes, {args.queries} queries, radius {MAX_DISTANCE}")
+    print(f"  {'index':<14}{'build s':>9}{'mean ms':>10}{'p99 ms':>10}{'compared':>12}{'recall':>9}")
+
+    chunk_index = ChunkIndex()
+    bk_tree = BKTree()
+    indexes = [('chunk buckets', chunk_index), ('BK-tree', bk_tree)]
+    builds = {}
+    for label, index in indexes:
+        start = time.perf_counter()
+        for value in hashes:
+            index.add(value)
+        builds[label] = time.perf_counter() - start
+
+    linear_queries = queries[:args.linear_queries]
+    _, linear_compared, expected = measure(lambda value, radius: linear_search(hashes, value, radius), linear_queries, MAX_DISTANCE)
+    linear_times = measure(lambda value, radius: linear_search(hashes, value, radius), linear_queries, MAX_DISTANCE)[0]
+
+    for label, index in indexes:
+        times, compared, found = measure(index.search, queries, MAX_DISTANCE)
+        hits = sum(len(found[i] & expected[i]) for i in range(len(expected)))
+        total = sum(len(matches) for matches in expected)
+        recall = hits / total if total else 1.0
+        times.sort()
+        print(f"  {label:<14}{builds[label]:>9.1f}{statistics.mean(times):>10.3f}{times[int(len(times) * 0.99) - 1]:>10.3f}"
+              f"{statistics.mean(compared):>12.0f}{recall:>9.0%}")
+
+    linear_times.sort()
+    print(f"  {'linear scan':<14}{0:>9.1f}{statistics.mean(linear_times):>10.3f}{linear_times[-1]:>10.3f}"
+          f"{statistics.mean(linear_compared):>12.0f}{1:>9.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Payload size of the verbose and compact (columnar) detector result shapes.
+
+For each synthetic payload, reports the JSON size of the labels, faces and
+text results in both shapes, against the 256 KB Step Functions payload limit
+for a single state, plus encode and decode times.
+
+Usage: python backend/benchmarks/bench_result_encoding.py
+"""
+import json
+import time
+
+from synthetic import PAYLOADS, add_function_path, make_results
+
+add_function_path()
+
+import result_codec
+
+STEP_FUNCTIONS_LIMIT = 256 * 1024
+
+def json_size(value):
+    return len(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best
+
+def main():
+    print(f"{'payload':<16}{'result':<8}{'verbose':>12}{'compact':>12}{'ratio':>8}{'encode':>11}{'decode':>11}")
+    for name, params in PAYLOADS:
+        results = make_results(**params)
+
+        for detector in ('labels', 'faces', 'text'):
+            verbose = results[detector]
+            compact, encode_time = timed(lambda: result_codec.encode_result(detector, verbose, 'compact'))
+            _, decode_time = timed(lambda: result_codec.decode_result(detector, compact))
+
+            verbose_size = json_size(verbose)
+            compact_size = json_size(compact)
+            flag = ' (verbose over 256 KB)' if verbose_size > STEP_FUNCTIONS_LIMIT else ''
+            if compact_size > STEP_FUNCTIONS_LIMIT:
+                flag = ' (both over 256 KB)'
+            print(f"{name:<16}{detector:<8}{verbose_size / 1024:>9.1f} KB{compact_size / 1024:>9.1f} KB"
+                  f"{verbose_size / max(compact_size, 1):>7.1f}x{encode_time * 1000:>8.2f} ms{decode_time * 1000:>8.2f} ms{flag}")
+
+if __name__ == '__main__':
+    main()
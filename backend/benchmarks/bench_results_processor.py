@@ -0,0 +1,102 @@
+"""
+CPU time and peak memory of the Results Processor's per-image work.
+
+For each synthetic payload, in both the verbose and the compact result
+encodings, measures:
+
+  summary    generate_summary over fully decoded results and over
+             result_codec.summary_view, which decodes only what it reads
+  to-dynamo  float -> Decimal conversion before the DynamoDB write, with the
+             original full-rebuild converter and decimal_json.floats_to_decimals
+  to-json    serialization of the stored (Decimal) results for the API, with
+             the original DecimalEncoder class and decimal_json.dumps
+
+Times are the best of several runs; peak memory is what tracemalloc sees
+allocated during one run.
+
+Usage: python backend/benchmarks/bench_results_processor.py
+"""
+import decimal
+import json
+import os
+import time
+import tracemalloc
+
+from synthetic import PAYLOADS, add_function_path, make_results
+
+add_function_path('results_processor')
+
+# results_processor creates boto3 clients at import time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import decimal_json
+import result_codec
+from results_processor import generate_summary
+
+def legacy_convert_floats_to_decimals(obj):
+    """
+    The converter results_processor used before decimal_json
+    """
+    if isinstance(obj, float):
+        return decimal.Decimal(str(obj))
+    elif isinstance(obj, dict):
+        return {k: legacy_convert_floats_to_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_convert_floats_to_decimals(i) for i in obj]
+    return obj
+
+class LegacyDecimalEncoder(json.JSONEncoder):
+    """
+    The encoder image_handler used before decimal_json
+    """
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        return super(LegacyDecimalEncoder, self).default(obj)
+
+def measure(func, repeat=5):
+    """
+    Return (best time in seconds, peak traced bytes)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak
+
+def report(payload, encoding, step, implementation, func):
+    elapsed, peak = measure(func)
+    print(f"{payload:<16}{encoding:<9}{step:<11}{implementation:<9}{elapsed * 1000:>10.2f} ms{peak / 1024:>11.1f} KB")
+
+def main():
+    print(f"{'payload':<16}{'encoding':<9}{'step':<11}{'impl':<9}{'time':>13}{'peak':>14}")
+    for name, params in PAYLOADS:
+        verbose = make_results(**params)
+
+        for encoding in ('json', 'compact'):
+            results = {key: result_codec.encode_result(key, value, encoding) for key, value in verbose.items()}
+            results['summary'] = generate_summary(result_codec.decode_results(results))
+            assert generate_summary(result_codec.summary_view(results)) == results['summary']
+            stored = legacy_convert_floats_to_decimals(results)
+
+            # Both pairs must produce the same values
+            assert decimal_json.floats_to_decimals(results) == stored
+            assert decimal_json.dumps(stored) == json.dumps(stored, cls=LegacyDecimalEncoder)
+
+            report(name, encoding, 'summary', 'legacy', lambda: generate_summary(result_codec.decode_results(results)))
+            report(name, encoding, 'summary', 'new', lambda: generate_summary(result_codec.summary_view(results)))
+            report(name, encoding, 'to-dynamo', 'legacy', lambda: legacy_convert_floats_to_decimals(results))
+            report(name, encoding, 'to-dynamo', 'new', lambda: decimal_json.floats_to_decimals(results))
+            report(name, encoding, 'to-json', 'legacy', lambda: json.dumps(stored, cls=LegacyDecimalEncoder))
+            report(name, encoding, 'to-json', 'new', lambda: decimal_json.dumps(stored))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Size and latency comparison of the inline and compressed results layouts.
+
+For each synthetic payload, reports the approximate DynamoDB item size of
+both layouts (items are capped at 400 KB), the time to pack results for a
+write and the time to reassemble them on read. Compressed blobs above the
+inline threshold are spilled to an in-memory S3 stand-in, so their item
+holds only the summary and an object key. Timings are CPU only and leave
+out DynamoDB and S3 transfer.
+
+Usage: python backend/benchmarks/bench_results_storage.py
+"""
+import decimal
+import io
+import time
+
+from synthetic import PAYLOADS, add_function_path, make_results
+
+add_function_path()
+
+import result_storage
+from decimal_json import floats_to_decimals as to_dynamo
+
+def attribute_size(value):
+    """
+    Approximate DynamoDB storage size of an attribute value
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return len(str(value).replace('-', '').replace('.', '').lstrip('0')) // 2 + 2
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode('utf-8')) + attribute_size(v) + 1 for k, v in value.items())
+    if isinstance(value, list):
+        return 3 + sum(attribute_size(v) + 1 for v in value)
+    return 0
+
+class MemoryS3:
+    """
+    Just enough of the S3 client for result_storage
+    """
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best
+
+def main():
+    s3 = MemoryS3()
+    print(f"{'payload':<16}{'layout':<12}{'item size':>12}{'write':>12}{'read':>12}")
+    for name, params in PAYLOADS:
+        results = make_results(**params)
+        results['summary'] = {'topLabels': [], 'isSafe': True, 'faceCount': params.get('face_count', 0)}
+
+        for mode in ('inline', 'compressed'):
+            attributes, write_time = timed(lambda: result_storage.pack_results(results, 'user', 'image', to_dynamo, s3, 'bucket', mode=mode))
+            _, read_time = timed(lambda: result_storage.unpack_results(attributes, s3, 'bucket'))
+            size = sum(len(k) + attribute_size(v) for k, v in attributes.items())
+            flag = ' (over 400 KB)' if size > 400 * 1024 else ''
+            if 'resultsObject' in attributes:
+                flag = f" (spilled {len(s3.objects[attributes['resultsObject']]) / 1024:.1f} KB to S3)"
+            print(f"{name:<16}{mode:<12}{size / 1024:>9.1f} KB{write_time * 1000:>9.2f} ms{read_time * 1000:>9.2f} ms{flag}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Search through the inverted index against filtering every result client-side.
+
+Seeds one user with N images whose results are replayed from the recorded
+Rekognition fixtures, indexes them with search_indexer, then runs a few
+queries both ways:
+- through image_handler.search_images;
+- the pre-index way: list every image, fetch every results map and filter.
+
+Reports DynamoDB calls, kilobytes read and time per query, and checks that both
+ways find the same images.
+
+Usage: python backend/benchmarks/bench_search.py [--images 2000]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'emulator'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'functions', 'image_handler'))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'functions', 'search_indexer'))
+
+os.environ.update({
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'IMAGE_BUCKET': 'bench-images',
+    'RESULTS_TABLE': 'bench-results',
+    'SEARCH_INDEX_TABLE': 'bench-search-index'
+})
+
+import boto3
+from aws_stubs import DynamoDBStub, S3Stub, TableStub, item_size
+from decimal_json import floats_to_decimals
+from rekognition_analysis import ANALYSES
+from rekognition_replay import ReplayRekognition
+
+USER_ID = 'bench-user'
+
+QUERIES = [
+    {'q': 'person'},
+    {'q': 'car,road', 'op': 'and'},
+    {'q': 'book,newspaper', 'op': 'or', 'minConfidence': '90'},
+    {'q': 'open', 'field': 'text'}
+]
+
+class CountingTable(TableStub):
+    """
+    Table stub counting read calls and the bytes of the items they return
+    """
+    calls = 0
+    bytes_read = 0
+
+    def get_item(self, **kwargs):
+        response = super().get_item(**kwargs)
+        CountingTable.calls += 1
+        CountingTable.bytes_read += item_size(response.get('Item', {}))
+        return response
+
+    def query(self, **kwargs):
+        response = super().query(**kwargs)
+        CountingTable.calls += 1
+        CountingTable.bytes_read += sum(item_size(item) for item in response['Items'])
+        return response
+
+class CountingDynamoDB(DynamoDBStub):
+    """
+    Counts a batch_get_item as one call
+    """
+    def batch_get_item(self, **kwargs):
+        calls = CountingTable.calls
+        response = super().batch_get_item(**kwargs)
+        CountingTable.calls = calls + 1
+        return response
+
+def fixture_results():
+    """
+    Results tree per recorded fixture image
+    """
+    rekognition = ReplayRekognition(latency_scale=0)
+    images = sorted({name for fixture in rekognition.fixtures.values() for name in fixture['responses']})
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [{name: analyze(rekognition, 'fixtures', f"{image}.jpg") for name, analyze in ANALYSES} for image in images]
+
+def filter_client_side(image_handler, query):
+    """
+    Every image and results map of the user, filtered like search_images
+    """
+    import search_index
+    terms = [search_index.normalize_term(term) for term in query['q'].split(',')]
+    min_confidence = float(query.get('minConfidence', 0))
+    found = set()
+    token = None
+    while True:
+        listing = json.loads(image_handler.list_images(USER_ID, {'limit': 100, 'nextToken': token})['body'])
+        for image in listing['images']:
+            results = json.loads(image_handler.get_image_results(USER_ID, image['imageId'])['body'])['results']
+            terms_found = {
+                term for term, (confidence, sources) in search_index.extract_terms(results).items()
+                if confidence >= min_confidence and (not query.get('field') or query['field'] in sources)
+            }
+            matched = [term in terms_found for term in terms]
+            if all(matched) if query.get('op', 'and') == 'and' else any(matched):
+                found.add(image['imageId'])
+        token = listing['nextToken']
+        if not token:
+            return found
+
+def search(image_handler, query):
+    found = set()
+    token = None
+    while True:
+        page = json.loads(image_handler.search_images(USER_ID, {**query, 'limit': 100, 'nextToken': token})['body'])
+        found.update(image['imageId'] for image in page['images'])
+        token = page['nextToken']
+        if not token:
+            return found
+
+def measure(call):
+    CountingTable.calls = CountingTable.bytes_read = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        found = call()
+    return found, CountingTable.calls, CountingTable.bytes_read / 1024, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    dynamodb = CountingDynamoDB()
+    dynamodb.tables[os.environ['RESULTS_TABLE']] = CountingTable(
+        os.environ['RESULTS_TABLE'], 'userId', 'imageId', {'userId-createdAt-index': ('userId', 'createdAt')})
+    dynamodb.tables[os.environ['SEARCH_INDEX_TABLE']] = CountingTable(os.environ['SEARCH_INDEX_TABLE'], 'userTerm', 'imageId')
+    s3 = S3Stub()
+    boto3.client = lambda service_name, *a, **k: s3
+    boto3.resource = lambda service_name, *a, **k: dynamodb
+
+    import image_handler
+    import search_indexer
+
+    rng = random.Random(args.seed)
+    samples = fixture_results()
+    results_table = dynamodb.tables[os.environ['RESULTS_TABLE']]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(args.images):
+            item = {
+                'userId': USER_ID,
+                'imageId': f"image-{i:06d}",
+                'imageKey': f"{USER_ID}/image-{i:06d}.jpg",
+                'fileName': f"photo-{i}.jpg",
+                'createdAt': 1700000000 + i,
+                'status': 'completed',
+                'results': floats_to_decimals(rng.choice(samples))
+            }
+            results_table.put_item(Item=item)
+            search_indexer.index_image(USER_ID, item['imageId'], item)
+    index_items = len(dynamodb.tables[os.environ['SEARCH_INDEX_TABLE']].items)
+    print(f"{args.images} images from {len(samples)} fixture images indexed in {time.perf_counter() - start:.1f}s "
+          f"({index_items} index items)\n")
+
+    print(f"{'':<52}{'-- search index --':>29}{'-- list and filter --':>29}")
+    print(f"{'query':<44}{'matches':>8}{'calls':>9}{'KB read':>11}{'ms':>9}{'calls':>9}{'KB read':>11}{'ms':>9}")
+    for query in QUERIES:
+        found, calls, kb, ms = measure(lambda: search(image_handler, query))
+        expected, scan_calls, scan_kb, scan_ms = measure(lambda: filter_client_side(image_handler, query))
+        label = ' '.join(f"{key}={value}" for key, value in query.items())
+        check = '' if found == expected else '  MISMATCH'
+        print(f"{label:<44}{len(found):>8}{calls:>9}{kb:>11.0f}{ms:>9.0f}{scan_calls:>9}{scan_kb:>11.0f}{scan_ms:>9.0f}{check}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Cost of authenticating a request in image_handler, cold versus warm.
+
+Runs token_verifier against a local JWKS stand-in (jwks_stub.LocalJwks) and
+reports per-request latency for:
+
+  unverified   the old get_user_id: base64-decode the payload, no checks
+  cold         empty caches: JWKS fetch over localhost, key parsing, RS256
+               signature and claims checks (a fresh container)
+  new token    JWKS cached, token not seen yet: signature and claims only
+  warm         token already verified: hash plus LRU lookup
+
+It also checks that tampered, expired and foreign-audience tokens are
+rejected. A real Cognito JWKS fetch adds a network round trip to 'cold'.
+
+Usage: python backend/benchmarks/bench_token_verification.py
+"""
+import base64
+import json
+import os
+import statistics
+import time
+
+from synthetic import add_function_path
+from jwks_stub import LocalJwks
+
+ITERATIONS = 200
+COLD_ITERATIONS = 20
+
+def legacy_user_id(token):
+    """
+    What get_user_id did before tokens were verified
+    """
+    payload_b64 = token.split('.')[1]
+    payload_b64 += '=' * ((4 - len(payload_b64) % 4) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload_b64).decode('utf-8')).get('sub')
+
+def measure(func, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def report(name, func, iterations=ITERATIONS):
+    median, p99 = measure(func, iterations)
+    print(f"{name:<14}{median * 1e6:>12.1f} us{p99 * 1e6:>12.1f} us")
+
+def main():
+    with LocalJwks() as jwks:
+        os.environ.update({
+            'USER_POOL_ID': 'us-east-1_bench',
+            'CLIENT_ID': 'bench-client',
+            'AWS_REGION': 'us-east-1',
+            'JWKS_URL': jwks.url
+        })
+        add_function_path('image_handler')
+        import token_verifier
+
+        issue = lambda sub, **claims: jwks.issue_token(sub, token_verifier.ISSUER, token_verifier.CLIENT_ID, **claims)
+        token = issue('user-0')
+        fresh_tokens = [issue(f"user-{i}") for i in range(ITERATIONS)]
+
+        # Sanity checks before timing anything
+        assert token_verifier.verify_token(token)['sub'] == 'user-0'
+        header, payload, signature = token.split('.')
+        forged = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        forged['sub'] = 'someone-else'
+        forged_payload = base64.urlsafe_b64encode(json.dumps(forged).encode('utf-8')).rstrip(b'=').decode('ascii')
+        assert token_verifier.verify_token(f"{header}.{forged_payload}.{signature}") is None
+        assert token_verifier.verify_token(issue('user-x', expires_in=-60)) is None
+        assert token_verifier.verify_token(issue('user-x', aud='other-client')) is None
+
+        print(f"{'path':<14}{'median':>15}{'p99':>15}")
+
+        report('unverified', lambda i: legacy_user_id(token))
+
+        def cold(i):
+            token_verifier.clear_caches()
+            token_verifier.verify_token(token)
+        fetches = jwks.requests
+        report('cold', cold, COLD_ITERATIONS)
+        print(f"{'':<14}JWKS fetches: {jwks.requests - fetches} for {COLD_ITERATIONS} cold requests")
+
+        token_verifier.clear_caches()
+        token_verifier.verify_token(token)
+        fetches = jwks.requests
+        report('new token', lambda i: token_verifier.verify_token(fresh_tokens[i]))
+
+        report('warm', lambda i: token_verifier.verify_token(token))
+        print(f"{'':<14}JWKS fetches: {jwks.requests - fetches} for {2 * ITERATIONS} warm requests")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for presigned gallery URLs.
+
+Signs 1k and 10k keys with boto3's generate_presigned_url (when boto3 is
+installed), with the windowed signer on a cold cache, and with the windowed
+signer on a warm cache (a repeated gallery load).
+
+Usage: python backend/benchmarks/bench_url_signing.py
+"""
+import os
+import sys
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', 'image_handler'))
+
+import url_signer
+
+BUCKET = 'image-recognition-app-images-123456789012-dev'
+REGION = 'us-east-1'
+
+Credentials = namedtuple('Credentials', ['access_key', 'secret_key', 'token'])
+CREDENTIALS = Credentials('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY', 'session-token-' + 'x' * 300)
+
+def make_keys(count):
+    return [f"user-{i % 50}/{i:08d}-0000-4000-8000-000000000000.jpg" for i in range(count)]
+
+def bench(label, func, keys):
+    start = time.perf_counter()
+    for key in keys:
+        func(key)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms total  {elapsed / len(keys) * 1e6:8.1f} us/url")
+
+def main():
+    try:
+        import boto3
+        s3 = boto3.client(
+            's3',
+            region_name=REGION,
+            aws_access_key_id=CREDENTIALS.access_key,
+            aws_secret_access_key=CREDENTIALS.secret_key,
+            aws_session_token=CREDENTIALS.token
+        )
+    except ImportError:
+        s3 = None
+
+    now = time.time()
+
+    for count in (1000, 10000):
+        keys = make_keys(count)
+        print(f"{count} keys:")
+
+        if s3:
+            bench('boto3 generate_presigned_url', lambda key: s3.generate_presigned_url(
+                'get_object', Params={'Bucket': BUCKET, 'Key': key}, ExpiresIn=3600), keys)
+
+        url_signer.clear_caches()
+        bench('windowed signer (cold)', lambda key: url_signer.presign_get_object(
+            BUCKET, key, CREDENTIALS, REGION, now), keys)
+        bench('windowed signer (warm)', lambda key: url_signer.presign_get_object(
+            BUCKET, key, CREDENTIALS, REGION, now), keys)
+
+if __name__ == '__main__':
+    main()
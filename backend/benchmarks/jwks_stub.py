@@ -0,0 +1,101 @@
+"""
+Local stand-in for a Cognito user pool's JWKS endpoint.
+
+Generates an RSA key pair, serves its public half as a JWKS over HTTP on
+127.0.0.1 and issues RS256 tokens shaped like Cognito ID tokens, so
+token_verifier can be exercised without AWS. Point JWKS_URL at 'url' before
+importing token_verifier.
+
+    with LocalJwks() as jwks:
+        os.environ['JWKS_URL'] = jwks.url
+        token = jwks.issue_token('user-1', issuer, client_id)
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from jose import jwt
+
+def b64url_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+class LocalJwks:
+    """
+    JWKS endpoint and token issuer backed by one RSA key
+    """
+    def __init__(self, key_bits=2048):
+        public_key, private_key = rsa.newkeys(key_bits)
+        self.kid = uuid.uuid4().hex
+        self.private_pem = private_key.save_pkcs1().decode('ascii')
+        self.jwks = {
+            'keys': [{
+                'kid': self.kid,
+                'kty': 'RSA',
+                'alg': 'RS256',
+                'use': 'sig',
+                'n': b64url_uint(public_key.n),
+                'e': b64url_uint(public_key.e)
+            }]
+        }
+        self.requests = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/.well-known/jwks.json"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                body = json.dumps(stub.jwks).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def issue_token(self, sub, issuer, client_id, expires_in=3600, **claims):
+        """
+        Sign a Cognito-style ID token for 'sub'
+        """
+        now = int(time.time())
+        payload = {
+            'sub': sub,
+            'iss': issuer,
+            'aud': client_id,
+            'token_use': 'id',
+            'auth_time': now,
+            'iat': now,
+            'exp': now + expires_in,
+            'email': f"{sub}@example.com",
+            **claims
+        }
+        return jwt.encode(payload, self.private_pem, algorithm='RS256', headers={'kid': self.kid})
@@ -0,0 +1,99 @@
+"""
+Synthetic analysis results in the shape the detectors produce, used by the
+benchmarks to exercise large face and OCR payloads without Rekognition.
+"""
+import random
+import sys
+import os
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def add_function_path(*functions):
+    """
+    Make function and shared layer modules importable, as in Lambda
+    """
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+    for function in functions:
+        sys.path.insert(0, os.path.join(BACKEND_DIR, 'functions', function))
+
+def box(rng):
+    return {
+        'Width': rng.random(),
+        'Height': rng.random(),
+        'Left': rng.random(),
+        'Top': rng.random()
+    }
+
+def make_face(rng):
+    face = {
+        'confidence': round(rng.uniform(90, 100), 2),
+        'boundingBox': box(rng),
+        'ageRange': {'Low': rng.randint(10, 40), 'High': rng.randint(41, 70)},
+        'gender': {'value': rng.choice(['Male', 'Female']), 'confidence': round(rng.uniform(50, 100), 2)},
+        'emotions': [
+            {'type': emotion, 'confidence': round(rng.uniform(10, 100), 2)}
+            for emotion in rng.sample(['HAPPY', 'CALM', 'SAD', 'SURPRISED', 'CONFUSED', 'ANGRY'], 3)
+        ],
+        'quality': {'brightness': round(rng.uniform(0, 100), 2), 'sharpness': round(rng.uniform(0, 100), 2)},
+        'pose': {'roll': round(rng.uniform(-30, 30), 2), 'yaw': round(rng.uniform(-30, 30), 2), 'pitch': round(rng.uniform(-30, 30), 2)}
+    }
+    for feature in ['smile', 'eyeglasses', 'sunglasses', 'beard', 'mustache', 'eyesopen', 'mouthopen']:
+        face[feature] = {'value': rng.random() > 0.5, 'confidence': round(rng.uniform(50, 100), 2)}
+    return face
+
+def make_text(rng, word_count):
+    vocabulary = ['SALE', 'OPEN', 'EXIT', 'Main', 'Street', 'Coffee', 'Total', '42', 'Receipt', 'Thank', 'You']
+    words = [
+        {'detectedText': rng.choice(vocabulary), 'confidence': round(rng.uniform(80, 100), 2), 'boundingBox': box(rng)}
+        for _ in range(word_count)
+    ]
+    lines = [
+        {'detectedText': ' '.join(word['detectedText'] for word in words[i:i + 6]), 'confidence': round(rng.uniform(80, 100), 2), 'boundingBox': box(rng)}
+        for i in range(0, word_count, 6)
+    ]
+    return {
+        'timestamp': 1700000000,
+        'hasText': bool(lines),
+        'combinedText': ' '.join(line['detectedText'] for line in lines),
+        'lines': lines,
+        'words': words
+    }
+
+def make_results(face_count=1, word_count=0, label_count=20, seed=42):
+    """
+    Build a results dict as results_processor assembles it (without summary)
+    """
+    rng = random.Random(seed)
+    names = ['Person', 'Human', 'Dog', 'Animal', 'Outdoors', 'Nature', 'Car', 'Building', 'Text', 'Tree']
+    labels = []
+    for i in range(label_count):
+        label = {
+            'name': f"{rng.choice(names)}{i}",
+            'confidence': round(rng.uniform(70, 100), 2),
+            'parents': rng.sample(names, 2)
+        }
+        instances = [
+            {'confidence': round(rng.uniform(70, 100), 2), 'boundingBox': {k.lower(): v for k, v in box(rng).items()}}
+            for _ in range(rng.randint(0, 3))
+        ]
+        if instances:
+            label['instances'] = instances
+        labels.append(label)
+    faces = [make_face(rng) for _ in range(face_count)]
+    return {
+        'labels': {'timestamp': 1700000000, 'labels': labels},
+        'moderation': {'timestamp': 1700000000, 'isSafe': True, 'moderationLabels': []},
+        'faces': {'timestamp': 1700000000, 'faceCount': face_count, 'faces': faces},
+        'celebrities': {'timestamp': 1700000000, 'celebrityCount': 0, 'celebrities': [], 'unrecognizedFaces': [
+            {'boundingBox': box(rng), 'confidence': round(rng.uniform(90, 100), 2)} for _ in range(face_count)
+        ]},
+        'text': make_text(rng, word_count)
+    }
+
+# Named payloads shared by the benchmarks
+PAYLOADS = [
+    ('1 face', dict(face_count=1)),
+    ('100 faces', dict(face_count=100)),
+    ('1000 faces', dict(face_count=1000)),
+    ('10k OCR words', dict(face_count=0, word_count=10000))
+]
@@ -0,0 +1,563 @@
+"""
+In-process interpreter for Amazon States Language definitions.
+
+Covers what image_processing.asl.json needs and the common rest of the spec:
+Task, Parallel, Map, Choice, Pass, Wait, Succeed and Fail states; InputPath,
+Parameters/ItemSelector, ResultSelector, ResultPath and OutputPath; Retry and
+Catch; the context object ($$) and the States.Format / StringToJson /
+JsonToString / Array intrinsics. Payloads are passed between states as JSON
+(values that do not serialize fail like they would in a Lambda) and are held
+to the 256 KB Step Functions limit.
+
+Task resources are looked up by the name inside their '${...}' placeholder
+(the DefinitionSubstitutions key in the template), or by FunctionName for
+'arn:aws:states:::lambda:invoke'. Each resource is a callable taking the
+state input and returning its result.
+
+Every state run is recorded in Execution.history with its start and end
+times, so callers can report per-state latency.
+"""
+import copy
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Step Functions rejects state input/output larger than this
+MAX_PAYLOAD_BYTES = 256 * 1024
+
+LAMBDA_INVOKE = 'arn:aws:states:::lambda:invoke'
+
+PATH_TOKEN = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]|\['([^']*)'\]|\[\"([^\"]*)\"\]")
+
+class StatesError(Exception):
+    """
+    A failure with a Step Functions error name (e.g. 'States.Timeout')
+    """
+    def __init__(self, error, cause=''):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+class PathMissing(Exception):
+    pass
+
+def parse_path(path):
+    """
+    Split a reference path ('$.a.b[0]') into keys and indexes
+    """
+    if path == '$':
+        return []
+    if not path.startswith('$'):
+        raise StatesError('States.Runtime', f"Invalid path: {path}")
+
+    tokens = []
+    position = 1
+    while position < len(path):
+        match = PATH_TOKEN.match(path, position)
+        if not match:
+            raise StatesError('States.Runtime', f"Unsupported path: {path}")
+        name, index, quoted, double_quoted = match.groups()
+        tokens.append(int(index) if index is not None else (name or quoted or double_quoted))
+        position = match.end()
+    return tokens
+
+def get_path(data, path):
+    """
+    Resolve a reference path, raising PathMissing if it does not exist
+    """
+    value = data
+    for token in parse_path(path):
+        if isinstance(token, int):
+            if not isinstance(value, list) or token >= len(value):
+                raise PathMissing(path)
+        elif not isinstance(value, dict) or token not in value:
+            raise PathMissing(path)
+        value = value[token]
+    return value
+
+def path_exists(data, path):
+    try:
+        get_path(data, path)
+        return True
+    except PathMissing:
+        return False
+
+def set_path(data, path, value):
+    """
+    Return a copy of 'data' with 'value' placed at 'path' (ResultPath semantics)
+    """
+    tokens = parse_path(path)
+    if not tokens:
+        return value
+
+    root = copy.copy(data) if isinstance(data, dict) else {}
+    target = root
+    for token in tokens[:-1]:
+        child = target.get(token)
+        target[token] = copy.copy(child) if isinstance(child, dict) else {}
+        target = target[token]
+    target[tokens[-1]] = value
+    return root
+
+def select(data, path, context):
+    """
+    Resolve a '$' or '$$' path as used in Parameters and Choice rules
+    """
+    try:
+        if path.startswith('$$'):
+            return get_path(context, path[1:])
+        return get_path(data, path)
+    except PathMissing:
+        raise StatesError('States.Runtime', f"The JSONPath '{path}' could not be found in the input")
+
+def split_arguments(text):
+    """
+    Split intrinsic function arguments on top-level commas
+    """
+    arguments = []
+    depth = 0
+    quoted = False
+    current = ''
+    escaped = False
+    for char in text:
+        if escaped:
+            current += char
+            escaped = False
+            continue
+        if char == '\\':
+            current += char
+            escaped = True
+            continue
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            arguments.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip():
+        arguments.append(current.strip())
+    return arguments
+
+def evaluate_intrinsic(expression, data, context):
+    """
+    Evaluate a States.* intrinsic function call
+    """
+    match = re.match(r"^(States\.\w+)\((.*)\)$", expression.strip(), re.S)
+    if not match:
+        raise StatesError('States.Runtime', f"Invalid intrinsic function: {expression}")
+    name, argument_text = match.groups()
+
+    arguments = []
+    for argument in split_arguments(argument_text):
+        if argument.startswith("'"):
+            arguments.append(re.sub(r"\\(.)", r"\1", argument[1:-1]))
+        elif argument.startswith('$'):
+            arguments.append(select(data, argument, context))
+        elif argument.startswith('States.'):
+            arguments.append(evaluate_intrinsic(argument, data, context))
+        else:
+            arguments.append(json.loads(argument))
+
+    if name == 'States.Format':
+        template, values = arguments[0], iter(arguments[1:])
+        return re.sub(r"(?<!\\)\{\}", lambda _: str(next(values)), template)
+    if name == 'States.StringToJson':
+        return json.loads(arguments[0])
+    if name == 'States.JsonToString':
+        return json.dumps(arguments[0], separators=(',', ':'))
+    if name == 'States.Array':
+        return arguments
+    if name == 'States.ArrayLength':
+        return len(arguments[0])
+    if name == 'States.UUID':
+        return str(uuid.uuid4())
+    raise StatesError('States.Runtime', f"Unsupported intrinsic function: {name}")
+
+def apply_template(template, data, context):
+    """
+    Build a Parameters/ResultSelector/ItemSelector payload
+    """
+    if isinstance(template, dict):
+        result = {}
+        for key, value in template.items():
+            if key.endswith('.$'):
+                if value.startswith('States.'):
+                    result[key[:-2]] = evaluate_intrinsic(value, data, context)
+                else:
+                    result[key[:-2]] = select(data, value, context)
+            else:
+                result[key] = apply_template(value, data, context)
+        return result
+    if isinstance(template, list):
+        return [apply_template(value, data, context) for value in template]
+    return template
+
+def to_json(value, where):
+    """
+    Round-trip a payload through JSON, enforcing the payload size limit
+    """
+    try:
+        text = json.dumps(value)
+    except (TypeError, ValueError) as e:
+        raise StatesError('Runtime.MarshalError', f"{where}: {str(e)}")
+    if len(text.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+        raise StatesError('States.DataLimitExceeded', f"{where} is {len(text)} bytes, over the {MAX_PAYLOAD_BYTES} byte limit")
+    return json.loads(text)
+
+def error_matches(error_equals, error):
+    if 'States.ALL' in error_equals or error in error_equals:
+        return True
+    # Any failure that is not a States.* runtime error counts as a task failure
+    return 'States.TaskFailed' in error_equals and not error.startswith('States.')
+
+def wildcard_match(pattern, value):
+    regex = ''
+    escaped = False
+    for char in pattern:
+        if escaped:
+            regex += re.escape(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '*':
+            regex += '.*'
+        else:
+            regex += re.escape(char)
+    return re.fullmatch(regex, value, re.S) is not None
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+COMPARISONS = {
+    'StringEquals': (lambda v: isinstance(v, str), lambda a, b: a == b),
+    'StringLessThan': (lambda v: isinstance(v, str), lambda a, b: a < b),
+    'StringGreaterThan': (lambda v: isinstance(v, str), lambda a, b: a > b),
+    'StringLessThanEquals': (lambda v: isinstance(v, str), lambda a, b: a <= b),
+    'StringGreaterThanEquals': (lambda v: isinstance(v, str), lambda a, b: a >= b),
+    'StringMatches': (lambda v: isinstance(v, str), lambda a, b: wildcard_match(b, a)),
+    'NumericEquals': (is_number, lambda a, b: a == b),
+    'NumericLessThan': (is_number, lambda a, b: a < b),
+    'NumericGreaterThan': (is_number, lambda a, b: a > b),
+    'NumericLessThanEquals': (is_number, lambda a, b: a <= b),
+    'NumericGreaterThanEquals': (is_number, lambda a, b: a >= b),
+    'BooleanEquals': (lambda v: isinstance(v, bool), lambda a, b: a == b),
+    # ISO-8601 timestamps in the same format compare as strings
+    'TimestampEquals': (lambda v: isinstance(v, str), lambda a, b: a == b),
+    'TimestampLessThan': (lambda v: isinstance(v, str), lambda a, b: a < b),
+    'TimestampGreaterThan': (lambda v: isinstance(v, str), lambda a, b: a > b),
+    'TimestampLessThanEquals': (lambda v: isinstance(v, str), lambda a, b: a <= b),
+    'TimestampGreaterThanEquals': (lambda v: isinstance(v, str), lambda a, b: a >= b)
+}
+
+TYPE_TESTS = {
+    'IsNull': lambda v: v is None,
+    'IsString': lambda v: isinstance(v, str),
+    'IsNumeric': is_number,
+    'IsBoolean': lambda v: isinstance(v, bool),
+    'IsTimestamp': lambda v: isinstance(v, str) and re.match(r"^\d{4}-\d{2}-\d{2}T", v) is not None
+}
+
+def evaluate_rule(rule, data, context):
+    """
+    Evaluate one Choice rule (possibly compound) against the state input
+    """
+    if 'And' in rule:
+        return all(evaluate_rule(r, data, context) for r in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate_rule(r, data, context) for r in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate_rule(rule['Not'], data, context)
+
+    variable = rule['Variable']
+    if 'IsPresent' in rule:
+        source = context if variable.startswith('$$') else data
+        return path_exists(source, variable[1:] if variable.startswith('$$') else variable) == rule['IsPresent']
+
+    value = select(data, variable, context)
+
+    for operator, expected in rule.items():
+        if operator in ('Variable', 'Next'):
+            continue
+        if operator in TYPE_TESTS:
+            return TYPE_TESTS[operator](value) == expected
+        if operator.endswith('Path'):
+            expected = select(data, expected, context)
+            operator = operator[:-4]
+        if operator not in COMPARISONS:
+            raise StatesError('States.Runtime', f"Unsupported Choice operator: {operator}")
+        type_check, compare = COMPARISONS[operator]
+        return type_check(value) and type_check(expected) and compare(value, expected)
+
+    raise StatesError('States.Runtime', f"Choice rule without a comparison: {rule}")
+
+class Execution:
+    """
+    One run of a state machine: context object and recorded state history
+    """
+    def __init__(self, machine, execution_input, name=None):
+        self.machine = machine
+        self.name = name or str(uuid.uuid4())
+        self.input = execution_input
+        self.history = []
+        self.lock = threading.Lock()
+        self.status = 'RUNNING'
+        self.output = None
+        self.error = None
+        self.cause = None
+        self.start_time = time.time()
+        self.end_time = None
+
+    def context(self, state_name, map_item=None):
+        context = {
+            'Execution': {
+                'Id': f"{self.machine.arn}:{self.name}",
+                'Name': self.name,
+                'Input': self.input,
+                'StartTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.start_time))
+            },
+            'StateMachine': {'Id': self.machine.arn, 'Name': self.machine.name},
+            'State': {'Name': state_name, 'EnteredTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        }
+        if map_item is not None:
+            context['Map'] = {'Item': {'Index': map_item[0], 'Value': map_item[1]}}
+        return context
+
+    def record(self, state_name, state_type, start, end, error=None):
+        with self.lock:
+            self.history.append({
+                'state': state_name,
+                'type': state_type,
+                'start': start,
+                'end': end,
+                'error': error
+            })
+
+class StateMachine:
+    """
+    A parsed ASL definition bound to task resources
+    """
+    def __init__(self, definition, resources, name='emulated', time_scale=1.0):
+        self.definition = definition
+        self.resources = resources
+        self.name = name
+        self.arn = f"arn:aws:states:local:000000000000:stateMachine:{name}"
+        # Multiplier for Retry and Wait delays (0 skips them)
+        self.time_scale = time_scale
+
+    @classmethod
+    def from_file(cls, path, resources, **kwargs):
+        with open(path) as definition_file:
+            return cls(json.load(definition_file), resources, **kwargs)
+
+    def execute(self, execution_input, name=None):
+        """
+        Run the machine to completion and return the Execution
+        """
+        execution = Execution(self, execution_input, name)
+        try:
+            data = to_json(execution_input, 'Execution input')
+            execution.output = self.run_states(self.definition, data, execution)
+            execution.status = 'SUCCEEDED'
+        except StatesError as e:
+            execution.status = 'FAILED'
+            execution.error, execution.cause = e.error, e.cause
+        execution.end_time = time.time()
+        return execution
+
+    def run_states(self, machine, data, execution, map_item=None):
+        """
+        Run a (sub-)machine definition from StartAt to an end state
+        """
+        states = machine['States']
+        state_name = machine['StartAt']
+
+        while True:
+            state = states[state_name]
+            start = time.time()
+            try:
+                data, next_state = self.run_state(state_name, state, data, execution, map_item)
+                execution.record(state_name, state['Type'], start, time.time())
+            except StatesError as e:
+                execution.record(state_name, state['Type'], start, time.time(), e.error)
+                raise
+
+            if next_state is None:
+                return data
+            state_name = next_state
+
+    def run_state(self, state_name, state, data, execution, map_item):
+        """
+        Run one state; returns (output, next state name or None at the end)
+        """
+        state_type = state['Type']
+        context = execution.context(state_name, map_item)
+
+        if state_type == 'Succeed':
+            return self.filter_input(state, data), None
+
+        if state_type == 'Fail':
+            raise StatesError(state.get('Error', 'States.Fail'), state.get('Cause', ''))
+
+        if state_type == 'Choice':
+            effective = self.filter_input(state, data)
+            for rule in state.get('Choices', []):
+                if evaluate_rule(rule, effective, context):
+                    return self.filter_output(state, effective), rule['Next']
+            if 'Default' in state:
+                return self.filter_output(state, effective), state['Default']
+            raise StatesError('States.NoChoiceMatched', f"No Choice rule matched in {state_name}")
+
+        if state_type == 'Wait':
+            effective = self.filter_input(state, data)
+            seconds = state.get('Seconds')
+            if 'SecondsPath' in state:
+                seconds = select(effective, state['SecondsPath'], context)
+            time.sleep(max(0, (seconds or 0) * self.time_scale))
+            return self.filter_output(state, effective), self.next_state(state)
+
+        try:
+            effective = self.filter_input(state, data)
+            # For Map, Parameters is the legacy name of ItemSelector
+            if 'Parameters' in state and state_type != 'Map':
+                effective = apply_template(state['Parameters'], effective, context)
+
+            if state_type == 'Pass':
+                result = state['Result'] if 'Result' in state else effective
+            elif state_type == 'Task':
+                result = self.run_with_retry(state, lambda: self.invoke(state, effective))
+            elif state_type == 'Parallel':
+                result = self.run_with_retry(state, lambda: self.run_parallel(state, effective, execution))
+            elif state_type == 'Map':
+                result = self.run_with_retry(state, lambda: self.run_map(state, effective, execution, context))
+            else:
+                raise StatesError('States.Runtime', f"Unsupported state type: {state_type}")
+
+            if 'ResultSelector' in state:
+                result = apply_template(state['ResultSelector'], result, context)
+
+            output = self.apply_result_path(state, data, result)
+            return self.filter_output(state, output), self.next_state(state)
+        except StatesError as e:
+            for catcher in state.get('Catch', []):
+                if error_matches(catcher['ErrorEquals'], e.error):
+                    error_output = {'Error': e.error, 'Cause': e.cause}
+                    output = self.apply_result_path(catcher, data, error_output)
+                    return output, catcher['Next']
+            raise
+
+    def next_state(self, state):
+        return None if state.get('End') else state['Next']
+
+    def filter_input(self, state, data):
+        if 'InputPath' not in state:
+            return data
+        if state['InputPath'] is None:
+            return {}
+        return select(data, state['InputPath'], {})
+
+    def filter_output(self, state, data):
+        if 'OutputPath' not in state:
+            return to_json(data, 'State output')
+        if state['OutputPath'] is None:
+            return {}
+        return to_json(select(data, state['OutputPath'], {}), 'State output')
+
+    def apply_result_path(self, state, data, result):
+        if 'ResultPath' not in state:
+            return result
+        if state['ResultPath'] is None:
+            return data
+        return set_path(data, state['ResultPath'], result)
+
+    def run_with_retry(self, state, func):
+        """
+        Run a Task/Parallel/Map body, applying the state's Retry policy
+        """
+        attempts = {}
+        while True:
+            try:
+                return func()
+            except StatesError as e:
+                retrier = next((r for r in state.get('Retry', []) if error_matches(r['ErrorEquals'], e.error)), None)
+                if retrier is None:
+                    raise
+
+                index = state['Retry'].index(retrier)
+                attempts[index] = attempts.get(index, 0) + 1
+                if attempts[index] > retrier.get('MaxAttempts', 3):
+                    raise
+
+                delay = retrier.get('IntervalSeconds', 1) * retrier.get('BackoffRate', 2.0) ** (attempts[index] - 1)
+                delay = min(delay, retrier.get('MaxDelaySeconds', delay))
+                if retrier.get('JitterStrategy') == 'FULL':
+                    delay *= (uuid.uuid4().int % 1000) / 1000
+                time.sleep(delay * self.time_scale)
+
+    def invoke(self, state, payload):
+        """
+        Call a Task's resource the way Lambda would: JSON in, JSON out
+        """
+        resource = state['Resource']
+        wrap_payload = resource == LAMBDA_INVOKE
+        if wrap_payload:
+            name = payload.get('FunctionName', '')
+            payload = payload.get('Payload', {})
+        else:
+            name = resource
+        name = name[2:-1] if name.startswith('${') and name.endswith('}') else name
+
+        handler = self.resources.get(name)
+        if handler is None:
+            raise StatesError('States.Runtime', f"No emulated resource for {resource}")
+
+        payload = to_json(payload, 'Task input')
+        try:
+            result = handler(payload)
+        except StatesError:
+            raise
+        except Exception as e:
+            raise StatesError(type(e).__name__, str(e))
+        result = to_json(result, 'Task result')
+
+        return {'Payload': result, 'StatusCode': 200} if wrap_payload else result
+
+    def run_parallel(self, state, payload, execution):
+        # A pool per state, so nested Parallel/Map states cannot starve each other
+        with ThreadPoolExecutor(max_workers=len(state['Branches'])) as executor:
+            futures = [
+                executor.submit(self.run_states, branch, payload, execution)
+                for branch in state['Branches']
+            ]
+            # The first branch failure fails the whole state
+            return [future.result() for future in futures]
+
+    def run_map(self, state, payload, execution, context):
+        items = select(payload, state.get('ItemsPath', '$'), context)
+        if not isinstance(items, list):
+            raise StatesError('States.Runtime', "Map ItemsPath did not select an array")
+
+        processor = state.get('ItemProcessor') or state['Iterator']
+        selector = state.get('ItemSelector', state.get('Parameters'))
+        max_concurrency = state.get('MaxConcurrency', 0)
+        if 'MaxConcurrencyPath' in state:
+            max_concurrency = select(payload, state['MaxConcurrencyPath'], context)
+        max_concurrency = max_concurrency or len(items) or 1
+
+        def run_item(index, item):
+            item_input = item
+            if selector is not None:
+                item_context = execution.context(context['State']['Name'], (index, item))
+                item_input = apply_template(selector, payload, item_context)
+            return self.run_states(processor, item_input, execution, (index, item))
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, 40)) as executor:
+            futures = [executor.submit(run_item, index, item) for index, item in enumerate(items)]
+            return [future.result() for future in futures]
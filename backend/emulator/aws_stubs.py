@@ -0,0 +1,892 @@
+"""
+In-memory stand-ins for the S3, DynamoDB, SQS and Step Functions APIs the
+pipeline functions call.
+
+They implement the subset of each API this repo uses, with the behaviours
+that matter for performance work: DynamoDB items get boto3's number and
+binary types and the 400 KB item limit, update and condition expressions
+are evaluated (SET/REMOVE/ADD/DELETE, if_not_exists, list_append,
+attribute_exists, comparisons, AND/OR/NOT...), S3 honours Range reads and
+emits object-created notifications, SQS has visibility timeouts and a
+redrive to a dead-letter list, and Step Functions runs executions
+asynchronously on an ASL interpreter. Errors are botocore ClientErrors with
+the real error codes. Everything is thread-safe.
+"""
+import copy
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+
+# DynamoDB rejects items larger than this
+MAX_ITEM_BYTES = 400 * 1024
+
+def client_error(code, message, operation, status=400):
+    return ClientError({
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': status}
+    }, operation)
+
+class Exceptions:
+    """
+    Client 'exceptions' namespace: ClientError subclasses named by error code
+    """
+    def __init__(self, *codes):
+        for code in codes:
+            setattr(self, code, type(code, (ClientError,), {}))
+
+    def error(self, code, message, operation, status=400):
+        error_class = getattr(self, code, ClientError)
+        return error_class({
+            'Error': {'Code': code, 'Message': message},
+            'ResponseMetadata': {'HTTPStatusCode': status}
+        }, operation)
+
+# S3
+
+class S3Stub:
+    """
+    Buckets of in-memory objects with ETags and created notifications
+    """
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.exceptions = Exceptions('NoSuchKey', 'NoSuchBucket')
+
+    def on_object_created(self, listener):
+        """
+        Call listener(bucket, key, etag, size) after every put/copy
+        """
+        self.listeners.append(listener)
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType='binary/octet-stream', **kwargs):
+        body = Body.read() if hasattr(Body, 'read') else Body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        etag = f"\"{hashlib.md5(body).hexdigest()}\""
+
+        with self.lock:
+            self.objects[(Bucket, Key)] = {
+                'Body': bytes(body),
+                'ContentType': ContentType,
+                'ETag': etag,
+                'LastModified': time.time(),
+                'Metadata': kwargs.get('Metadata', {})
+            }
+
+        for listener in self.listeners:
+            listener(Bucket, Key, etag, len(body))
+        return {'ETag': etag}
+
+    def get_stored(self, bucket, key, operation):
+        with self.lock:
+            stored = self.objects.get((bucket, key))
+        if stored is None:
+            if operation == 'HeadObject':
+                raise client_error('404', 'Not Found', operation, 404)
+            raise self.exceptions.error('NoSuchKey', 'The specified key does not exist.', operation, 404)
+        return stored
+
+    def head_object(self, Bucket, Key, **kwargs):
+        stored = self.get_stored(Bucket, Key, 'HeadObject')
+        return {
+            'ContentLength': len(stored['Body']),
+            'ContentType': stored['ContentType'],
+            'ETag': stored['ETag'],
+            'Metadata': stored['Metadata']
+        }
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        stored = self.get_stored(Bucket, Key, 'GetObject')
+        body = stored['Body']
+
+        if Range:
+            match = re.match(r"bytes=(\d*)-(\d*)$", Range)
+            start, end = match.groups()
+            if start == '':
+                body = body[-int(end):]
+            else:
+                body = body[int(start):(int(end) + 1 if end else None)]
+
+        return {
+            'Body': io.BytesIO(body),
+            'ContentLength': len(body),
+            'ContentType': stored['ContentType'],
+            'ETag': stored['ETag']
+        }
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        stored = self.get_stored(CopySource['Bucket'], CopySource['Key'], 'CopyObject')
+        return self.put_object(Bucket, Key, stored['Body'], stored['ContentType'])
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        for entry in Delete.get('Objects', []):
+            self.delete_object(Bucket, entry['Key'])
+            deleted.append({'Key': entry['Key']})
+        return {'Deleted': deleted, 'Errors': []}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        with self.lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return {
+            'KeyCount': len(keys),
+            'IsTruncated': False,
+            'Contents': [{'Key': key, 'Size': len(self.objects[(Bucket, key)]['Body'])} for key in keys]
+        }
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"http://s3.local/{params.get('Bucket')}/{params.get('Key')}?method={ClientMethod}&expires={ExpiresIn}"
+
+# DynamoDB expressions
+
+TOKEN_PATTERN = re.compile(r"\s*(<>|<=|>=|[=<>(),.+\-\[\]]|#[\w]+|:[\w]+|\d+|[A-Za-z_][\w]*)")
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise ValueError(f"Cannot parse expression at: {expression[position:]}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+class ExpressionParser:
+    """
+    Recursive-descent parser for update, condition and projection expressions
+    """
+    def __init__(self, expression, names=None, values=None):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and (token or '').upper() != expected:
+            raise ValueError(f"Expected {expected}, got {token}")
+        self.position += 1
+        return token
+
+    def path(self):
+        """
+        Parse 'a.b[0]' into ['a', 'b', 0]
+        """
+        parts = [self.name(self.take())]
+        while self.peek() in ('.', '['):
+            if self.take() == '.':
+                parts.append(self.name(self.take()))
+            else:
+                parts.append(int(self.take()))
+                self.take(']')
+        return parts
+
+    def name(self, token):
+        if token.startswith('#'):
+            if token not in self.names:
+                raise ValueError(f"Undefined expression attribute name {token}")
+            return self.names[token]
+        return token
+
+    def operand(self):
+        """
+        A value: ':value', a path, or a function call
+        """
+        token = self.peek()
+        if token.startswith(':'):
+            self.take()
+            if token not in self.values:
+                raise ValueError(f"Undefined expression attribute value {token}")
+            return ('value', self.values[token])
+        if self.position + 1 < len(self.tokens) and self.tokens[self.position + 1] == '(':
+            function = self.take()
+            self.take('(')
+            arguments = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                arguments.append(self.operand())
+            self.take(')')
+            return ('call', function, arguments)
+        return ('path', self.path())
+
+    def update_actions(self):
+        actions = []
+        while self.peek() is not None:
+            clause = self.take().upper()
+            while True:
+                if clause == 'SET':
+                    path = self.path()
+                    self.take('=')
+                    value = self.operand()
+                    if self.peek() in ('+', '-'):
+                        operator = self.take()
+                        value = ('arith', operator, value, self.operand())
+                    actions.append(('SET', path, value))
+                elif clause == 'REMOVE':
+                    actions.append(('REMOVE', self.path(), None))
+                elif clause in ('ADD', 'DELETE'):
+                    actions.append((clause, self.path(), self.operand()))
+                else:
+                    raise ValueError(f"Unknown update clause {clause}")
+
+                if self.peek() != ',':
+                    break
+                self.take()
+        return actions
+
+    def condition(self):
+        left = self.and_condition()
+        while (self.peek() or '').upper() == 'OR':
+            self.take()
+            left = ('or', left, self.and_condition())
+        return left
+
+    def and_condition(self):
+        left = self.not_condition()
+        while (self.peek() or '').upper() == 'AND':
+            self.take()
+            left = ('and', left, self.not_condition())
+        return left
+
+    def not_condition(self):
+        if (self.peek() or '').upper() == 'NOT':
+            self.take()
+            return ('not', self.not_condition())
+        if self.peek() == '(':
+            self.take()
+            inner = self.condition()
+            self.take(')')
+            return inner
+
+        left = self.operand()
+        token = (self.peek() or '').upper()
+        if token in ('=', '<>', '<', '<=', '>', '>='):
+            self.take()
+            return ('compare', token, left, self.operand())
+        if token == 'BETWEEN':
+            self.take()
+            low = self.operand()
+            self.take('AND')
+            return ('between', left, low, self.operand())
+        if token == 'IN':
+            self.take()
+            self.take('(')
+            options = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                options.append(self.operand())
+            self.take(')')
+            return ('in', left, options)
+        # A bare function call (attribute_exists, begins_with, contains...)
+        return ('test', left)
+
+    def projection(self):
+        paths = [self.path()]
+        while self.peek() == ',':
+            self.take()
+            paths.append(self.path())
+        return paths
+
+MISSING = object()
+
+def get_attribute(item, path):
+    value = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(value, list) or part >= len(value):
+                return MISSING
+        elif not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def set_attribute(item, path, value):
+    target = item
+    for part in path[:-1]:
+        target = target[part]
+    if isinstance(path[-1], int) and path[-1] >= len(target):
+        target.append(value)
+    else:
+        target[path[-1]] = value
+
+def remove_attribute(item, path):
+    target = get_attribute(item, path[:-1]) if len(path) > 1 else item
+    if isinstance(target, dict):
+        target.pop(path[-1], None)
+    elif isinstance(target, list) and path[-1] < len(target):
+        del target[path[-1]]
+
+def evaluate_operand(item, operand):
+    kind = operand[0]
+    if kind == 'value':
+        return operand[1]
+    if kind == 'path':
+        return get_attribute(item, operand[1])
+    if kind == 'arith':
+        _, operator, left, right = operand
+        left, right = evaluate_operand(item, left), evaluate_operand(item, right)
+        if left is MISSING or right is MISSING:
+            raise ValueError("An operand in the update expression does not exist")
+        return left + right if operator == '+' else left - right
+
+    _, function, arguments = operand
+    if function == 'if_not_exists':
+        current = evaluate_operand(item, arguments[0])
+        return evaluate_operand(item, arguments[1]) if current is MISSING else current
+    if function == 'list_append':
+        return list(evaluate_operand(item, arguments[0])) + list(evaluate_operand(item, arguments[1]))
+    if function == 'size':
+        value = evaluate_operand(item, arguments[0])
+        return MISSING if value is MISSING else Decimal(len(value))
+    if function == 'attribute_exists':
+        return evaluate_operand(item, arguments[0]) is not MISSING
+    if function == 'attribute_not_exists':
+        return evaluate_operand(item, arguments[0]) is MISSING
+    if function == 'begins_with':
+        value = evaluate_operand(item, arguments[0])
+        return isinstance(value, str) and value.startswith(evaluate_operand(item, arguments[1]))
+    if function == 'contains':
+        value = evaluate_operand(item, arguments[0])
+        return value is not MISSING and evaluate_operand(item, arguments[1]) in value
+    if function == 'attribute_type':
+        value = evaluate_operand(item, arguments[0])
+        return value is not MISSING and dynamo_type(value) == evaluate_operand(item, arguments[1])
+    raise ValueError(f"Unsupported function {function}")
+
+def dynamo_type(value):
+    if isinstance(value, bool):
+        return 'BOOL'
+    if value is None:
+        return 'NULL'
+    if isinstance(value, str):
+        return 'S'
+    if isinstance(value, Decimal):
+        return 'N'
+    if isinstance(value, Binary):
+        return 'B'
+    if isinstance(value, dict):
+        return 'M'
+    if isinstance(value, list):
+        return 'L'
+    if isinstance(value, set):
+        return 'NS' if all(isinstance(v, Decimal) for v in value) else 'SS'
+    return '?'
+
+def evaluate_condition(item, node):
+    kind = node[0]
+    if kind == 'or':
+        return evaluate_condition(item, node[1]) or evaluate_condition(item, node[2])
+    if kind == 'and':
+        return evaluate_condition(item, node[1]) and evaluate_condition(item, node[2])
+    if kind == 'not':
+        return not evaluate_condition(item, node[1])
+    if kind == 'test':
+        return evaluate_operand(item, node[1]) is True
+    if kind == 'in':
+        value = evaluate_operand(item, node[1])
+        return any(value == evaluate_operand(item, option) for option in node[2])
+    if kind == 'between':
+        value, low, high = (evaluate_operand(item, operand) for operand in node[1:])
+        return compare_values('>=', value, low) and compare_values('<=', value, high)
+    _, operator, left, right = node
+    return compare_values(operator, evaluate_operand(item, left), evaluate_operand(item, right))
+
+def compare_values(operator, left, right):
+    if left is MISSING or right is MISSING:
+        return operator == '<>' and not (left is MISSING and right is MISSING)
+    if operator == '=':
+        return left == right
+    if operator == '<>':
+        return left != right
+    if type(left) is not type(right):
+        return False
+    return {
+        '<': left < right,
+        '<=': left <= right,
+        '>': left > right,
+        '>=': left >= right
+    }[operator]
+
+def to_dynamo_value(value):
+    """
+    Store values the way DynamoDB returns them through the boto3 resource
+    """
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, bool) or value is None or isinstance(value, (str, Decimal)):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, (bytes, bytearray)):
+        return Binary(bytes(value))
+    if isinstance(value, Binary):
+        return value
+    if isinstance(value, dict):
+        return {key: to_dynamo_value(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamo_value(v) for v in value]
+    if isinstance(value, set):
+        return {to_dynamo_value(v) for v in value}
+    raise TypeError(f"Unsupported type {type(value)} for value {value!r}")
+
+def item_size(value):
+    """
+    Approximate DynamoDB storage size of a value
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, Decimal):
+        return len(str(value)) // 2 + 2
+    if isinstance(value, dict):
+        return 3 + sum(len(key.encode('utf-8')) + item_size(v) + 1 for key, v in value.items())
+    if isinstance(value, (list, set)):
+        return 3 + sum(item_size(v) + 1 for v in value)
+    return 1
+
+class TableStub:
+    """
+    One table, with its key schema and optional secondary indexes
+    """
+    def __init__(self, name, hash_key, range_key=None, indexes=None):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # index name -> (hash key, range key)
+        self.indexes = indexes or {}
+        self.items = {}
+        self.lock = threading.Lock()
+        self.meta = type('Meta', (), {})()
+        self.meta.client = DynamoDBClientStub()
+
+    def item_key(self, key):
+        try:
+            return (key[self.hash_key], key.get(self.range_key) if self.range_key else None)
+        except KeyError:
+            raise client_error('ValidationException', 'The provided key element does not match the schema', 'GetItem')
+
+    def check_condition(self, item, expression, names, values, operation):
+        if not expression:
+            return
+        node = ExpressionParser(expression, names, to_dynamo_value(values or {})).condition()
+        if not evaluate_condition(item or {}, node):
+            raise self.meta.client.exceptions.error('ConditionalCheckFailedException', 'The conditional request failed', operation)
+
+    def store(self, key, item, operation):
+        if item_size(item) > MAX_ITEM_BYTES:
+            raise client_error('ValidationException', 'Item size has exceeded the maximum allowed size', operation)
+        self.items[key] = item
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        with self.lock:
+            item = self.items.get(self.item_key(Key))
+        if item is None:
+            return {}
+        return {'Item': project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        item = to_dynamo_value(Item)
+        key = self.item_key(item)
+        with self.lock:
+            self.check_condition(self.items.get(key), ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, 'PutItem')
+            self.store(key, item, 'PutItem')
+        return {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        key = self.item_key(Key)
+        with self.lock:
+            self.check_condition(self.items.get(key), ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, 'DeleteItem')
+            old = self.items.pop(key, None)
+        return {'Attributes': copy.deepcopy(old)} if old and kwargs.get('ReturnValues') == 'ALL_OLD' else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, ReturnValues='NONE', **kwargs):
+        key = self.item_key(Key)
+        values = to_dynamo_value(ExpressionAttributeValues or {})
+        actions = ExpressionParser(UpdateExpression, ExpressionAttributeNames, values).update_actions()
+
+        with self.lock:
+            old = self.items.get(key)
+            self.check_condition(old, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, 'UpdateItem')
+
+            item = copy.deepcopy(old) if old else to_dynamo_value(dict(Key))
+            try:
+                for action, path, operand in actions:
+                    if action == 'SET':
+                        set_attribute(item, path, copy.deepcopy(evaluate_operand(item, operand)))
+                    elif action == 'REMOVE':
+                        remove_attribute(item, path)
+                    elif action == 'ADD':
+                        current = get_attribute(item, path)
+                        amount = evaluate_operand(item, operand)
+                        if isinstance(amount, set):
+                            set_attribute(item, path, (set() if current is MISSING else current) | amount)
+                        else:
+                            set_attribute(item, path, (Decimal(0) if current is MISSING else current) + amount)
+                    elif action == 'DELETE':
+                        current = get_attribute(item, path)
+                        if current is not MISSING:
+                            set_attribute(item, path, current - evaluate_operand(item, operand))
+            except (ValueError, TypeError, KeyError) as e:
+                raise client_error('ValidationException', f"Invalid UpdateExpression: {str(e)}", 'UpdateItem')
+
+            self.store(key, item, 'UpdateItem')
+
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': copy.deepcopy(item)}
+        if ReturnValues == 'ALL_OLD':
+            return {'Attributes': copy.deepcopy(old)} if old else {}
+        if ReturnValues == 'UPDATED_NEW':
+            updated = {path[0] for _, path, _ in actions if path[0] in item}
+            return {'Attributes': {name: copy.deepcopy(item[name]) for name in updated}}
+        return {}
+
+    def query(self, KeyConditionExpression, IndexName=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              FilterExpression=None, ProjectionExpression=None, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kwargs):
+        names = dict(ExpressionAttributeNames or {})
+        values = dict(ExpressionAttributeValues or {})
+        if isinstance(KeyConditionExpression, ConditionBase):
+            built = ConditionExpressionBuilder().build_expression(KeyConditionExpression, is_key_condition=True)
+            KeyConditionExpression = built.condition_expression
+            names.update(built.attribute_name_placeholders)
+            values.update(built.attribute_value_placeholders)
+
+        values = to_dynamo_value(values)
+        key_condition = ExpressionParser(KeyConditionExpression, names, values).condition()
+        filter_condition = ExpressionParser(FilterExpression, names, values).condition() if FilterExpression else None
+        hash_key, range_key = self.indexes.get(IndexName, (self.hash_key, self.range_key))
+
+        with self.lock:
+            matches = [item for item in self.items.values() if hash_key in item and evaluate_condition(item, key_condition)]
+        if range_key:
+            matches = [item for item in matches if range_key in item]
+            matches.sort(key=lambda item: (item[range_key], item.get(self.range_key) or ''), reverse=not ScanIndexForward)
+
+        if ExclusiveStartKey:
+            position = next((i for i, item in enumerate(matches) if all(item.get(k) == v for k, v in ExclusiveStartKey.items())), -1)
+            matches = matches[position + 1:]
+
+        page = matches[:Limit] if Limit else matches
+        response = {
+            'Items': [project(item, ProjectionExpression, names) for item in page if not filter_condition or evaluate_condition(item, filter_condition)],
+            'Count': len(page)
+        }
+        if Limit and len(matches) > Limit:
+            last = page[-1]
+            key_names = {self.hash_key, self.range_key, hash_key, range_key} - {None}
+            response['LastEvaluatedKey'] = {name: last[name] for name in key_names}
+        return response
+
+    def scan(self, ProjectionExpression=None, ExpressionAttributeNames=None, Limit=None, ExclusiveStartKey=None, **kwargs):
+        with self.lock:
+            keys = sorted(self.items, key=lambda key: tuple('' if part is None else str(part) for part in key))
+            if ExclusiveStartKey:
+                start = self.item_key(ExclusiveStartKey)
+                keys = keys[keys.index(start) + 1:] if start in keys else keys
+            page = keys[:Limit] if Limit else keys
+            response = {'Items': [project(self.items[key], ProjectionExpression, ExpressionAttributeNames) for key in page]}
+        if Limit and len(keys) > Limit:
+            last = self.items[page[-1]]
+            response['LastEvaluatedKey'] = {name: last[name] for name in (self.hash_key, self.range_key) if name}
+        return response
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriterStub(self)
+
+class BatchWriterStub:
+    """
+    Context manager standing in for Table.batch_writer(); writes immediately
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self.table.delete_item(Key=Key)
+
+def project(item, expression, names):
+    if not expression:
+        return copy.deepcopy(item)
+    projected = {}
+    for path in ExpressionParser(expression, names).projection():
+        value = get_attribute(item, path[:1])
+        if value is not MISSING:
+            projected[path[0]] = copy.deepcopy(value)
+    return projected
+
+class DynamoDBClientStub:
+    """
+    Just the 'exceptions' namespace of table.meta.client
+    """
+    def __init__(self):
+        self.exceptions = Exceptions('ConditionalCheckFailedException', 'ResourceNotFoundException', 'ProvisionedThroughputExceededException')
+
+class DynamoDBStub:
+    """
+    Stand-in for boto3.resource('dynamodb')
+    """
+    def __init__(self):
+        self.tables = {}
+        self.meta = type('Meta', (), {})()
+        self.meta.client = DynamoDBClientStub()
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self.tables[name] = TableStub(name, hash_key, range_key, indexes)
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            found = [table.get_item(Key=key, ProjectionExpression=request.get('ProjectionExpression'),
+                                    ExpressionAttributeNames=request.get('ExpressionAttributeNames')).get('Item')
+                     for key in request['Keys']]
+            responses[name] = [item for item in found if item is not None]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for name, requests in RequestItems.items():
+            table = self.Table(name)
+            for request in requests:
+                if 'PutRequest' in request:
+                    table.put_item(Item=request['PutRequest']['Item'])
+                else:
+                    table.delete_item(Key=request['DeleteRequest']['Key'])
+        return {'UnprocessedItems': {}}
+
+    def Table(self, name):
+        if name not in self.tables:
+            raise client_error('ResourceNotFoundException', f"Requested resource not found: {name}", 'DescribeTable')
+        return self.tables[name]
+
+# SQS
+
+class QueueStub:
+    """
+    A standard queue, received from the way Lambda's SQS event source does:
+    batches of up to 'max_messages' within a batching window, in-flight
+    messages hidden for the visibility timeout, and messages received
+    'max_receive_count' times moved to 'dead_letters' instead of being
+    delivered again
+    """
+    def __init__(self, name='emulator-queue', visibility_timeout=30, max_receive_count=5):
+        self.arn = f"arn:aws:sqs:us-east-1:000000000000:{name}"
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        # messageId -> {'body', 'sentAt', 'receiveCount', 'visibleAt', 'receiptHandle'}
+        self.messages = {}
+        self.dead_letters = []
+        self.condition = threading.Condition()
+        self.dead_letter_listeners = []
+
+    def on_dead_letter(self, listener):
+        """
+        Call listener(message body) when a message moves to the dead letters
+        """
+        self.dead_letter_listeners.append(listener)
+
+    def send_message(self, MessageBody, **kwargs):
+        message_id = str(uuid.uuid4())
+        with self.condition:
+            self.messages[message_id] = {
+                'body': MessageBody,
+                'sentAt': time.time(),
+                'receiveCount': 0,
+                'visibleAt': 0,
+                'receiptHandle': None
+            }
+            self.condition.notify_all()
+        return {'MessageId': message_id}
+
+    def visible(self, now):
+        """
+        Visible message IDs in send order, after redriving exhausted ones
+        (caller holds the lock)
+        """
+        ready = []
+        for message_id, message in list(self.messages.items()):
+            if message['visibleAt'] > now:
+                continue
+            if message['receiveCount'] >= self.max_receive_count:
+                del self.messages[message_id]
+                self.dead_letters.append(message['body'])
+                for listener in self.dead_letter_listeners:
+                    listener(message['body'])
+                continue
+            ready.append(message_id)
+        return ready
+
+    def receive_batch(self, max_messages, batching_window=0.0, poll_seconds=0.05):
+        """
+        Wait for at least one message, then up to 'batching_window' seconds
+        for a full batch; returns Lambda SQS event records
+        """
+        with self.condition:
+            deadline = None
+            while True:
+                now = time.time()
+                ready = self.visible(now)
+                if not ready:
+                    deadline = None
+                elif deadline is None:
+                    deadline = now + batching_window
+                if ready and (len(ready) >= max_messages or now >= deadline):
+                    break
+                self.condition.wait(poll_seconds if deadline is None else max(0.001, min(poll_seconds, deadline - now)))
+
+            records = []
+            for message_id in ready[:max_messages]:
+                message = self.messages[message_id]
+                message['receiveCount'] += 1
+                message['visibleAt'] = now + self.visibility_timeout
+                message['receiptHandle'] = str(uuid.uuid4())
+                records.append({
+                    'messageId': message_id,
+                    'receiptHandle': message['receiptHandle'],
+                    'body': message['body'],
+                    'attributes': {
+                        'ApproximateReceiveCount': str(message['receiveCount']),
+                        'SentTimestamp': str(int(message['sentAt'] * 1000))
+                    },
+                    'eventSource': 'aws:sqs',
+                    'eventSourceARN': self.arn
+                })
+            return records
+
+    def delete_messages(self, records):
+        """
+        Delete received messages (those whose receipt handle is still current)
+        """
+        with self.condition:
+            for record in records:
+                message = self.messages.get(record['messageId'])
+                if message and message['receiptHandle'] == record['receiptHandle']:
+                    del self.messages[record['messageId']]
+
+    def depth(self):
+        with self.condition:
+            return len(self.messages)
+
+# Step Functions
+
+class StepFunctionsStub:
+    """
+    Runs each start_execution on a thread with the ASL interpreter
+    """
+    def __init__(self, max_concurrency=100):
+        self.machines = {}
+        self.executions = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.listeners = []
+        self.inputs = {}
+        # StartExecution API calls (not counting executions started by a Map)
+        self.start_execution_calls = 0
+        self.exceptions = Exceptions('ExecutionAlreadyExists', 'StateMachineDoesNotExist')
+
+    def register(self, machine):
+        self.machines[machine.arn] = machine
+        return machine.arn
+
+    def on_execution_finished(self, listener):
+        """
+        Call listener(execution) when an execution succeeds or fails
+        """
+        self.listeners.append(listener)
+
+    def start_execution(self, stateMachineArn, input='{}', name=None, **kwargs):
+        with self.lock:
+            self.start_execution_calls += 1
+        machine, execution_arn, started = self.reserve(stateMachineArn, input, name)
+        if started:
+            self.executor.submit(self.run, machine, execution_arn, input, execution_arn.rsplit(':', 1)[1])
+        return {'executionArn': execution_arn, 'startDate': time.time()}
+
+    def run_execution(self, stateMachineArn, input='{}', name=None):
+        """
+        Start an execution and run it on the calling thread, as the
+        startExecution.sync integration waits for it; returns the Execution
+        """
+        machine, execution_arn, started = self.reserve(stateMachineArn, input, name)
+        if not started:
+            # Same name and input as a running execution: wait for that one
+            while True:
+                with self.lock:
+                    execution = self.executions[execution_arn]
+                if execution is not None:
+                    return execution
+                time.sleep(0.01)
+        return self.run(machine, execution_arn, input, execution_arn.rsplit(':', 1)[1])
+
+    def reserve(self, state_machine_arn, input, name):
+        """
+        Claim an execution name. Like Step Functions, repeating the name and
+        input of a running execution returns it; any other reuse fails.
+        Returns (machine, execution ARN, whether a new execution must run).
+        """
+        machine = self.machines.get(state_machine_arn)
+        if machine is None:
+            raise self.exceptions.error('StateMachineDoesNotExist', f"State Machine Does Not Exist: '{state_machine_arn}'", 'StartExecution')
+
+        name = name or str(uuid.uuid4())
+        execution_arn = f"{state_machine_arn.replace(':stateMachine:', ':execution:')}:{name}"
+        with self.lock:
+            if execution_arn in self.executions:
+                if self.executions[execution_arn] is None and self.inputs[execution_arn] == input:
+                    return machine, execution_arn, False
+                raise self.exceptions.error('ExecutionAlreadyExists', f"Execution Already Exists: '{execution_arn}'", 'StartExecution')
+            self.executions[execution_arn] = None
+            self.inputs[execution_arn] = input
+        return machine, execution_arn, True
+
+    def run(self, machine, execution_arn, input, name):
+        execution = machine.execute(json.loads(input), name)
+        with self.lock:
+            self.executions[execution_arn] = execution
+        for listener in self.listeners:
+            listener(execution)
+        return execution
+
+    def describe_execution(self, executionArn):
+        with self.lock:
+            execution = self.executions.get(executionArn)
+        if execution is None:
+            return {'executionArn': executionArn, 'status': 'RUNNING'}
+        response = {'executionArn': executionArn, 'status': execution.status}
+        if execution.status == 'SUCCEEDED':
+            response['output'] = json.dumps(execution.output)
+        else:
+            response.update({'error': execution.error, 'cause': execution.cause})
+        return response
@@ -0,0 +1,227 @@
+"""
+Load generator for the local pipeline emulator.
+
+Drives N uploads through the emulated pipeline with a fixed number in
+flight, then reports throughput, outcomes, Rekognition throttling and
+p50/p95/p99 latency per stage: S3 notification delay, workflow_trigger,
+each state of the state machine, and end to end (upload to execution end).
+With --metrics it also aggregates the handlers' EMF metric records per
+function (cold starts, Rekognition/DynamoDB/S3 time, payload sizes).
+With --ingest sqs the uploads go through the ingest queue and the batch
+state machine; the report then adds the trigger's batches and the
+StartExecution calls it made.
+
+All handlers share one Python process, so CPU-bound stages (normalization,
+results processing) contend for the GIL under concurrency and read as upper
+bounds; in AWS each invocation has its own CPU. Rekognition time is
+simulated sleep and overlaps freely.
+
+Usage:
+  python backend/emulator/loadgen.py --uploads 200 --concurrency 20
+  python backend/emulator/loadgen.py --mode fused --fixture crowd --tps 50
+  python backend/emulator/loadgen.py --ingest sqs --batch-size 10 --uploads 500 --concurrency 100
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from pipeline import Pipeline
+from rekognition_replay import ReplayRekognition
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--uploads', type=int, default=100, help='number of images to upload')
+    parser.add_argument('--concurrency', type=int, default=10, help='uploads in flight at once')
+    parser.add_argument('--mode', choices=['fanout', 'fused', 'cascade'], default='fanout', help='ANALYZER_MODE')
+    parser.add_argument('--encoding', choices=['json', 'compact'], default='json', help='RESULT_ENCODING')
+    parser.add_argument('--storage', choices=['inline', 'compressed'], default='inline', help='RESULTS_STORAGE_MODE')
+    parser.add_argument('--profile', default='full', help='analysis profile requested for every upload (full, basic, people, document)')
+    parser.add_argument('--fixture', default='street', help='recorded Rekognition responses to replay (street, crowd, document)')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for simulated Rekognition latency')
+    parser.add_argument('--tps', type=float, default=None, help='per-operation Rekognition TPS quota')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='enable the detectors\' shared Rekognition limiter at this per-operation TPS')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of Rekognition calls throttled at random')
+    parser.add_argument('--image-size', default='2400x1600', help='WIDTHxHEIGHT of the uploaded JPEGs')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='fraction of uploads repeating earlier bytes')
+    parser.add_argument('--near-duplicates', type=float, default=0.0,
+                        help='fraction of uploads repeating an earlier picture with different bytes')
+    parser.add_argument('--invalid', type=float, default=0.0,
+                        help='fraction of uploads that are empty, truncated or not images at all')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ingest', choices=['s3', 'sqs'], default='s3',
+                        help='S3 notifications invoke the trigger directly (s3) or through the ingest queue (sqs)')
+    parser.add_argument('--batch-size', type=int, default=10, help='queue messages per trigger invocation (sqs)')
+    parser.add_argument('--batching-window', type=float, default=0.5, help='seconds to gather a batch (sqs)')
+    parser.add_argument('--ingest-concurrency', type=int, default=5, help='concurrent trigger invocations (sqs)')
+    parser.add_argument('--batch-concurrency', type=int, default=10, help='images of a batch analyzed at once (sqs)')
+    parser.add_argument('--metrics', action='store_true', help='report the handlers\' EMF metrics per function')
+    parser.add_argument('--verbose', action='store_true', help='show handler logs')
+    return parser.parse_args()
+
+def make_image(width, height, rng):
+    """
+    A JPEG with some structure, so it compresses like a photo rather than noise
+    """
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        block = Image.new('RGB', (rng.randrange(20, width // 4), rng.randrange(20, height // 4)), tuple(rng.randrange(256) for _ in range(3)))
+        image.paste(block, (x, y))
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+def make_invalid(image, rng):
+    """
+    An upload validation should turn away: empty, cut off inside its
+    headers, or an error page saved with a .jpg name
+    """
+    return rng.choice([
+        b'',
+        image[:100],
+        b'<!DOCTYPE html><html><body><h1>502 Bad Gateway</h1></body></html>'
+    ])
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def stage_samples(pipeline, uploads):
+    """
+    stage name -> durations in seconds, in pipeline order
+    """
+    stages = {}
+
+    def add(stage, value):
+        stages.setdefault(stage, []).append(value)
+
+    for upload in uploads:
+        if upload.trigger_start:
+            add('s3 notification', upload.trigger_start - upload.uploaded_at)
+            add('workflow_trigger', upload.trigger_end - upload.trigger_start)
+        if upload.execution:
+            for entry in sorted(upload.execution.history, key=lambda entry: entry['start']):
+                add(f"  {entry['state']}", entry['end'] - entry['start'])
+        if upload.finished_at:
+            add('end to end', upload.finished_at - upload.uploaded_at)
+    return stages
+
+def report(pipeline, uploads, wall_time, out):
+    outcomes = {}
+    for upload in uploads:
+        outcome = pipeline.outcome(upload)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    print(f"\n{len(uploads)} uploads in {wall_time:.2f}s: {len(uploads) / wall_time:.2f} images/s", file=out)
+    print('Outcomes: ' + ', '.join(f"{name} {count}" for name, count in sorted(outcomes.items())), file=out)
+
+    triggers = pipeline.invocations.get('WorkflowTriggerFunction', [])
+    print(f"Workflow trigger: {len(triggers)} invocations ({len(uploads) / max(1, len(triggers)):.1f} uploads each), "
+          f"{pipeline.step_functions.start_execution_calls} StartExecution calls"
+          + (f", {len(pipeline.queue.dead_letters)} dead-lettered" if pipeline.queue else ''), file=out)
+
+    stats = pipeline.rekognition.stats
+    print('Rekognition: ' + ', '.join(
+        f"{operation} {counts['calls']} calls/{counts['throttled']} throttled/{counts['failed']} failed"
+        for operation, counts in stats.items() if counts['calls']
+    ), file=out)
+
+    print(f"\n{'stage':<32}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+    for stage, samples in stage_samples(pipeline, uploads).items():
+        print(f"{stage:<32}{len(samples):>7}"
+              f"{percentile(samples, 0.50) * 1000:>10.1f}{percentile(samples, 0.95) * 1000:>10.1f}"
+              f"{percentile(samples, 0.99) * 1000:>10.1f}{max(samples) * 1000:>10.1f}", file=out)
+
+def metrics_report(pipeline, out):
+    """
+    Per function and metric: invocations reporting it, total, p50/p95/max
+    """
+    print(f"\n{'function / metric':<32}{'count':>7}{'total':>12}{'p50':>10}{'p95':>10}{'max':>10}  unit", file=out)
+    for function, function_metrics in sorted(pipeline.metric_samples().items()):
+        print(function, file=out)
+        for name, (unit, values) in function_metrics.items():
+            print(f"  {name:<30}{len(values):>7}{sum(values):>12.1f}{percentile(values, 0.50):>10.1f}"
+                  f"{percentile(values, 0.95):>10.1f}{max(values):>10.1f}  {unit}", file=out)
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    width, height = (int(value) for value in args.image_size.lower().split('x'))
+    out = sys.stdout
+
+    rekognition = ReplayRekognition(
+        fixture=args.fixture,
+        latency_scale=args.latency_scale,
+        tps=args.tps,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    env = {
+        'ANALYZER_MODE': args.mode,
+        'RESULT_ENCODING': args.encoding,
+        'RESULTS_STORAGE_MODE': args.storage
+    }
+    if args.rate_limit:
+        env.update({'RATE_LIMIT_TABLE': 'emulator-rate-limits', 'REKOGNITION_TPS': str(args.rate_limit)})
+    if args.ingest == 'sqs':
+        env['BATCH_MAX_CONCURRENCY'] = str(args.batch_concurrency)
+    pipeline = Pipeline(
+        env=env,
+        rekognition=rekognition,
+        ingest=args.ingest,
+        ingest_batch_size=args.batch_size,
+        ingest_max_concurrency=args.ingest_concurrency,
+        batching_window=args.batching_window
+    )
+
+    # A different picture per upload, so neither the analysis cache nor the
+    # near-duplicate detector hits unless --duplicates or --near-duplicates
+    # asks for it. A near-duplicate repeats an earlier picture with extra
+    # bytes after the JPEG end marker (ignored by decoders): new bytes, same
+    # perceptual hash.
+    bodies = []
+    originals = []
+    for index in range(args.uploads):
+        if args.invalid and rng.random() < args.invalid:
+            bodies.append(make_invalid(make_image(width, height, random.Random(f"{args.seed}-{index}")), rng))
+        elif bodies and rng.random() < args.duplicates:
+            bodies.append(rng.choice(bodies))
+        elif originals and args.near_duplicates and rng.random() < args.near_duplicates:
+            bodies.append(rng.choice(originals) + os.urandom(16))
+        else:
+            originals.append(make_image(width, height, random.Random(f"{args.seed}-{index}")))
+            bodies.append(originals[-1])
+
+    def run(body):
+        upload = pipeline.upload(body, analysis_profile=args.profile)
+        upload.done.wait()
+        return upload
+
+    print(f"Uploading {args.uploads} {width}x{height} images, {args.concurrency} in flight "
+          f"(mode={args.mode}, profile={args.profile}, encoding={args.encoding}, storage={args.storage}, "
+          f"fixture={args.fixture}, ingest={args.ingest})", file=out)
+
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            uploads = list(executor.map(run, bodies))
+        wall_time = time.time() - start
+    finally:
+        sys.stdout = out
+
+    report(pipeline, uploads, wall_time, out)
+    if args.metrics:
+        metrics_report(pipeline, out)
+
+if __name__ == '__main__':
+    main()
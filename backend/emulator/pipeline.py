@@ -0,0 +1,389 @@
+"""
+The upload -> workflow_trigger -> state machine -> detectors ->
+results_processor chain, run in-process against local stand-ins.
+
+Pipeline installs the S3, DynamoDB and Step Functions stubs and a Rekognition
+replay stub in place of boto3's client/resource factories, imports the real
+Lambda handlers, and interprets image_processing.asl.json with the handlers
+as its task resources. Uploads put an object into the S3 stub, whose
+object-created notification invokes workflow_trigger asynchronously, as the
+bucket notification does in AWS.
+
+With ingest='sqs' the notifications go to a queue stub instead, polled like
+Lambda's SQS event source: up to 'ingest_max_concurrency' workflow_trigger
+invocations at once, each with up to 'ingest_batch_size' messages gathered
+within 'batching_window' seconds. Messages the trigger reports in
+batchItemFailures become visible again after the visibility timeout, and
+the trigger starts batch_processing.asl.json, whose Map runs the image
+workflow through the startExecution.sync integration.
+
+The handlers' EMF metric records are collected in Pipeline.metric_records
+rather than printed; metric_samples groups them by function and metric.
+
+Handlers read their configuration from the environment at import time, so
+create one Pipeline per process.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+EMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(EMULATOR_DIR, '..')
+ASL_PATH = os.path.join(BACKEND_DIR, 'step_functions', 'image_processing.asl.json')
+BATCH_ASL_PATH = os.path.join(BACKEND_DIR, 'step_functions', 'batch_processing.asl.json')
+
+# Task resource of the batch state machine's Map
+START_EXECUTION_SYNC = 'arn:aws:states:::states:startExecution.sync:2'
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'layers', 'shared', 'python'))
+
+import boto3
+
+import metrics
+from asl import StateMachine, StatesError
+from aws_stubs import DynamoDBStub, QueueStub, S3Stub, StepFunctionsStub
+from rekognition_replay import ReplayRekognition
+
+# State machine resource placeholder -> function directory/module
+TASK_FUNCTIONS = {
+    'ImageValidationFunction': 'image_validation',
+    'ImageNormalizationFunction': 'image_normalization',
+    'DuplicateDetectorFunction': 'duplicate_detector',
+    'FusedAnalyzerFunction': 'fused_analyzer',
+    'DetectLabelsFunction': 'detect_labels',
+    'DetectModerationFunction': 'detect_moderation',
+    'DetectFacesFunction': 'detect_faces',
+    'RecognizeCelebritiesFunction': 'recognize_celebrities',
+    'DetectTextFunction': 'detect_text',
+    'ResultsProcessorFunction': 'results_processor'
+}
+
+DEFAULT_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'IMAGE_BUCKET': 'emulator-images',
+    'RESULTS_TABLE': 'emulator-results',
+    'ANALYSIS_CACHE_TABLE': 'emulator-analysis-cache',
+    'USER_VERSIONS_TABLE': 'emulator-user-versions',
+    'USER_STATS_TABLE': 'emulator-user-stats',
+    'HASH_INDEX_TABLE': 'emulator-hash-index',
+    'ANALYZER_MODE': 'fanout',
+    'RESULTS_STORAGE_MODE': 'inline',
+    'RESULT_ENCODING': 'json'
+}
+
+# Lambda default timeout used for get_remaining_time_in_millis
+LAMBDA_TIMEOUT_SECONDS = 30
+
+class LambdaContext:
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = 128
+        self.deadline = time.time() + LAMBDA_TIMEOUT_SECONDS
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0, self.deadline - time.time()) * 1000)
+
+def message_keys(body):
+    """
+    Object keys of the S3 notification in a queue message body (none for
+    test events and malformed bodies)
+    """
+    try:
+        records = json.loads(body).get('Records', [])
+        return [urllib.parse.unquote_plus(record['s3']['object']['key']) for record in records]
+    except (ValueError, AttributeError, KeyError, TypeError):
+        return []
+
+class Upload:
+    """
+    Timing and outcome of one uploaded image
+    """
+    def __init__(self, user_id, image_id, key):
+        self.user_id = user_id
+        self.image_id = image_id
+        self.key = key
+        self.uploaded_at = None
+        self.trigger_start = None
+        self.trigger_end = None
+        self.trigger_response = None
+        self.execution = None
+        self.finished_at = None
+        self.cached = False
+        self.done = threading.Event()
+
+    def finish(self):
+        self.finished_at = time.time()
+        self.done.set()
+
+class Pipeline:
+    """
+    The image pipeline wired to local stand-ins
+    """
+    def __init__(self, env=None, rekognition=None, time_scale=0.0, lambda_concurrency=1000, ingest='s3',
+                 ingest_batch_size=10, ingest_max_concurrency=5, batching_window=0.5, visibility_timeout=5.0):
+        os.environ.update({**DEFAULT_ENV, **(env or {})})
+        self.bucket = os.environ['IMAGE_BUCKET']
+
+        self.s3 = S3Stub()
+        self.dynamodb = DynamoDBStub()
+        self.results_table = self.dynamodb.create_table(
+            os.environ['RESULTS_TABLE'], 'userId', 'imageId',
+            indexes={'userId-createdAt-index': ('userId', 'createdAt')}
+        )
+        self.dynamodb.create_table(os.environ['ANALYSIS_CACHE_TABLE'], 'cacheKey')
+        self.dynamodb.create_table(os.environ['USER_VERSIONS_TABLE'], 'userId')
+        self.dynamodb.create_table(os.environ['USER_STATS_TABLE'], 'userId')
+        self.dynamodb.create_table(os.environ['HASH_INDEX_TABLE'], 'bucket', 'ref')
+        # The detectors' shared Rekognition limiter is off unless a table is named
+        if os.environ.get('RATE_LIMIT_TABLE'):
+            self.dynamodb.create_table(os.environ['RATE_LIMIT_TABLE'], 'bucketKey')
+        self.step_functions = StepFunctionsStub(max_concurrency=lambda_concurrency)
+        self.rekognition = rekognition or ReplayRekognition()
+
+        self.install_clients()
+
+        self.metric_records = []
+        self.metric_records_lock = threading.Lock()
+        metrics.set_sink(self.record_metrics)
+
+        # function name -> list of (start, end, error name or None)
+        self.invocations = {}
+        self.invocations_lock = threading.Lock()
+        self.uploads = {}
+        self.lambda_executor = ThreadPoolExecutor(max_workers=lambda_concurrency)
+
+        self.workflow_trigger = self.import_function('workflow_trigger')
+        resources = {
+            name: self.task_resource(name, self.import_function(module))
+            for name, module in TASK_FUNCTIONS.items()
+        }
+        self.machine = StateMachine.from_file(ASL_PATH, resources, name='image-processing', time_scale=time_scale)
+        os.environ['STATE_MACHINE_ARN'] = self.step_functions.register(self.machine)
+
+        self.s3.on_object_created(self.on_object_created)
+        self.step_functions.on_execution_finished(self.on_execution_finished)
+
+        self.queue = None
+        self.sequence = 0
+        if ingest == 'sqs':
+            batch_machine = StateMachine.from_file(
+                BATCH_ASL_PATH, {START_EXECUTION_SYNC: self.run_child_execution},
+                name='batch-processing', time_scale=time_scale
+            )
+            os.environ['BATCH_STATE_MACHINE_ARN'] = self.step_functions.register(batch_machine)
+
+            self.queue = QueueStub('emulator-ingest', visibility_timeout=visibility_timeout)
+            self.queue.on_dead_letter(self.on_dead_letter)
+            self.ingest_batch_size = ingest_batch_size
+            self.batching_window = batching_window
+            for _ in range(ingest_max_concurrency):
+                threading.Thread(target=self.poll_queue, daemon=True).start()
+
+    def install_clients(self):
+        """
+        Make boto3.client/resource return the stand-ins
+        """
+        clients = {
+            's3': self.s3,
+            'stepfunctions': self.step_functions,
+            'rekognition': self.rekognition
+        }
+        resources = {'dynamodb': self.dynamodb}
+
+        def client(service_name, *args, **kwargs):
+            return clients[service_name]
+
+        def resource(service_name, *args, **kwargs):
+            return resources[service_name]
+
+        boto3.client = client
+        boto3.resource = resource
+
+    def record_metrics(self, record):
+        with self.metric_records_lock:
+            self.metric_records.append(record)
+
+    def metric_samples(self):
+        """
+        function -> metric name -> (unit, values), from the collected EMF records
+        """
+        samples = {}
+        with self.metric_records_lock:
+            records = list(self.metric_records)
+        for record in records:
+            function = samples.setdefault(record['Function'], {})
+            for directive in record['_aws']['CloudWatchMetrics']:
+                for metric in directive['Metrics']:
+                    unit, values = function.setdefault(metric['Name'], (metric['Unit'], []))
+                    values.append(record[metric['Name']])
+        return samples
+
+    def import_function(self, module_name):
+        sys.path.insert(0, os.path.join(BACKEND_DIR, 'functions', module_name))
+        return __import__(module_name)
+
+    def invoke(self, function_name, module, event):
+        """
+        Run a handler like a Lambda invocation and record its duration
+        """
+        start = time.time()
+        error = None
+        try:
+            return module.lambda_handler(event, LambdaContext(function_name))
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            with self.invocations_lock:
+                self.invocations.setdefault(function_name, []).append((start, time.time(), error))
+
+    def task_resource(self, function_name, module):
+        return lambda payload: self.invoke(function_name, module, payload)
+
+    def upload(self, body, user_id='emulator-user', extension='.jpg', file_name=None, analysis_profile='full'):
+        """
+        Create the pending record and put the object, as the browser upload
+        through a presigned URL would. Returns the Upload to wait on.
+        """
+        image_id = str(uuid.uuid4())
+        key = f"{user_id}/{image_id}{extension}"
+        upload = Upload(user_id, image_id, key)
+        self.uploads[key] = upload
+
+        self.results_table.put_item(Item={
+            'userId': user_id,
+            'imageId': image_id,
+            'imageKey': key,
+            'fileName': file_name or f"{image_id}{extension}",
+            'createdAt': int(time.time()),
+            'status': 'pending',
+            'analysisProfile': analysis_profile,
+            'results': {}
+        })
+
+        upload.uploaded_at = time.time()
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=f"image/{extension[1:]}")
+        return upload
+
+    def on_object_created(self, bucket, key, etag, size):
+        with self.invocations_lock:
+            self.sequence += 1
+            sequencer = f"{self.sequence:016X}"
+        event = {
+            'Records': [{
+                'eventSource': 'aws:s3',
+                'eventName': 'ObjectCreated:Put',
+                's3': {
+                    'bucket': {'name': bucket},
+                    'object': {'key': key, 'size': size, 'eTag': etag.strip('"'), 'sequencer': sequencer}
+                }
+            }]
+        }
+        if self.queue:
+            self.queue.send_message(MessageBody=json.dumps(event))
+        else:
+            self.lambda_executor.submit(self.run_trigger, key, event)
+
+    def run_trigger(self, key, event):
+        upload = self.uploads.get(key)
+        if upload:
+            upload.trigger_start = time.time()
+
+        try:
+            response = self.invoke('WorkflowTriggerFunction', self.workflow_trigger, event)
+        except Exception:
+            response = None
+
+        if upload:
+            upload.trigger_end = time.time()
+            upload.trigger_response = response
+            # Cache hits, skipped objects and errors start no execution
+            if 'executionArn' not in ((response or {}).get('body') or ''):
+                upload.finish()
+
+    def poll_queue(self):
+        """
+        One concurrent poller of the SQS event source: invoke the trigger
+        with a batch, then delete the messages it did not report as failed
+        """
+        while True:
+            records = self.queue.receive_batch(self.ingest_batch_size, self.batching_window)
+            keys = {record['messageId']: message_keys(record['body']) for record in records}
+            start = time.time()
+            for object_keys in keys.values():
+                for key in object_keys:
+                    upload = self.uploads.get(key)
+                    if upload and upload.trigger_start is None:
+                        upload.trigger_start = start
+
+            try:
+                response = self.invoke('WorkflowTriggerFunction', self.workflow_trigger, {'Records': records})
+                failed = {failure['itemIdentifier'] for failure in (response or {}).get('batchItemFailures', [])}
+            except Exception:
+                failed = set(keys)
+            self.queue.delete_messages([record for record in records if record['messageId'] not in failed])
+
+            end = time.time()
+            for message_id, object_keys in keys.items():
+                if message_id in failed:
+                    continue
+                for key in object_keys:
+                    upload = self.uploads.get(key)
+                    if not upload:
+                        continue
+                    upload.trigger_end = upload.trigger_end or end
+                    # Cache hits complete in the trigger and start no execution
+                    item = self.results_table.get_item(Key={'userId': upload.user_id, 'imageId': upload.image_id}).get('Item') or {}
+                    if item.get('cachedFrom') is not None:
+                        upload.cached = True
+                        upload.finish()
+
+    def run_child_execution(self, payload):
+        """
+        The startExecution.sync:2 integration: run the image workflow and
+        return its description, failing the task if the execution failed
+        """
+        state_machine_arn = payload['StateMachineArn']
+        if state_machine_arn == '${ImageProcessingStateMachine}':
+            state_machine_arn = self.machine.arn
+        execution = self.step_functions.run_execution(state_machine_arn, json.dumps(payload['Input']), payload.get('Name'))
+        if execution.status != 'SUCCEEDED':
+            raise StatesError('States.TaskFailed', f"{execution.error}: {execution.cause}")
+        return {'Input': payload['Input'], 'Output': execution.output, 'Status': execution.status}
+
+    def on_dead_letter(self, body):
+        for key in message_keys(body):
+            upload = self.uploads.get(key)
+            if upload:
+                upload.finish()
+
+    def on_execution_finished(self, execution):
+        upload = self.uploads.get(execution.input.get('imageKey'))
+        if upload:
+            upload.execution = execution
+            upload.finish()
+
+    def outcome(self, upload):
+        """
+        'succeeded', 'cached', 'rejected: <reason code>' or 'failed: <error>'
+        for a finished upload
+        """
+        execution = upload.execution
+        if execution is None:
+            cached = upload.cached or 'cache' in ((upload.trigger_response or {}).get('body') or '')
+            return 'cached' if cached else 'failed: trigger'
+        if execution.status != 'SUCCEEDED':
+            return f"failed: {execution.error}"
+        if any(entry['state'] == 'RejectImage' for entry in execution.history):
+            item = self.results_table.get_item(Key={'userId': upload.user_id, 'imageId': upload.image_id}).get('Item') or {}
+            return f"rejected: {(item.get('rejection') or [{}])[0].get('code', 'validation')}"
+        if any(entry['state'] == 'ProcessingFailed' for entry in execution.history):
+            errors = [entry['error'] for entry in execution.history if entry['error']]
+            return f"failed: {errors[0] if errors else 'analysis'}"
+        return 'succeeded'
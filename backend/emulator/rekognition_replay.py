@@ -0,0 +1,194 @@
+"""
+Record/replay stand-in for the Rekognition client.
+
+RecordingRekognition wraps a real client and saves each response as a
+fixture, keyed by the analyzed image's name. ReplayRekognition serves those
+fixtures (the image's own response, else the chosen or default fixture) with
+simulated service latency and throttling:
+
+- latency per operation is log-normal around DEFAULT_LATENCY_MS (scaled by
+  'latency_scale', spread by 'latency_sigma'), which gives realistic tails;
+- 'tps' caps each operation's calls per second with a token bucket, like the
+  per-account Rekognition TPS quotas, and 'throttle_rate' throttles a random
+  fraction of calls;
+- throttled calls are retried with exponential backoff and jitter, up to
+  'max_attempts' in total, like botocore's retry handler, before raising
+  ThrottlingException.
+
+Fixture files live in fixtures/rekognition/<Operation>.json:
+{"default": "<name>", "responses": {"<name>": <Rekognition response>}}.
+"""
+import copy
+import json
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'rekognition')
+
+OPERATIONS = {
+    'detect_labels': 'DetectLabels',
+    'detect_moderation_labels': 'DetectModerationLabels',
+    'detect_faces': 'DetectFaces',
+    'recognize_celebrities': 'RecognizeCelebrities',
+    'detect_text': 'DetectText'
+}
+
+# Typical median latencies of the image APIs for a ~1 MP image
+DEFAULT_LATENCY_MS = {
+    'DetectLabels': 450,
+    'DetectModerationLabels': 300,
+    'DetectFaces': 400,
+    'RecognizeCelebrities': 650,
+    'DetectText': 550
+}
+
+# Modeled error classes, named by error code like a real client's
+# 'exceptions', so Step Functions Retry/Catch see e.g. ThrottlingException
+ERROR_CODES = ['ThrottlingException', 'ProvisionedThroughputExceededException', 'InvalidParameterException']
+ERRORS = {code: type(code, (ClientError,), {}) for code in ERROR_CODES}
+
+def service_error(code, message, operation):
+    return ERRORS.get(code, ClientError)({
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': 400}
+    }, operation)
+
+# botocore's legacy retry mode: 5 attempts, base delay randomized in [0, 50 ms)
+RETRY_BASE_SECONDS = 0.05
+
+def fixture_name(image):
+    """
+    Fixture key for an Image parameter: the object's file name without
+    extension, so derived/ copies replay their original's response
+    """
+    name = image.get('S3Object', {}).get('Name', '')
+    return os.path.splitext(os.path.basename(name))[0]
+
+def load_fixtures(fixture_dir=FIXTURE_DIR):
+    fixtures = {}
+    for operation in OPERATIONS.values():
+        path = os.path.join(fixture_dir, f"{operation}.json")
+        if os.path.exists(path):
+            with open(path) as fixture_file:
+                fixtures[operation] = json.load(fixture_file)
+    return fixtures
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class ReplayRekognition:
+    """
+    Serves recorded Rekognition responses with simulated latency and throttling
+    """
+    def __init__(self, fixture_dir=FIXTURE_DIR, fixture=None, latency_scale=1.0, latency_sigma=0.3, tps=None,
+                 throttle_rate=0.0, max_attempts=5, seed=None):
+        self.fixtures = load_fixtures(fixture_dir)
+        # Response served for images without a recording of their own
+        self.fixture = fixture
+        self.latency_scale = latency_scale
+        self.latency_sigma = latency_sigma
+        self.throttle_rate = throttle_rate
+        self.max_attempts = max_attempts
+        self.buckets = {operation: TokenBucket(tps) for operation in OPERATIONS.values()} if tps else {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {operation: {'calls': 0, 'throttled': 0, 'failed': 0} for operation in OPERATIONS.values()}
+        self.exceptions = type('Exceptions', (), ERRORS)
+
+        for method, operation in OPERATIONS.items():
+            setattr(self, method, self.make_operation(operation))
+
+    def make_operation(self, operation):
+        def call(Image, **kwargs):
+            return self.invoke(operation, Image)
+        call.__name__ = operation
+        return call
+
+    def count(self, operation, field):
+        with self.lock:
+            self.stats[operation][field] += 1
+
+    def throttled(self, operation):
+        with self.lock:
+            random_throttle = self.throttle_rate and self.random.random() < self.throttle_rate
+        bucket = self.buckets.get(operation)
+        return random_throttle or (bucket is not None and not bucket.take())
+
+    def invoke(self, operation, image):
+        self.count(operation, 'calls')
+
+        for attempt in range(self.max_attempts):
+            if not self.throttled(operation):
+                break
+            self.count(operation, 'throttled')
+            if attempt == self.max_attempts - 1:
+                self.count(operation, 'failed')
+                raise service_error('ThrottlingException', 'Rate exceeded', operation)
+            with self.lock:
+                delay = self.random.random() * RETRY_BASE_SECONDS * (2 ** attempt)
+            time.sleep(delay)
+
+        with self.lock:
+            latency = DEFAULT_LATENCY_MS[operation] / 1000 * self.random.lognormvariate(0, self.latency_sigma)
+        time.sleep(latency * self.latency_scale)
+
+        fixture = self.fixtures.get(operation)
+        if fixture is None:
+            raise service_error('InvalidParameterException', f"No fixture recorded for {operation}", operation)
+
+        responses = fixture['responses']
+        response = responses.get(fixture_name(image)) or responses.get(self.fixture) or responses[fixture['default']]
+        return copy.deepcopy(response)
+
+class RecordingRekognition:
+    """
+    Wraps a real Rekognition client and saves its responses as fixtures
+    """
+    def __init__(self, client, fixture_dir=FIXTURE_DIR):
+        self.client = client
+        self.fixture_dir = fixture_dir
+        self.lock = threading.Lock()
+
+        for method, operation in OPERATIONS.items():
+            setattr(self, method, self.make_operation(method, operation))
+
+    def make_operation(self, method, operation):
+        def call(Image, **kwargs):
+            response = getattr(self.client, method)(Image=Image, **kwargs)
+            self.save(operation, fixture_name(Image), response)
+            return response
+        call.__name__ = operation
+        return call
+
+    def save(self, operation, name, response):
+        response = {key: value for key, value in response.items() if key != 'ResponseMetadata'}
+        path = os.path.join(self.fixture_dir, f"{operation}.json")
+
+        with self.lock:
+            fixture = {'default': name, 'responses': {}}
+            if os.path.exists(path):
+                with open(path) as fixture_file:
+                    fixture = json.load(fixture_file)
+            fixture['responses'][name] = response
+
+            os.makedirs(self.fixture_dir, exist_ok=True)
+            with open(path, 'w') as fixture_file:
+                json.dump(fixture, fixture_file, indent=2)
@@ -1,14 +1,16 @@
 import json
 import os
-import boto3
 import time
 from botocore.exceptions import ClientError
+import aws_clients
+from metrics import instrument
 
 # Initialize Cognito client
-cognito = boto3.client('cognito-idp')
+cognito = aws_clients.client('cognito-idp')
 USER_POOL_ID = os.environ.get('USER_POOL_ID')
 CLIENT_ID = os.environ.get('CLIENT_ID')
 
+@instrument('AuthHandler')
 def lambda_handler(event, context):
     """
     Authentication handler using Cognito
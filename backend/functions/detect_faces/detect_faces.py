@@ -1,15 +1,18 @@
 import json
 import os
-import boto3
-import time
+from rekognition_analysis import analyze_faces
+from result_codec import encode_result
+from analysis_progress import save_section, record_failure
+from rate_limiter import rate_limited
+from metrics import instrument
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
 
 # Get environment variables
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+@instrument('DetectFaces')
 def lambda_handler(event, context):
     """
     Detect and analyze faces in an image using Amazon Rekognition
@@ -22,79 +25,14 @@ def lambda_handler(event, context):
         
         print(f"Detecting faces for image: {image_key}")
         
-        # Call Rekognition to detect faces
-        response = rekognition.detect_faces(
-            Image={
-                'S3Object': {
-                    'Bucket': IMAGE_BUCKET,
-                    'Name': image_key
-                }
-            },
-            Attributes=['ALL']  # Get all face attributes
-        )
+        # Call Rekognition and format the results
+        result = analyze_faces(rekognition, IMAGE_BUCKET, image_key)
         
-        # Process and format the results
-        faces = []
-        for face in response.get('FaceDetails', []):
-            # Extract main face properties
-            face_info = {
-                'confidence': round(face.get('Confidence'), 2),
-                'boundingBox': face.get('BoundingBox', {}),
-                'ageRange': face.get('AgeRange', {}),
-                'gender': {
-                    'value': face.get('Gender', {}).get('Value'),
-                    'confidence': round(face.get('Gender', {}).get('Confidence', 0), 2)
-                },
-                'emotions': []
-            }
-            
-            # Extract emotion information
-            emotions = face.get('Emotions', [])
-            for emotion in emotions:
-                if emotion.get('Confidence') > 10:  # Only include emotions with reasonable confidence
-                    face_info['emotions'].append({
-                        'type': emotion.get('Type'),
-                        'confidence': round(emotion.get('Confidence'), 2)
-                    })
-            
-            # Sort emotions by confidence
-            face_info['emotions'].sort(key=lambda x: x.get('confidence', 0), reverse=True)
-            
-            # Extract facial features (smile, eyeglasses, beard, etc.)
-            for feature in ['Smile', 'Eyeglasses', 'Sunglasses', 'Beard', 'Mustache', 'EyesOpen', 'MouthOpen']:
-                if feature in face:
-                    face_info[feature.lower()] = {
-                        'value': face.get(feature, {}).get('Value', False),
-                        'confidence': round(face.get(feature, {}).get('Confidence', 0), 2)
-                    }
-            
-            # Extract quality information
-            if 'Quality' in face:
-                face_info['quality'] = {
-                    'brightness': round(face.get('Quality', {}).get('Brightness', 0), 2),
-                    'sharpness': round(face.get('Quality', {}).get('Sharpness', 0), 2)
-                }
-            
-            # Extract pose information
-            if 'Pose' in face:
-                face_info['pose'] = {
-                    'roll': round(face.get('Pose', {}).get('Roll', 0), 2),
-                    'yaw': round(face.get('Pose', {}).get('Yaw', 0), 2),
-                    'pitch': round(face.get('Pose', {}).get('Pitch', 0), 2)
-                }
-            
-            faces.append(face_info)
+        # Switch to the compact columnar shape when RESULT_ENCODING=compact
+        result = encode_result('faces', result)
         
-        # Sort faces by confidence
-        faces.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        
-        result = {
-            'timestamp': int(time.time()),
-            'faceCount': len(faces),
-            'faces': faces
-        }
-        
-        print(f"Detected {len(faces)} faces")
+        # Make the section visible before the other detectors finish
+        save_section(event.get('userId'), event.get('imageId'), 'faces', result)
         
         return {
             'imageKey': image_key,
@@ -103,4 +41,5 @@ def lambda_handler(event, context):
         }
     except Exception as e:
         print(f"Error detecting faces: {str(e)}")
+        record_failure(event.get('userId'), event.get('imageId'), 'faces')
         raise
\ No newline at end of file
@@ -1,15 +1,18 @@
 import json
 import os
-import boto3
-import time
+from rekognition_analysis import analyze_labels
+from result_codec import encode_result
+from analysis_progress import save_section, record_failure
+from rate_limiter import rate_limited
+from metrics import instrument
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
 
 # Get environment variables
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+@instrument('DetectLabels')
 def lambda_handler(event, context):
     """
     Detect labels (objects and scenes) in an image using Amazon Rekognition
@@ -22,54 +25,14 @@ def lambda_handler(event, context):
         
         print(f"Detecting labels for image: {image_key}")
         
-        # Call Rekognition to detect labels
-        response = rekognition.detect_labels(
-            Image={
-                'S3Object': {
-                    'Bucket': IMAGE_BUCKET,
-                    'Name': image_key
-                }
-            },
-            MaxLabels=50,
-            MinConfidence=70  # Only return labels with at least 70% confidence
-        )
+        # Call Rekognition and format the results
+        result = analyze_labels(rekognition, IMAGE_BUCKET, image_key)
         
-        # Process and format the results
-        labels = []
-        for label in response.get('Labels', []):
-            label_info = {
-                'name': label.get('Name'),
-                'confidence': round(label.get('Confidence'), 2),
-                'parents': [parent.get('Name') for parent in label.get('Parents', [])]
-            }
-            
-            # Add bounding boxes if available
-            instances = label.get('Instances', [])
-            if instances:
-                label_info['instances'] = []
-                for instance in instances:
-                    box = instance.get('BoundingBox', {})
-                    label_info['instances'].append({
-                        'confidence': round(instance.get('Confidence'), 2),
-                        'boundingBox': {
-                            'width': box.get('Width'),
-                            'height': box.get('Height'),
-                            'left': box.get('Left'),
-                            'top': box.get('Top')
-                        }
-                    })
-            
-            labels.append(label_info)
+        # Switch to the compact columnar shape when RESULT_ENCODING=compact
+        result = encode_result('labels', result)
         
-        # Sort labels by confidence (highest first)
-        labels.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        
-        result = {
-            'timestamp': int(time.time()),
-            'labels': labels
-        }
-        
-        print(f"Detected {len(labels)} labels")
+        # Make the section visible before the other detectors finish
+        save_section(event.get('userId'), event.get('imageId'), 'labels', result)
         
         return {
             'imageKey': image_key,
@@ -78,4 +41,5 @@ def lambda_handler(event, context):
         }
     except Exception as e:
         print(f"Error detecting labels: {str(e)}")
+        record_failure(event.get('userId'), event.get('imageId'), 'labels')
         raise
\ No newline at end of file
@@ -1,15 +1,17 @@
 import json
 import os
-import boto3
-import time
+from rekognition_analysis import analyze_moderation
+from analysis_progress import save_section, record_failure
+from rate_limiter import rate_limited
+from metrics import instrument
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
 
 # Get environment variables
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+@instrument('DetectModeration')
 def lambda_handler(event, context):
     """
     Detect moderation labels in an image using Amazon Rekognition
@@ -22,40 +24,11 @@ def lambda_handler(event, context):
         
         print(f"Detecting moderation labels for image: {image_key}")
         
-        # Call Rekognition to detect moderation labels
-        response = rekognition.detect_moderation_labels(
-            Image={
-                'S3Object': {
-                    'Bucket': IMAGE_BUCKET,
-                    'Name': image_key
-                }
-            },
-            MinConfidence=50  # Only return labels with at least 50% confidence
-        )
+        # Call Rekognition and format the results
+        result = analyze_moderation(rekognition, IMAGE_BUCKET, image_key)
         
-        # Process and format the results
-        moderation_labels = []
-        for label in response.get('ModerationLabels', []):
-            label_info = {
-                'name': label.get('Name'),
-                'parentName': label.get('ParentName'),
-                'confidence': round(label.get('Confidence'), 2)
-            }
-            moderation_labels.append(label_info)
-        
-        # Sort labels by confidence (highest first)
-        moderation_labels.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        
-        # Determine overall safety rating
-        is_safe = len(moderation_labels) == 0
-        
-        result = {
-            'timestamp': int(time.time()),
-            'isSafe': is_safe,
-            'moderationLabels': moderation_labels
-        }
-        
-        print(f"Detected {len(moderation_labels)} moderation labels")
+        # Make the section visible before the other detectors finish
+        save_section(event.get('userId'), event.get('imageId'), 'moderation', result)
         
         return {
             'imageKey': image_key,
@@ -64,4 +37,5 @@ def lambda_handler(event, context):
         }
     except Exception as e:
         print(f"Error detecting moderation labels: {str(e)}")
+        record_failure(event.get('userId'), event.get('imageId'), 'moderation')
         raise
\ No newline at end of file
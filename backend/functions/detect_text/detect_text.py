@@ -1,15 +1,18 @@
 import json
 import os
-import boto3
-import time
+from rekognition_analysis import analyze_text
+from result_codec import encode_result
+from analysis_progress import save_section, record_failure
+from rate_limiter import rate_limited
+from metrics import instrument
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
 
 # Get environment variables
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+@instrument('DetectText')
 def lambda_handler(event, context):
     """
     Detect and extract text from an image using Amazon Rekognition
@@ -22,52 +25,14 @@ def lambda_handler(event, context):
         
         print(f"Detecting text for image: {image_key}")
         
-        # Call Rekognition to detect text
-        response = rekognition.detect_text(
-            Image={
-                'S3Object': {
-                    'Bucket': IMAGE_BUCKET,
-                    'Name': image_key
-                }
-            }
-        )
+        # Call Rekognition and format the results
+        result = analyze_text(rekognition, IMAGE_BUCKET, image_key)
         
-        # Process and format the results
-        text_detections = []
+        # Switch to the compact columnar shape when RESULT_ENCODING=compact
+        result = encode_result('text', result)
         
-        # Extract text detections, separating words and lines
-        lines = []
-        words = []
-        
-        for detection in response.get('TextDetections', []):
-            detection_info = {
-                'detectedText': detection.get('DetectedText'),
-                'confidence': round(detection.get('Confidence'), 2),
-                'boundingBox': detection.get('Geometry', {}).get('BoundingBox', {})
-            }
-            
-            # Separate lines and words
-            if detection.get('Type') == 'LINE':
-                lines.append(detection_info)
-            elif detection.get('Type') == 'WORD':
-                words.append(detection_info)
-        
-        # Sort by confidence
-        lines.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        words.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        
-        # Combine all text lines
-        combined_text = ' '.join([line.get('detectedText', '') for line in lines])
-        
-        result = {
-            'timestamp': int(time.time()),
-            'hasText': len(lines) > 0,
-            'combinedText': combined_text,
-            'lines': lines,
-            'words': words
-        }
-        
-        print(f"Detected {len(lines)} text lines and {len(words)} words")
+        # Make the section visible before the other detectors finish
+        save_section(event.get('userId'), event.get('imageId'), 'text', result)
         
         return {
             'imageKey': image_key,
@@ -76,4 +41,5 @@ def lambda_handler(event, context):
         }
     except Exception as e:
         print(f"Error detecting text: {str(e)}")
+        record_failure(event.get('userId'), event.get('imageId'), 'text')
         raise
\ No newline at end of file
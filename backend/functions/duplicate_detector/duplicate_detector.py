@@ -0,0 +1,137 @@
+import io
+import os
+import time
+from PIL import Image
+from analysis_profiles import ANALYSIS_NAMES
+from perceptual_hash import (
+    HASH_INDEX_TABLE, dhash, to_hex, image_ref, split_ref, find_near_duplicates, join_group, write_postings, GLOBAL_SCOPE
+)
+import aws_clients
+from metrics import instrument, put_metric
+
+# Initialize AWS clients
+s3 = aws_clients.client('s3')
+dynamodb = aws_clients.resource('dynamodb')
+
+# Get environment variables
+RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+# Analyses whose results a near-duplicate can take over. Faces and text
+# are left to run: their boxes and words follow crops and resizes closely.
+REUSABLE_ANALYSES = ['labels', 'moderation', 'celebrities']
+
+# Near-duplicates checked for reusable results before giving up
+MAX_REUSE_CANDIDATES = 3
+
+@instrument('DuplicateDetector')
+def lambda_handler(event, context):
+    """
+    Hash an image, find its near-duplicates and index it.
+
+    Near-duplicates in the user's own library put the image in their
+    duplicate group. The closest completed near-duplicate, looked up in the
+    user's library first and in every library after, lends its label,
+    moderation and celebrity results: they are switched off in the returned
+    'analyses' flags and copied by the results processor instead. The
+    image's own postings are written last and excluded from its lookups, so
+    a retry never matches the image itself.
+    """
+    try:
+        user_id = event.get('userId')
+        image_id = event.get('imageId')
+        analysis_key = event.get('imageKey')
+        analyses = event.get('analyses') or {name: True for name in ANALYSIS_NAMES}
+
+        if not user_id or not image_id or not analysis_key:
+            raise ValueError("Missing required parameters (userId, imageId or imageKey)")
+
+        start_time = time.time()
+        body = s3.get_object(Bucket=IMAGE_BUCKET, Key=analysis_key)['Body'].read()
+        with Image.open(io.BytesIO(body)) as img:
+            value = dhash(img)
+
+        table = dynamodb.Table(HASH_INDEX_TABLE)
+        ref = image_ref(user_id, image_id)
+        own_matches = find_near_duplicates(table, user_id, value, exclude_ref=ref)
+        group_id = join_group(table, user_id, image_id, own_matches) if own_matches else None
+
+        wanted = [name for name in REUSABLE_ANALYSES if analyses.get(name, True)]
+        match, reuse = find_reusable(own_matches, wanted)
+        if not match and wanted:
+            global_matches = [
+                (distance, other) for distance, other in find_near_duplicates(table, GLOBAL_SCOPE, value, exclude_ref=ref)
+                if split_ref(other)[0] != user_id
+            ]
+            match, reuse = find_reusable(global_matches, wanted)
+
+        # An image deleted meanwhile is not indexed
+        if record_hash(user_id, image_id, value):
+            write_postings(table, user_id, image_id, value)
+
+        result = {
+            'hash': to_hex(value),
+            'duplicates': len(own_matches),
+            'groupId': group_id,
+            'reused': bool(reuse),
+            'analyses': {**analyses, **{name: False for name in reuse}}
+        }
+        if reuse:
+            result['match'] = {**match, 'reuse': reuse}
+
+        put_metric('ReusedAnalyses', len(reuse), 'Count')
+        print(f"Near-duplicate check finished in {time.time() - start_time:.3f}s: {result}")
+        return result
+    except Exception as e:
+        print(f"Error checking for near-duplicates: {str(e)}")
+        raise
+
+def find_reusable(matches, wanted):
+    """
+    (match, analyses to reuse) for the closest completed near-duplicate
+    that has some of the 'wanted' analyses, or (None, [])
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+
+    for distance, ref in matches[:MAX_REUSE_CANDIDATES]:
+        user_id, image_id = split_ref(ref)
+        item = table.get_item(
+            Key={'userId': user_id, 'imageId': image_id},
+            ProjectionExpression="#status, #summary.#analyses, #results.#summary.#analyses",
+            ExpressionAttributeNames={
+                '#status': 'status',
+                '#summary': 'summary',
+                '#analyses': 'analyses',
+                '#results': 'results'
+            }
+        ).get('Item')
+        if not item or item.get('status') != 'completed':
+            continue
+
+        summary = item.get('summary') or (item.get('results') or {}).get('summary') or {}
+        reuse = [name for name in wanted if name in (summary.get('analyses') or [])]
+        if reuse:
+            return {'userId': user_id, 'imageId': image_id, 'distance': distance}, reuse
+
+    return None, []
+
+def record_hash(user_id, image_id, value):
+    """
+    Keep the hash on the image record, so deleting the image can remove its
+    index items. False when the image no longer exists.
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+    try:
+        table.update_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            UpdateExpression="SET perceptualHash = :hash",
+            ConditionExpression="attribute_exists(userId)",
+            ExpressionAttributeValues={':hash': to_hex(value)}
+        )
+        return True
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Image {image_id} was deleted during the near-duplicate check")
+        return False
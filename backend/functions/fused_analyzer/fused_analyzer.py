@@ -0,0 +1,105 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rekognition_analysis import ANALYSES
+from result_codec import encode_result
+from rate_limiter import rate_limited
+from cascade import FIRST_STAGE, plan_cascade
+from metrics import instrument, timer, bind, put_metric
+
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
+
+# Get environment variables
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+def run_analysis(name, analyze, image_key):
+    """
+    One analysis, timed as <Name>Time so a slow detector stands out
+    """
+    with timer(f"{name.capitalize()}Time"):
+        return analyze(rekognition, IMAGE_BUCKET, image_key)
+
+@instrument('FusedAnalyzer')
+def lambda_handler(event, context):
+    """
+    Run the selected Rekognition analyses concurrently in a single invocation.
+
+    Alternative to the ParallelImageProcessing fan-out: returns the same
+    five-element list (labels, moderation, faces, celebrities, text) so
+    results_processor can consume either path unchanged. Analyses switched
+    off in the event's 'analyses' flags get the same {'skipped': True}
+    entry as a skipped fan-out branch.
+
+    With analyzerMode 'cascade', labels and moderation run first and the
+    cascade module decides whether faces, celebrities and text still run;
+    skipped analyses carry the reason in their entry.
+    """
+    try:
+        # Get the image key from the event
+        image_key = event.get('imageKey')
+        if not image_key:
+            raise ValueError("No image key provided")
+
+        analyses = event.get('analyses') or {}
+        selected = [(name, analyze) for name, analyze in ANALYSES if analyses.get(name, True)]
+        skipped = {name: 'profile' for name, _ in ANALYSES if not analyses.get(name, True)}
+
+        print(f"Running fused analysis ({', '.join(name for name, _ in selected)}) for image: {image_key}")
+        start_time = time.time()
+
+        # boto3 clients are thread-safe, so all calls share one client;
+        # bind() keeps the worker threads' timings in this invocation's metrics
+        with ThreadPoolExecutor(max_workers=max(1, len(selected))) as executor:
+            if event.get('analyzerMode') == 'cascade':
+                results = run_cascade(executor, selected, image_key, skipped)
+            else:
+                futures = {
+                    name: executor.submit(bind(run_analysis), name, analyze, image_key)
+                    for name, analyze in selected
+                }
+                # result() re-raises the first failure so the state's Catch still applies
+                results = {name: future.result() for name, future in futures.items()}
+
+        analysis_results = [
+            {
+                'imageKey': image_key,
+                'userId': event.get('userId'),
+                name: encode_result(name, results[name])
+            } if name in results else {'skipped': True, 'reason': skipped[name]}
+            for name, _ in ANALYSES
+        ]
+
+        print(f"Fused analysis finished in {time.time() - start_time:.3f}s")
+
+        return analysis_results
+    except Exception as e:
+        print(f"Error in fused analysis: {str(e)}")
+        raise
+
+def run_cascade(executor, selected, image_key, skipped):
+    """
+    Run the first-stage analyses, then only the gated ones that pass.
+    Returns {name: result} and adds the cascade's skips to 'skipped'.
+    """
+    first = {
+        name: executor.submit(bind(run_analysis), name, analyze, image_key)
+        for name, analyze in selected if name in FIRST_STAGE
+    }
+    results = {name: future.result() for name, future in first.items()}
+
+    # Only analyses the profile selected count as saved calls
+    decisions = plan_cascade(results.get('labels'), results.get('moderation'))
+    cascade_skipped = {name: reason for name, reason in decisions.items() if name in dict(selected)}
+    skipped.update(cascade_skipped)
+    put_metric('CascadeSkipped', len(cascade_skipped), 'Count')
+    if cascade_skipped:
+        print(f"Cascade skipped {', '.join(f'{name} ({reason})' for name, reason in cascade_skipped.items())}")
+
+    rest = [(name, analyze) for name, analyze in selected if name not in FIRST_STAGE and name not in cascade_skipped]
+    second = {
+        name: executor.submit(bind(run_analysis), name, analyze, image_key)
+        for name, analyze in rest
+    }
+    results.update({name: future.result() for name, future in second.items()})
+    return results
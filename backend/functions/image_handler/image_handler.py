@@ -1,27 +1,74 @@
 import json
 import os
-import boto3
 import uuid
 import time
 import base64
 import decimal
+from collections import Counter
 from urllib.parse import unquote
+from url_signer import presign_get_object, get_window
+from token_verifier import verify_token
+from result_storage import PARTIAL_RESULTS, unpack_results, unpack_sections
+from result_codec import decode_results
+from decimal_json import dumps as dumps_json
+from analysis_profiles import resolve_profile
+from analysis_progress import ANALYSIS_PROGRESS
+import status_events
+import search_index
+import user_stats
+import perceptual_hash
+from collection_version import bump_version, current_version, make_etag, etag_matches
+import aws_clients
+from metrics import instrument
 
 # Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-
-# Add this class to your image_handler.py file
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, decimal.Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+s3 = aws_clients.client('s3')
+dynamodb = aws_clients.resource('dynamodb')
 
 # Get environment variables
 RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+# Index on (userId, createdAt) used to list images newest first
+CREATED_AT_INDEX = os.environ.get('CREATED_AT_INDEX', 'userId-createdAt-index')
+
+# Gallery page size bounds for list_images
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# Upper bound on files per batch upload-URL request
+MAX_BATCH_UPLOAD_FILES = int(os.environ.get('MAX_BATCH_UPLOAD_FILES', 100))
+
+# DynamoDB batch_write_item limits and retry policy for unprocessed items
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_MAX_ATTEMPTS = 5
+
+# batch_get_item and S3 delete_objects limits, and bulk delete request bounds
+BATCH_GET_SIZE = 100
+S3_DELETE_BATCH_SIZE = 1000
+MAX_BULK_DELETE_IDS = 1000
+
+# Stop a delete-all run with this much Lambda time left and report hasMore
+BULK_DELETE_TIME_MARGIN_MS = 5000
+
+# Longest a /images/changes request waits for new events, how often it checks
+# for them meanwhile, and the Lambda time it leaves unused
+FEED_MAX_WAIT_SECONDS = int(os.environ.get('FEED_MAX_WAIT_SECONDS', 20))
+FEED_POLL_SECONDS = float(os.environ.get('FEED_POLL_SECONDS', 1))
+FEED_TIME_MARGIN_MS = 2000
+
+# Search request bounds and index query page size
+MAX_SEARCH_TERMS = 10
+SEARCH_QUERY_PAGE_SIZE = 1000
+
+# Most frequent labels and celebrities returned by /images/stats by default, and at most
+DEFAULT_STATS_TOP = 20
+MAX_STATS_TOP = 100
+
+# Image file types accepted for upload
+ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+
+@instrument('ImageHandler')
 def lambda_handler(event, context):
     """
     Handle CRUD operations for images
@@ -42,7 +89,15 @@ def lambda_handler(event, context):
         
         # Route the request to the appropriate handler
         if http_method == 'GET' and path.endswith('/images'):
-            return list_images(user_id)
+            return list_images(user_id, event.get('queryStringParameters') or {}, get_header(event, 'If-None-Match'))
+        elif http_method == 'GET' and path.endswith('/images/search'):
+            return search_images(user_id, event.get('queryStringParameters') or {}, get_header(event, 'If-None-Match'))
+        elif http_method == 'GET' and path.endswith('/images/changes'):
+            return get_changes(user_id, event.get('queryStringParameters') or {}, context)
+        elif http_method == 'GET' and path.endswith('/images/stats'):
+            return get_stats(user_id, event.get('queryStringParameters') or {})
+        elif http_method == 'GET' and path.endswith('/images/duplicates'):
+            return get_duplicate_groups(user_id)
         elif http_method == 'GET' and '/images/' in path and not path.endswith('/results'):
             image_id = event['pathParameters']['imageId']
             return get_image(user_id, image_id)
@@ -51,9 +106,13 @@ def lambda_handler(event, context):
             return delete_image(user_id, image_id)
         elif http_method == 'POST' and path.endswith('/upload-url'):
             return generate_presigned_url(user_id, event)
+        elif http_method == 'POST' and path.endswith('/upload-urls'):
+            return generate_presigned_urls(user_id, event)
+        elif http_method == 'POST' and path.endswith('/bulk-delete'):
+            return bulk_delete_images(user_id, event, context)
         elif http_method == 'GET' and path.endswith('/results'):
             image_id = event['pathParameters']['imageId']
-            return get_image_results(user_id, image_id)
+            return get_image_results(user_id, image_id, get_header(event, 'If-None-Match'))
         else:
             return {
                 'statusCode': 400,
@@ -68,23 +127,66 @@ def lambda_handler(event, context):
             'body': json.dumps({'message': 'Internal server error'})
         }
 
-def list_images(user_id):
+def list_images(user_id, query_params=None, if_none_match=None):
     """
-    List all images for a user with robust error handling
+    List one page of a user's images, newest first.
+
+    Supports cursor pagination through the 'limit' and 'nextToken' query
+    parameters; the response carries a 'nextToken' while more pages remain.
+    The page's ETag is built from the user's collection version; a matching
+    If-None-Match gets a 304 without querying the images.
     """
+    query_params = query_params or {}
+    
+    try:
+        limit = int(query_params.get('limit') or DEFAULT_PAGE_SIZE)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        exclusive_start_key = decode_page_token(query_params.get('nextToken'), user_id)
+    except (ValueError, TypeError):
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Invalid limit or nextToken'})
+        }
+    
     try:
         print(f"Listing images for user: {user_id}")
         table = dynamodb.Table(RESULTS_TABLE)
         
-        # Query DynamoDB for all images belonging to the user
+        # Version read before the listing, so the ETag never claims newer
+        # data than the body holds
+        version = current_version(user_id)
+        etag = None
+        if version is not None:
+            etag = make_etag(version, 'images', get_window(), limit, query_params.get('nextToken') or '')
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+        
+        # Feed position for the first page, read before the listing so that
+        # changes made while it runs are replayed rather than lost
+        changes_cursor = None if exclusive_start_key else current_changes_cursor(user_id)
+        
+        # Query the createdAt index newest first, reading only gallery fields
         try:
-            response = table.query(
-                KeyConditionExpression="userId = :uid",
-                ExpressionAttributeValues={
+            query_args = {
+                'IndexName': CREATED_AT_INDEX,
+                'KeyConditionExpression': "userId = :uid",
+                'ExpressionAttributeValues': {
                     ":uid": user_id
-                }
-            )
+                },
+                'ProjectionExpression': "imageId, imageKey, createdAt, #status, fileName",
+                'ExpressionAttributeNames': {
+                    '#status': 'status'
+                },
+                'ScanIndexForward': False,
+                'Limit': limit
+            }
+            if exclusive_start_key:
+                query_args['ExclusiveStartKey'] = exclusive_start_key
+            
+            response = table.query(**query_args)
             items = response.get('Items', [])
+            next_token = encode_page_token(response.get('LastEvaluatedKey'))
             print(f"Found {len(items)} items in DynamoDB for user {user_id}")
         except Exception as db_error:
             print(f"DynamoDB query error: {str(db_error)}")
@@ -92,7 +194,7 @@ def list_images(user_id):
             return {
                 'statusCode': 200,
                 'headers': get_cors_headers(),
-                'body': json.dumps({'images': []})
+                'body': json.dumps({'images': [], 'nextToken': None})
             }
         
         # Format the response
@@ -106,14 +208,7 @@ def list_images(user_id):
                     continue
                 
                 try:
-                    image_url = s3.generate_presigned_url(
-                        'get_object',
-                        Params={
-                            'Bucket': IMAGE_BUCKET,
-                            'Key': image_key  # Make sure this is 'Key', not 'Name'
-                        },
-                        ExpiresIn=3600
-                    )
+                    image_url = get_image_url(image_key)
                 except Exception as url_error:
                     print(f"Error generating presigned URL: {str(url_error)}")
                     # Use a placeholder URL instead of failing
@@ -136,14 +231,11 @@ def list_images(user_id):
                 # Continue with other images
                 continue
         
-        # Sort images by creation date, newest first
-        images.sort(key=lambda x: x.get('createdAt', 0), reverse=True)
-        
         print(f"Returning {len(images)} images")
         return {
             'statusCode': 200,
-            'headers': get_cors_headers(),
-            'body': json.dumps({'images': images})
+            'headers': get_cors_headers(etag),
+            'body': json.dumps({'images': images, 'nextToken': next_token, 'changesCursor': changes_cursor})
         }
     except Exception as e:
         print(f"Unexpected error in list_images: {str(e)}")
@@ -151,9 +243,63 @@ def list_images(user_id):
         return {
             'statusCode': 200,
             'headers': get_cors_headers(),
-            'body': json.dumps({'images': []})
+            'body': json.dumps({'images': [], 'nextToken': None})
         }
 
+def get_image_url(image_key):
+    """
+    Return a browser-cacheable pre-signed GET URL for an image
+    """
+    # Virtual-hosted URLs do not work over HTTPS for bucket names with dots
+    if '.' not in IMAGE_BUCKET:
+        try:
+            credentials = aws_clients.get_session().get_credentials().get_frozen_credentials()
+            return presign_get_object(IMAGE_BUCKET, image_key, credentials, s3.meta.region_name)
+        except Exception as e:
+            print(f"Error signing cached URL, falling back to boto3: {str(e)}")
+    
+    return s3.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': IMAGE_BUCKET,
+            'Key': image_key
+        },
+        ExpiresIn=3600
+    )
+
+def encode_page_token(last_evaluated_key):
+    """
+    Turn a DynamoDB LastEvaluatedKey into an opaque URL-safe page token
+    """
+    if not last_evaluated_key:
+        return None
+    
+    token_json = dumps_json(last_evaluated_key, separators=(',', ':'))
+    return base64.urlsafe_b64encode(token_json.encode('utf-8')).decode('ascii')
+
+def decode_page_token(token, user_id):
+    """
+    Turn a page token back into an ExclusiveStartKey (raises ValueError if malformed)
+    """
+    if not token:
+        return None
+    
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("Malformed page token")
+    
+    if not isinstance(key, dict) or set(key) != {'userId', 'imageId', 'createdAt'}:
+        raise ValueError("Malformed page token")
+    
+    # A token can only continue a listing of the caller's own images
+    if key['userId'] != user_id:
+        raise ValueError("Page token belongs to another user")
+    
+    # Index keys must round-trip as Decimal for the number attribute
+    key['createdAt'] = decimal.Decimal(str(key['createdAt']))
+    return key
+
 def get_image(user_id, image_id):
     """
     Get details for a specific image
@@ -178,14 +324,7 @@ def get_image(user_id, image_id):
     
     # Generate a pre-signed URL for the image
     image_key = item.get('imageKey')
-    image_url = s3.generate_presigned_url(
-        'get_object',
-        Params={
-            'Bucket': IMAGE_BUCKET,
-            'Key': image_key
-        },
-        ExpiresIn=3600
-    )
+    image_url = get_image_url(image_key)
     
     # Format the response
     image_details = {
@@ -193,13 +332,16 @@ def get_image(user_id, image_id):
         'imageUrl': image_url,
         'createdAt': item.get('createdAt'),
         'status': item.get('status'),
-        'fileName': item.get('fileName', 'unknown')
+        'fileName': item.get('fileName', 'unknown'),
+        'analysisProfile': item.get('analysisProfile', 'full')
     }
+    if item.get('rejection'):
+        image_details['rejection'] = item['rejection']
     
     return {
         'statusCode': 200,
         'headers': get_cors_headers(),
-        'body': json.dumps(image_details)
+        'body': dumps_json(image_details)
     }
 
 def delete_image(user_id, image_id):
@@ -231,13 +373,28 @@ def delete_image(user_id, image_id):
         Key=image_key
     )
     
-    # Delete the record from DynamoDB
-    table.delete_item(
+    # Delete results that were spilled to S3, if any
+    if item.get('resultsObject'):
+        s3.delete_object(
+            Bucket=IMAGE_BUCKET,
+            Key=item['resultsObject']
+        )
+    
+    # Delete the record from DynamoDB; only the request that actually removed
+    # it gets the old record back and takes the image out of the stats
+    response = table.delete_item(
         Key={
             'userId': user_id,
             'imageId': image_id
-        }
+        },
+        ReturnValues='ALL_OLD'
     )
+    bump_version(user_id)
+    
+    old_item = response.get('Attributes')
+    if old_item:
+        user_stats.record_contribution(user_id, old_item.get('statsContribution'), None, old_item.get('createdAt'))
+        remove_hash_index_items(user_id, [old_item])
     
     return {
         'statusCode': 200,
@@ -245,6 +402,206 @@ def delete_image(user_id, image_id):
         'body': json.dumps({'message': 'Image deleted successfully'})
     }
 
+def bulk_delete_images(user_id, event, context=None):
+    """
+    Delete many images and their analysis results in batches.
+
+    Expects {"imageIds": [...]} or {"all": true}. Failures are reported per
+    image in 'failed' and never abort the rest of the batch. A delete-all run
+    that gets close to the Lambda timeout returns 'hasMore' so the client can
+    call again.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        delete_all = body.get('all') is True
+        image_ids = body.get('imageIds')
+        
+        if not delete_all:
+            if not isinstance(image_ids, list) or not image_ids:
+                return {
+                    'statusCode': 400,
+                    'headers': get_cors_headers(),
+                    'body': json.dumps({'message': 'imageIds must be a non-empty list, or set all to true'})
+                }
+            if len(image_ids) > MAX_BULK_DELETE_IDS:
+                return {
+                    'statusCode': 400,
+                    'headers': get_cors_headers(),
+                    'body': json.dumps({'message': f'At most {MAX_BULK_DELETE_IDS} images per request'})
+                }
+        
+        deleted = []
+        failed = []
+        has_more = False
+        
+        if delete_all:
+            exclusive_start_key = None
+            while True:
+                items, exclusive_start_key = query_image_keys(user_id, exclusive_start_key)
+                delete_image_items(user_id, items, deleted, failed)
+                
+                if not exclusive_start_key:
+                    break
+                if context and context.get_remaining_time_in_millis() < BULK_DELETE_TIME_MARGIN_MS:
+                    has_more = True
+                    break
+        else:
+            image_ids = list(dict.fromkeys(str(image_id) for image_id in image_ids))
+            items = batch_get_image_keys(user_id, image_ids)
+            found_ids = {item['imageId'] for item in items}
+            failed.extend({'imageId': image_id, 'message': 'Image not found'} for image_id in image_ids if image_id not in found_ids)
+            delete_image_items(user_id, items, deleted, failed)
+        
+        if deleted:
+            bump_version(user_id)
+        print(f"Bulk delete for user {user_id}: {len(deleted)} deleted, {len(failed)} failed")
+        
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'deleted': deleted,
+                'failed': failed,
+                'hasMore': has_more
+            })
+        }
+    except Exception as e:
+        print(f"Error in bulk delete: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Error deleting images'})
+        }
+
+def query_image_keys(user_id, exclusive_start_key=None):
+    """
+    Read one page of a user's image IDs and object keys
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+    
+    query_args = {
+        'KeyConditionExpression': "userId = :uid",
+        'ExpressionAttributeValues': {
+            ":uid": user_id
+        },
+        'ProjectionExpression': "imageId, imageKey, resultsObject, statsContribution, createdAt, perceptualHash",
+        'Limit': S3_DELETE_BATCH_SIZE // 2
+    }
+    if exclusive_start_key:
+        query_args['ExclusiveStartKey'] = exclusive_start_key
+    
+    response = table.query(**query_args)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+def batch_get_image_keys(user_id, image_ids, projection="imageId, imageKey, resultsObject, statsContribution, createdAt, perceptualHash", names=None):
+    """
+    Resolve image IDs to items (what delete_image_items needs by default)
+    with batch_get_item
+    """
+    items = []
+    
+    for start in range(0, len(image_ids), BATCH_GET_SIZE):
+        request_items = {
+            RESULTS_TABLE: {
+                'Keys': [{'userId': user_id, 'imageId': image_id} for image_id in image_ids[start:start + BATCH_GET_SIZE]],
+                'ProjectionExpression': projection
+            }
+        }
+        if names:
+            request_items[RESULTS_TABLE]['ExpressionAttributeNames'] = names
+        
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            items.extend(response.get('Responses', {}).get(RESULTS_TABLE, []))
+            request_items = response.get('UnprocessedKeys') or {}
+            
+            if not request_items or attempt == BATCH_WRITE_MAX_ATTEMPTS - 1:
+                break
+            
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        
+        if request_items:
+            raise RuntimeError("batch_get_item left keys unprocessed")
+    
+    return items
+
+def delete_image_items(user_id, items, deleted, failed):
+    """
+    Delete the S3 objects and DynamoDB records for a list of items, adding
+    image IDs to 'deleted' or entries to 'failed'. A record is only removed
+    once its objects are gone, so a failed object delete can be retried.
+    """
+    keys_to_ids = {}
+    for item in items:
+        for object_key in (item.get('imageKey'), item.get('resultsObject')):
+            if object_key:
+                keys_to_ids[object_key] = item['imageId']
+    
+    object_failures = {}
+    
+    # Delete the objects from S3, up to 1000 keys per request
+    image_keys = list(keys_to_ids)
+    for start in range(0, len(image_keys), S3_DELETE_BATCH_SIZE):
+        batch = image_keys[start:start + S3_DELETE_BATCH_SIZE]
+        try:
+            response = s3.delete_objects(
+                Bucket=IMAGE_BUCKET,
+                Delete={
+                    'Objects': [{'Key': image_key} for image_key in batch],
+                    'Quiet': True
+                }
+            )
+            errors = {error['Key']: error.get('Message', 'Error deleting object') for error in response.get('Errors', [])}
+        except Exception as e:
+            print(f"Error in delete_objects: {str(e)}")
+            errors = {image_key: 'Error deleting object' for image_key in batch}
+        
+        for image_key in batch:
+            if image_key in errors:
+                object_failures.setdefault(keys_to_ids[image_key], errors[image_key])
+    
+    failed.extend({'imageId': image_id, 'message': message} for image_id, message in object_failures.items())
+    removable_ids = [item['imageId'] for item in items if item['imageId'] not in object_failures]
+    
+    # Delete the records from DynamoDB
+    unprocessed = batch_write([
+        {'DeleteRequest': {'Key': {'userId': user_id, 'imageId': image_id}}}
+        for image_id in removable_ids
+    ])
+    unprocessed_ids = {request['DeleteRequest']['Key']['imageId'] for request in unprocessed}
+    
+    items_by_id = {item['imageId']: item for item in items}
+    stats_changes = Counter()
+    
+    for image_id in removable_ids:
+        if image_id in unprocessed_ids:
+            failed.append({'imageId': image_id, 'message': 'Error deleting image record'})
+        else:
+            deleted.append(image_id)
+            item = items_by_id[image_id]
+            stats_changes.update(user_stats.delta(item.get('statsContribution'), None, item.get('createdAt')))
+    
+    # One update takes the whole batch out of the stats
+    user_stats.apply_changes(user_id, {name: value for name, value in stats_changes.items() if value})
+    remove_hash_index_items(user_id, [items_by_id[image_id] for image_id in removable_ids if image_id not in unprocessed_ids])
+
+def remove_hash_index_items(user_id, items):
+    """
+    Delete the near-duplicate index postings and group entries of deleted
+    images. Leftovers only cost the duplicate detector a wasted check, so
+    failures are logged and not reported.
+    """
+    if not perceptual_hash.HASH_INDEX_TABLE:
+        return
+    
+    requests = [
+        {'DeleteRequest': {'Key': key}}
+        for item in items if item.get('perceptualHash')
+        for key in perceptual_hash.index_keys(user_id, item['imageId'], item['perceptualHash'])
+    ]
+    if requests:
+        batch_write(requests, perceptual_hash.HASH_INDEX_TABLE)
+
 def generate_presigned_url(user_id, event):
     """
     Generate a pre-signed URL for uploading an image to S3
@@ -252,6 +609,7 @@ def generate_presigned_url(user_id, event):
     try:
         body = json.loads(event.get('body', '{}'))
         file_name = body.get('fileName', '')
+        analysis_profile = body.get('analysisProfile')
         
         if not file_name:
             return {
@@ -260,72 +618,212 @@ def generate_presigned_url(user_id, event):
                 'body': json.dumps({'message': 'fileName is required'})
             }
         
-        # Generate a unique image ID and S3 key
-        image_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file_name)[1].lower()
-        
-        # For security, restrict to image file types
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
-        if file_extension not in allowed_extensions:
+        try:
+            record, upload = prepare_upload(user_id, file_name, analysis_profile)
+        except ValueError as validation_error:
             return {
                 'statusCode': 400,
                 'headers': get_cors_headers(),
-                'body': json.dumps({'message': 'Invalid file type'})
+                'body': json.dumps({'message': str(validation_error)})
             }
         
-        # Create S3 key with user ID and image ID to ensure uniqueness
-        s3_key = f"{user_id}/{image_id}{file_extension}"
-        
-        # Generate a pre-signed URL for uploading
-        presigned_url = s3.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': IMAGE_BUCKET,
-                'Key': s3_key,
-                'ContentType': f"image/{file_extension[1:]}"
-            },
-            ExpiresIn=300  # URL expires in 5 minutes
-        )
-        
         # Create a record in DynamoDB
         table = dynamodb.Table(RESULTS_TABLE)
-        timestamp = int(time.time())
+        table.put_item(Item=record)
+        bump_version(user_id)
+        
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps(upload)
+        }
+    except Exception as e:
+        print(f"Error generating presigned URL: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Error generating upload URL'})
+        }
+
+def generate_presigned_urls(user_id, event):
+    """
+    Generate pre-signed upload URLs for several images in one request.
+
+    Expects {"files": [{"fileName": ..., "analysisProfile": ...}, ...]}, where
+    a file's analysisProfile defaults to one given for the whole request
+    (see analysis_profiles.PROFILES). Files that fail validation
+    or whose pending record could not be written are reported in 'failed'
+    instead of failing the whole batch.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        files = body.get('files')
+        
+        if not isinstance(files, list) or not files:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'message': 'files must be a non-empty list'})
+            }
         
-        table.put_item(
-            Item={
-                'userId': user_id,
-                'imageId': image_id,
-                'imageKey': s3_key,
-                'fileName': file_name,
-                'createdAt': timestamp,
-                'status': 'pending',
-                'results': {}
+        if len(files) > MAX_BATCH_UPLOAD_FILES:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({'message': f'At most {MAX_BATCH_UPLOAD_FILES} files per request'})
             }
-        )
+        
+        records = []
+        uploads = []
+        failed = []
+        for index, file_info in enumerate(files):
+            file_name = file_info.get('fileName', '') if isinstance(file_info, dict) else ''
+            try:
+                if not file_name:
+                    raise ValueError('fileName is required')
+                record, upload = prepare_upload(user_id, file_name, file_info.get('analysisProfile', body.get('analysisProfile')))
+                upload['index'] = index
+                records.append(record)
+                uploads.append(upload)
+            except ValueError as validation_error:
+                failed.append({'index': index, 'fileName': file_name, 'message': str(validation_error)})
+        
+        # Only hand out URLs whose pending record was actually stored
+        unwritten = batch_write_records(records)
+        if unwritten:
+            unwritten_ids = {record['imageId'] for record in unwritten}
+            for upload in uploads:
+                if upload['imageId'] in unwritten_ids:
+                    failed.append({'index': upload['index'], 'fileName': upload['fileName'], 'message': 'Could not create image record'})
+            uploads = [upload for upload in uploads if upload['imageId'] not in unwritten_ids]
+        if uploads:
+            bump_version(user_id)
+        
+        print(f"Generated {len(uploads)} upload URLs for user {user_id} ({len(failed)} failed)")
         
         return {
             'statusCode': 200,
             'headers': get_cors_headers(),
             'body': json.dumps({
-                'uploadUrl': presigned_url,
-                'imageId': image_id,
-                'imageKey': s3_key
+                'uploads': uploads,
+                'failed': sorted(failed, key=lambda x: x['index'])
             })
         }
     except Exception as e:
-        print(f"Error generating presigned URL: {str(e)}")
+        print(f"Error generating presigned URLs: {str(e)}")
         return {
             'statusCode': 500,
             'headers': get_cors_headers(),
-            'body': json.dumps({'message': 'Error generating upload URL'})
+            'body': json.dumps({'message': 'Error generating upload URLs'})
+        }
+
+def prepare_upload(user_id, file_name, analysis_profile=None):
+    """
+    Build the pending DynamoDB record and the pre-signed PUT for one file
+    (raises ValueError if the file type or analysis profile is not allowed)
+    """
+    analysis_profile = resolve_profile(analysis_profile)
+
+    # Generate a unique image ID and S3 key
+    image_id = str(uuid.uuid4())
+    file_extension = os.path.splitext(file_name)[1].lower()
+    
+    # For security, restrict to image file types
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise ValueError('Invalid file type')
+    
+    # Create S3 key with user ID and image ID to ensure uniqueness
+    s3_key = f"{user_id}/{image_id}{file_extension}"
+    
+    # Generate a pre-signed URL for uploading
+    presigned_url = s3.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': IMAGE_BUCKET,
+            'Key': s3_key,
+            'ContentType': f"image/{file_extension[1:]}"
+        },
+        ExpiresIn=300  # URL expires in 5 minutes
+    )
+    
+    record = {
+        'userId': user_id,
+        'imageId': image_id,
+        'imageKey': s3_key,
+        'fileName': file_name,
+        'createdAt': int(time.time()),
+        'status': 'pending',
+        'analysisProfile': analysis_profile,
+        'results': {}
+    }
+    
+    upload = {
+        'uploadUrl': presigned_url,
+        'imageId': image_id,
+        'imageKey': s3_key,
+        'fileName': file_name,
+        'analysisProfile': analysis_profile
+    }
+    
+    return record, upload
+
+def batch_write_records(records):
+    """
+    Put records with batch_write_item. Returns the records that could not be written.
+    """
+    unprocessed = batch_write([{'PutRequest': {'Item': record}} for record in records])
+    return [request['PutRequest']['Item'] for request in unprocessed]
+
+def batch_write(write_requests, table_name=RESULTS_TABLE):
+    """
+    Send write requests to a table (the results table by default) with
+    batch_write_item, retrying unprocessed items with exponential backoff.
+    Returns the requests that could not be processed.
+    """
+    unprocessed = []
+    
+    for start in range(0, len(write_requests), BATCH_WRITE_SIZE):
+        request_items = {
+            table_name: write_requests[start:start + BATCH_WRITE_SIZE]
         }
+        
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            try:
+                response = dynamodb.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems') or {}
+            except Exception as e:
+                print(f"Error in batch_write_item (attempt {attempt + 1}): {str(e)}")
+            
+            if not request_items or attempt == BATCH_WRITE_MAX_ATTEMPTS - 1:
+                break
+            
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        
+        unprocessed.extend(request_items.get(table_name, []))
+    
+    if unprocessed:
+        print(f"{len(unprocessed)} write requests left unprocessed after {BATCH_WRITE_MAX_ATTEMPTS} attempts")
+    
+    return unprocessed
 
-def get_image_results(user_id, image_id):
+def get_image_results(user_id, image_id, if_none_match=None):
     """
-    Get analysis results for a specific image
+    Get analysis results for a specific image; a matching If-None-Match
+    gets a 304 without reading the results
     """
     table = dynamodb.Table(RESULTS_TABLE)
     
+    version = current_version(user_id)
+    etag = None
+    if version is not None:
+        etag = make_etag(version, 'results', image_id, get_window())
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    # Feed position read first, so a client waiting for the analysis to
+    # finish sees the completion even if it happens during this request
+    changes_cursor = current_changes_cursor(user_id)
+    
     # Get image details from DynamoDB
     response = table.get_item(
         Key={
@@ -344,14 +842,7 @@ def get_image_results(user_id, image_id):
     
     # Generate a pre-signed URL for the image
     image_key = item.get('imageKey')
-    image_url = s3.generate_presigned_url(
-        'get_object',
-        Params={
-            'Bucket': IMAGE_BUCKET,
-            'Key': image_key
-        },
-        ExpiresIn=3600
-    )
+    image_url = get_image_url(image_key)
     
     # Format the response
     results = {
@@ -360,67 +851,403 @@ def get_image_results(user_id, image_id):
         'createdAt': item.get('createdAt'),
         'status': item.get('status'),
         'fileName': item.get('fileName', 'unknown'),
-        'results': item.get('results', {})
+        'analysisProfile': item.get('analysisProfile', 'full'),
+        'results': decode_results(unpack_results(item, s3, IMAGE_BUCKET)),
+        'changesCursor': changes_cursor
     }
+    # Sections the detectors have stored while the rest still run
+    if item.get(PARTIAL_RESULTS):
+        results['results'] = {**decode_results(unpack_sections(item)), **results['results']}
+    if item.get(ANALYSIS_PROGRESS):
+        results['analysisProgress'] = item[ANALYSIS_PROGRESS]
+    if item.get('rejection'):
+        results['rejection'] = item['rejection']
     
     return {
         'statusCode': 200,
-        'headers': get_cors_headers(),
-        'body': json.dumps(results, cls=DecimalEncoder)
+        'headers': get_cors_headers(etag),
+        'body': dumps_json(results)
     }
 
-def get_user_id(event):
+def search_images(user_id, query_params, if_none_match=None):
     """
-    Extract user ID from Cognito JWT token or query parameter
+    Find the user's images by label, moderation label, celebrity name or
+    word of detected text, through the search index.
+
+    Query parameters: 'q', comma-separated terms; 'op', 'and' (images with
+    every term, the default) or 'or' (with any term); 'minConfidence', the
+    confidence (0-100) a term must reach in an image; 'field', to match
+    only one source (label, moderation, celebrity or text); 'limit' and
+    'nextToken' for pagination. Matches are newest first, with the lowest
+    ('and') or highest ('or') confidence of their terms. Each term costs an
+    index query, and only the returned page is read from the results table.
     """
-    # For backwards compatibility and testing, still allow query parameter
-    query_params = event.get('queryStringParameters') or {}
-    user_id = query_params.get('userId')
-    if user_id:
-        return user_id
+    try:
+        terms = list(dict.fromkeys(
+            term for term in (search_index.normalize_term(part) for part in (query_params.get('q') or '').split(',')) if term
+        ))
+        op = (query_params.get('op') or 'and').lower()
+        min_confidence = float(query_params.get('minConfidence') or 0)
+        field = query_params.get('field') or None
+        limit = max(1, min(int(query_params.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        after = decode_search_token(query_params.get('nextToken'))
+        
+        if not terms or len(terms) > MAX_SEARCH_TERMS:
+            raise ValueError(f"q must name 1 to {MAX_SEARCH_TERMS} comma-separated terms")
+        if op not in ('and', 'or'):
+            raise ValueError("op must be 'and' or 'or'")
+        if not 0 <= min_confidence <= 100:
+            raise ValueError("minConfidence must be between 0 and 100")
+        if field and field not in search_index.SOURCES:
+            raise ValueError(f"field must be one of {', '.join(search_index.SOURCES)}")
+    except (ValueError, TypeError) as validation_error:
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': str(validation_error)})
+        }
     
-    # Get the Authorization header
-    headers = event.get('headers') or {}
-    auth_header = headers.get('Authorization') or headers.get('authorization')
+    if not search_index.SEARCH_INDEX_TABLE:
+        return {
+            'statusCode': 404,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Search not available'})
+        }
     
-    if not auth_header:
+    version = current_version(user_id)
+    etag = None
+    if version is not None:
+        etag = make_etag(version, 'search', get_window(), terms, op, min_confidence, field, limit,
+                         query_params.get('nextToken') or '')
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    # imageId -> (createdAt, confidence) of the images matching so far
+    table = dynamodb.Table(search_index.SEARCH_INDEX_TABLE)
+    matches = None
+    for term in terms:
+        postings = query_postings(table, user_id, term, min_confidence, field)
+        if matches is None:
+            matches = postings
+        elif op == 'and':
+            matches = {
+                image_id: (created_at, min(confidence, postings[image_id][1]))
+                for image_id, (created_at, confidence) in matches.items() if image_id in postings
+            }
+        else:
+            for image_id, (created_at, confidence) in postings.items():
+                if image_id not in matches or confidence > matches[image_id][1]:
+                    matches[image_id] = (created_at, confidence)
+        
+        # Nothing can match every term any more
+        if op == 'and' and not matches:
+            break
+    
+    ordered = sorted(((created_at, image_id, confidence) for image_id, (created_at, confidence) in matches.items()), reverse=True)
+    if after:
+        ordered = [match for match in ordered if (match[0], match[1]) < after]
+    page = ordered[:limit]
+    next_token = encode_search_token(page[-1][0], page[-1][1]) if len(ordered) > limit else None
+    
+    # Read the gallery fields for the page only
+    items = batch_get_image_keys(
+        user_id, [image_id for _, image_id, _ in page],
+        projection="imageId, imageKey, createdAt, #status, fileName", names={'#status': 'status'}
+    )
+    items_by_id = {item['imageId']: item for item in items}
+    
+    images = []
+    for created_at, image_id, confidence in page:
+        item = items_by_id.get(image_id)
+        # Deleted since it was indexed; the index catches up from the stream
+        if not item or not item.get('imageKey'):
+            continue
+        images.append({
+            'imageId': image_id,
+            'imageUrl': get_image_url(item['imageKey']),
+            'createdAt': item.get('createdAt', created_at),
+            'status': item.get('status', 'pending'),
+            'fileName': item.get('fileName', 'unknown'),
+            'confidence': confidence
+        })
+    
+    print(f"Search {op} {terms} for user {user_id}: {len(ordered)} matches, returning {len(images)}")
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(etag),
+        'body': dumps_json({'images': images, 'nextToken': next_token, 'totalMatches': len(matches)})
+    }
+
+def query_postings(table, user_id, term, min_confidence=0, field=None):
+    """
+    {imageId: (createdAt, confidence)} of the user's postings for a term
+    """
+    query_args = {
+        'KeyConditionExpression': "userTerm = :term",
+        'ExpressionAttributeValues': {
+            ":term": search_index.posting_key(user_id, term)
+        },
+        'ProjectionExpression': "imageId, confidence, createdAt",
+        'Limit': SEARCH_QUERY_PAGE_SIZE
+    }
+    filters = []
+    if min_confidence > 0:
+        filters.append("confidence >= :minConfidence")
+        query_args['ExpressionAttributeValues'][':minConfidence'] = decimal.Decimal(str(min_confidence))
+    if field:
+        filters.append("contains(sources, :field)")
+        query_args['ExpressionAttributeValues'][':field'] = field
+    if filters:
+        query_args['FilterExpression'] = ' AND '.join(filters)
+    
+    postings = {}
+    while True:
+        response = table.query(**query_args)
+        for item in response.get('Items', []):
+            postings[item['imageId']] = (item.get('createdAt', 0), item['confidence'])
+        if not response.get('LastEvaluatedKey'):
+            return postings
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def encode_search_token(created_at, image_id):
+    """
+    Opaque token for the position after the match (created_at, image_id)
+    """
+    token_json = dumps_json([created_at, image_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(token_json.encode('utf-8')).decode('ascii')
+
+def decode_search_token(token):
+    """
+    (createdAt, imageId) of a search page token (raises ValueError if malformed)
+    """
+    if not token:
         return None
     
     try:
-        # Remove 'Bearer ' prefix if present
-        if auth_header.startswith('Bearer '):
-            auth_header = auth_header[7:]
-
-        # Parse JWT token (simplified, in a real app use proper JWT library)
-        # This assumes the Authorization header contains the JWT directly
-        # In a real production app, you would verify the JWT signature
-        token_parts = auth_header.split('.')
-        if len(token_parts) != 3:
-            return None
-        
-        # Decode the payload
-        payload_b64 = token_parts[1]
-        # Add padding if needed
-        payload_b64 += '=' * ((4 - len(payload_b64) % 4) % 4)
-        # Convert to standard base64
-        payload_b64 = payload_b64.replace('-', '+').replace('_', '/')
-        
-        # Decode and parse JSON
-        payload = json.loads(base64.b64decode(payload_b64).decode('utf-8'))
-        
-        # Extract sub (user ID) from token
-        return payload.get('sub')
+        created_at, image_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        return decimal.Decimal(str(created_at)), str(image_id)
+    except Exception:
+        raise ValueError("Malformed nextToken")
+
+def current_changes_cursor(user_id):
+    """
+    Cursor at the newest event of the user's status feed, or None when the
+    feed is not configured or cannot be read
+    """
+    if not status_events.STATUS_EVENTS_TABLE:
+        return None
+    
+    try:
+        table = dynamodb.Table(status_events.STATUS_EVENTS_TABLE)
+        return status_events.encode_cursor(status_events.latest_seq(table, user_id))
     except Exception as e:
-        print(f"Error parsing token: {str(e)}")
+        print(f"Error reading status feed position: {str(e)}")
         return None
 
-def get_cors_headers():
+def get_changes(user_id, query_params, context=None):
     """
-    Return CORS headers for all responses
+    Long-poll the user's status feed.
+
+    Returns the status changes after the 'cursor' query parameter as soon as
+    there are any, or an empty list once 'wait' seconds (at most
+    FEED_MAX_WAIT_SECONDS) have passed, together with the cursor for the
+    next request. Without a cursor the response only carries the current
+    one. 'reset' means the cursor is too old for the feed to be complete:
+    the client should reload the images and continue from the new cursor.
     """
+    if not status_events.STATUS_EVENTS_TABLE:
+        return {
+            'statusCode': 404,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Status feed not available'})
+        }
+    
+    try:
+        wait = min(max(0, int(query_params.get('wait') or FEED_MAX_WAIT_SECONDS)), FEED_MAX_WAIT_SECONDS)
+        cursor = query_params.get('cursor')
+        seq, issued_at = status_events.decode_cursor(cursor) if cursor else (None, None)
+    except (ValueError, TypeError):
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Invalid cursor or wait'})
+        }
+    
+    table = dynamodb.Table(status_events.STATUS_EVENTS_TABLE)
+    if seq is None or status_events.is_expired(issued_at):
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'changes': [],
+                'cursor': status_events.encode_cursor(status_events.latest_seq(table, user_id)),
+                'reset': seq is not None
+            })
+        }
+    
+    # Stay inside both the requested wait and the invocation's time limit
+    deadline = time.time() + wait
+    if context:
+        deadline = min(deadline, time.time() + (context.get_remaining_time_in_millis() - FEED_TIME_MARGIN_MS) / 1000)
+    
+    while True:
+        events = status_events.read_events(table, user_id, seq)
+        if events or time.time() + FEED_POLL_SECONDS > deadline:
+            break
+        time.sleep(FEED_POLL_SECONDS)
+    
+    if events:
+        seq = events[-1]['seq']
+    
     return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps({
+            'changes': [status_events.public_event(item) for item in events],
+            'cursor': status_events.encode_cursor(seq),
+            'reset': False
+        })
+    }
+
+def get_stats(user_id, query_params):
+    """
+    Dashboard statistics for the user's library, served from the
+    incrementally maintained rollup item in a single read. 'top' bounds the
+    labels and celebrities returned.
+    """
+    if not user_stats.USER_STATS_TABLE:
+        return {
+            'statusCode': 404,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Statistics not available'})
+        }
+
+    try:
+        top = max(1, min(int(query_params.get('top') or DEFAULT_STATS_TOP), MAX_STATS_TOP))
+    except (ValueError, TypeError):
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Invalid top'})
+        }
+
+    try:
+        table = dynamodb.Table(user_stats.USER_STATS_TABLE)
+        item = table.get_item(Key={'userId': user_id}).get('Item')
+
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps(user_stats.format_stats(item, top))
+        }
+    except Exception as e:
+        print(f"Error reading stats: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Error reading statistics'})
+        }
+
+def get_duplicate_groups(user_id):
+    """
+    The user's groups of near-duplicate images, largest first, for the
+    gallery to show each group as one stack
+    """
+    if not perceptual_hash.HASH_INDEX_TABLE:
+        return {
+            'statusCode': 404,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Duplicate detection not available'})
+        }
+
+    try:
+        table = dynamodb.Table(perceptual_hash.HASH_INDEX_TABLE)
+        query_args = {
+            'KeyConditionExpression': "#bucket = :bucket",
+            'ExpressionAttributeNames': {'#bucket': 'bucket', '#ref': 'ref'},
+            'ExpressionAttributeValues': {':bucket': perceptual_hash.group_key(user_id)},
+            'ProjectionExpression': "#ref, groupId"
+        }
+        groups = {}
+        while True:
+            response = table.query(**query_args)
+            for item in response.get('Items', []):
+                groups.setdefault(item['groupId'], []).append(item['ref'])
+            if not response.get('LastEvaluatedKey'):
+                break
+            query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        # A group whose other members were all deleted is no group any more
+        body = [
+            {'groupId': group_id, 'imageIds': sorted(image_ids)}
+            for group_id, image_ids in groups.items() if len(image_ids) > 1
+        ]
+        body.sort(key=lambda group: (-len(group['imageIds']), group['groupId']))
+
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'groups': body})
+        }
+    except Exception as e:
+        print(f"Error reading duplicate groups: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'message': 'Error reading duplicate groups'})
+        }
+
+def get_header(event, name):
+    """
+    Value of a request header, matched case-insensitively
+    """
+    name = name.lower()
+    for header, value in (event.get('headers') or {}).items():
+        if header.lower() == name:
+            return value
+    return None
+
+def not_modified(etag):
+    """
+    304 response for a conditional read whose ETag still matches
+    """
+    return {
+        'statusCode': 304,
+        'headers': get_cors_headers(etag),
+        'body': ''
+    }
+
+def get_user_id(event):
+    """
+    Return the user ID (sub) of a verified Cognito token in the Authorization header
+    """
+    headers = event.get('headers') or {}
+    auth_header = headers.get('Authorization') or headers.get('authorization')
+    
+    if not auth_header:
+        return None
+    
+    # Remove 'Bearer ' prefix if present
+    if auth_header.startswith('Bearer '):
+        auth_header = auth_header[7:]
+    
+    claims = verify_token(auth_header)
+    return claims.get('sub') if claims else None
+
+def get_cors_headers(etag=None):
+    """
+    Return CORS headers for all responses, with caching headers for a
+    versioned representation when 'etag' is given
+    """
+    headers = {
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match',
         'Access-Control-Allow-Methods': 'OPTIONS,GET,POST,DELETE',
+        'Access-Control-Expose-Headers': 'ETag',
         'Content-Type': 'application/json'
-    }
\ No newline at end of file
+    }
+    if etag:
+        # Browsers keep the body and revalidate it with If-None-Match on every request
+        headers['ETag'] = etag
+        headers['Cache-Control'] = 'private, no-cache'
+    return headers
\ No newline at end of file
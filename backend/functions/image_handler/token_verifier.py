@@ -0,0 +1,171 @@
+"""
+Verification of the Cognito tokens sent in the Authorization header.
+
+Tokens are checked against the user pool's JWKS (RS256 signature, issuer,
+audience/client, token_use and expiry). Two in-memory caches keep this off
+the hot path of warm invocations:
+
+- the JWKS, parsed into key objects, is reused for JWKS_TTL_SECONDS and
+  refreshed on a background thread during the last JWKS_REFRESH_AHEAD_SECONDS
+  of that window, so requests rarely wait on the fetch. An unknown 'kid'
+  (key rotation) forces a refresh, at most once per JWKS_MIN_REFRESH_SECONDS.
+  A failed fetch is retried on the same spacing; until one succeeds, tokens
+  are rejected without waiting on the JWKS endpoint.
+- the claims of tokens that already verified are kept in a bounded LRU keyed
+  by the token's SHA-256 until the token's 'exp', so polling the gallery
+  with the same token costs a hash and a dict lookup.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from jose import jwk, jwt
+
+USER_POOL_ID = os.environ.get('USER_POOL_ID')
+CLIENT_ID = os.environ.get('CLIENT_ID')
+REGION = os.environ.get('AWS_REGION', os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+ISSUER = f"https://cognito-idp.{REGION}.amazonaws.com/{USER_POOL_ID}"
+
+# Overridable so the benchmarks can point at a local JWKS stand-in
+JWKS_URL = os.environ.get('JWKS_URL', f"{ISSUER}/.well-known/jwks.json")
+
+# How long a fetched JWKS is trusted
+JWKS_TTL_SECONDS = int(os.environ.get('JWKS_TTL_SECONDS', 3600))
+
+# Start a background refresh this long before the JWKS expires
+JWKS_REFRESH_AHEAD_SECONDS = int(os.environ.get('JWKS_REFRESH_AHEAD_SECONDS', 300))
+
+# Minimum spacing of refreshes triggered by unknown key IDs
+JWKS_MIN_REFRESH_SECONDS = int(os.environ.get('JWKS_MIN_REFRESH_SECONDS', 60))
+
+JWKS_FETCH_TIMEOUT_SECONDS = 3
+
+# Upper bound on verified tokens kept by a warm container
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 1000))
+
+ALGORITHMS = ['RS256']
+
+_keys = {}
+_keys_fetched_at = 0
+_keys_lock = threading.Lock()
+_refresh_thread = None
+_token_cache = OrderedDict()
+
+def verify_token(token, now=None):
+    """
+    Return the claims of a valid Cognito ID or access token, or None
+    """
+    now = time.time() if now is None else now
+    token_hash = hashlib.sha256(token.encode('utf-8')).digest()
+
+    cached = _token_cache.get(token_hash)
+    if cached is not None:
+        if cached['exp'] > now:
+            _token_cache.move_to_end(token_hash)
+            return cached
+        del _token_cache[token_hash]
+
+    try:
+        header = jwt.get_unverified_header(token)
+        key = get_signing_key(header.get('kid'), now)
+        if key is None:
+            print(f"Unknown token signing key: {header.get('kid')}")
+            return None
+
+        # Audience is checked below since access tokens carry client_id instead
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=ALGORITHMS,
+            issuer=ISSUER,
+            options={'verify_aud': False, 'verify_at_hash': False, 'require_exp': True}
+        )
+    except Exception as e:
+        print(f"Rejected token: {str(e)}")
+        return None
+
+    token_use = claims.get('token_use')
+    client_id = claims.get('aud') if token_use == 'id' else claims.get('client_id')
+    if token_use not in ('id', 'access') or client_id != CLIENT_ID:
+        print(f"Rejected token: wrong token_use or client ({token_use}, {client_id})")
+        return None
+
+    _token_cache[token_hash] = claims
+    if len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+        _token_cache.popitem(last=False)
+
+    return claims
+
+def get_signing_key(kid, now=None):
+    """
+    Return the JWKS key for 'kid', refreshing the cached JWKS as needed
+    """
+    now = time.time() if now is None else now
+    age = now - _keys_fetched_at
+
+    if not _keys:
+        # First request, or the last fetch failed: retry at most once per
+        # JWKS_MIN_REFRESH_SECONDS and reject tokens in between rather than
+        # stalling every request on a JWKS endpoint that is down
+        if age < JWKS_MIN_REFRESH_SECONDS:
+            print(f"No signing keys loaded; next JWKS fetch in {JWKS_MIN_REFRESH_SECONDS - age:.0f}s")
+            return None
+        refresh_keys()
+    elif age >= JWKS_TTL_SECONDS:
+        refresh_keys()
+    elif age >= JWKS_TTL_SECONDS - JWKS_REFRESH_AHEAD_SECONDS:
+        start_background_refresh()
+
+    key = _keys.get(kid)
+    if key is None and time.time() - _keys_fetched_at >= JWKS_MIN_REFRESH_SECONDS:
+        refresh_keys()
+        key = _keys.get(kid)
+
+    return key
+
+def refresh_keys():
+    """
+    Fetch the JWKS and replace the cached keys (keeps the old keys on error)
+    """
+    global _keys, _keys_fetched_at
+
+    with _keys_lock:
+        try:
+            with urllib.request.urlopen(JWKS_URL, timeout=JWKS_FETCH_TIMEOUT_SECONDS) as response:
+                jwks = json.loads(response.read().decode('utf-8'))
+
+            _keys = {
+                key_data['kid']: jwk.construct(key_data, key_data.get('alg', ALGORITHMS[0]))
+                for key_data in jwks.get('keys', [])
+            }
+            print(f"Loaded {len(_keys)} signing keys from {JWKS_URL}")
+        except Exception as e:
+            print(f"Error fetching JWKS: {str(e)}")
+        finally:
+            # Also throttles retries when the fetch failed
+            _keys_fetched_at = time.time()
+
+def start_background_refresh():
+    """
+    Refresh the JWKS on a daemon thread unless a refresh is already running
+    """
+    global _refresh_thread
+
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        return
+
+    _refresh_thread = threading.Thread(target=refresh_keys, daemon=True)
+    _refresh_thread.start()
+
+def clear_caches():
+    """
+    Drop cached keys and verified tokens (used by benchmarks)
+    """
+    global _keys, _keys_fetched_at
+    _keys = {}
+    _keys_fetched_at = 0
+    _token_cache.clear()
@@ -0,0 +1,144 @@
+"""
+Cached SigV4 presigning of S3 GET URLs for the gallery and results endpoints.
+
+boto3's generate_presigned_url stamps every URL with the current time, so no
+two gallery loads ever return the same URL and the browser cannot cache the
+images. Here the signing time is rounded down to a fixed window: every request
+in the same window gets a byte-identical URL, which is memoized per
+(bucket, key, window) across warm invocations. The derived SigV4 signing key
+only changes once a day, so it is cached as well.
+"""
+import datetime
+import hashlib
+import hmac
+import os
+import time
+from urllib.parse import quote
+
+# Length of a signing window; URLs are identical within one window
+URL_WINDOW_SECONDS = int(os.environ.get('URL_WINDOW_SECONDS', 900))
+
+# Minimum time a URL stays valid after it is handed out
+URL_MIN_VALIDITY_SECONDS = int(os.environ.get('URL_MIN_VALIDITY_SECONDS', 3600))
+
+# Upper bound on memoized URLs kept by a warm container
+URL_CACHE_MAX_ENTRIES = int(os.environ.get('URL_CACHE_MAX_ENTRIES', 20000))
+
+# SigV4 caps presigned URL lifetime at 7 days
+MAX_EXPIRES_SECONDS = 7 * 24 * 3600
+
+_url_cache = {}
+_url_cache_window = None
+_signing_keys = {}
+
+def get_window(now=None):
+    """
+    Return the start of the signing window containing 'now'
+    """
+    now = int(time.time() if now is None else now)
+    return now - (now % URL_WINDOW_SECONDS)
+
+def presign_get_object(bucket, key, credentials, region, now=None):
+    """
+    Return a presigned GET URL for an S3 object, reusing the URL already
+    signed for this key in the current window when there is one.
+
+    'credentials' needs access_key, secret_key and token attributes (boto3
+    frozen credentials). The URL is valid for at least
+    URL_MIN_VALIDITY_SECONDS from 'now'.
+    """
+    global _url_cache_window
+
+    window = get_window(now)
+
+    # Entries from older windows can never be served again
+    if window != _url_cache_window or len(_url_cache) >= URL_CACHE_MAX_ENTRIES:
+        _url_cache.clear()
+        _url_cache_window = window
+
+    # Rotated credentials must produce new URLs
+    cache_key = (bucket, key, credentials.access_key)
+    url = _url_cache.get(cache_key)
+    if url is None:
+        url = sign_get_object(bucket, key, credentials, region, window)
+        _url_cache[cache_key] = url
+
+    return url
+
+def sign_get_object(bucket, key, credentials, region, signing_time):
+    """
+    Build a SigV4 query-string signed GET URL as of 'signing_time'
+    """
+    timestamp = datetime.datetime.utcfromtimestamp(signing_time)
+    amz_date = timestamp.strftime('%Y%m%dT%H%M%SZ')
+    date_stamp = timestamp.strftime('%Y%m%d')
+    credential_scope = f"{date_stamp}/{region}/s3/aws4_request"
+    expires = min(URL_WINDOW_SECONDS + URL_MIN_VALIDITY_SECONDS, MAX_EXPIRES_SECONDS)
+
+    host = f"{bucket}.s3.{region}.amazonaws.com"
+    canonical_uri = '/' + quote(key, safe='/~')
+
+    query = {
+        'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+        'X-Amz-Credential': f"{credentials.access_key}/{credential_scope}",
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': str(expires),
+        'X-Amz-SignedHeaders': 'host'
+    }
+    if credentials.token:
+        query['X-Amz-Security-Token'] = credentials.token
+
+    canonical_query = '&'.join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+
+    canonical_request = '\n'.join([
+        'GET',
+        canonical_uri,
+        canonical_query,
+        f"host:{host}",
+        '',
+        'host',
+        'UNSIGNED-PAYLOAD'
+    ])
+
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256',
+        amz_date,
+        credential_scope,
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+    ])
+
+    signing_key = get_signing_key(credentials.secret_key, date_stamp, region)
+    signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    return f"https://{host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+def get_signing_key(secret_key, date_stamp, region):
+    """
+    Derive (or reuse) the SigV4 signing key for a day, region and the s3 service
+    """
+    cache_key = (secret_key, date_stamp, region)
+    signing_key = _signing_keys.get(cache_key)
+    if signing_key is None:
+        k_date = hmac.new(f"AWS4{secret_key}".encode('utf-8'), date_stamp.encode('utf-8'), hashlib.sha256).digest()
+        k_region = hmac.new(k_date, region.encode('utf-8'), hashlib.sha256).digest()
+        k_service = hmac.new(k_region, b's3', hashlib.sha256).digest()
+        signing_key = hmac.new(k_service, b'aws4_request', hashlib.sha256).digest()
+
+        # Only the current day's key (per credentials) is ever needed
+        if len(_signing_keys) > 16:
+            _signing_keys.clear()
+        _signing_keys[cache_key] = signing_key
+
+    return signing_key
+
+def clear_caches():
+    """
+    Drop memoized URLs and signing keys (used by benchmarks)
+    """
+    global _url_cache_window
+    _url_cache.clear()
+    _signing_keys.clear()
+    _url_cache_window = None
\ No newline at end of file
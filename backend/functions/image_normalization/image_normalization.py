@@ -0,0 +1,148 @@
+import io
+import os
+import time
+from PIL import Image, ImageOps
+import aws_clients
+from metrics import instrument
+
+# Initialize AWS clients
+s3 = aws_clients.client('s3')
+
+# Get environment variables
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+# Longest side of the derivative sent to Rekognition
+MAX_DIMENSION = int(os.environ.get('NORMALIZE_MAX_DIMENSION', 1920))
+
+# Originals at or below this size in a Rekognition format are analyzed as-is
+MAX_PASSTHROUGH_BYTES = int(os.environ.get('NORMALIZE_MAX_PASSTHROUGH_BYTES', 5 * 1024 * 1024))
+
+# Prefix for derivatives; workflow_trigger ignores it and a lifecycle rule expires it
+DERIVED_PREFIX = os.environ.get('DERIVED_PREFIX', 'derived/')
+
+# Bytes read to sniff format, dimensions and EXIF orientation
+HEADER_BYTES = 64 * 1024
+
+JPEG_QUALITY = 90
+
+# Refuse decompression bombs rather than running out of memory
+Image.MAX_IMAGE_PIXELS = int(os.environ.get('NORMALIZE_MAX_PIXELS', 100_000_000))
+
+# EXIF tag holding the image orientation
+EXIF_ORIENTATION = 0x0112
+
+@instrument('ImageNormalization')
+def lambda_handler(event, context):
+    """
+    Produce a Rekognition-friendly derivative of an uploaded image.
+
+    JPEG/PNG originals that are small enough, within MAX_DIMENSION and not
+    EXIF-rotated are passed through untouched. Everything else (GIF, BMP,
+    oversized or rotated images) is decoded, rotated upright, downscaled and
+    re-encoded as JPEG (PNG when there is transparency) under DERIVED_PREFIX.
+    The detectors analyze 'analysisKey'.
+    """
+    try:
+        image_key = event.get('imageKey')
+        if not image_key:
+            raise ValueError("No image key provided")
+
+        print(f"Normalizing image: {image_key}")
+        start_time = time.time()
+
+        head = s3.head_object(Bucket=IMAGE_BUCKET, Key=image_key)
+        original_bytes = head.get('ContentLength', 0)
+
+        # Sniff the header first so most uploads never need a full download
+        header = s3.get_object(
+            Bucket=IMAGE_BUCKET,
+            Key=image_key,
+            Range=f"bytes=0-{HEADER_BYTES - 1}"
+        )['Body'].read()
+        image_format, width, height, orientation = read_header(header)
+
+        if needs_normalization(image_format, width, height, orientation, original_bytes):
+            analysis_key, analysis_format, width, height, analysis_bytes = normalize_image(image_key)
+        else:
+            analysis_key, analysis_format, analysis_bytes = image_key, image_format, original_bytes
+
+        result = {
+            'analysisKey': analysis_key,
+            'normalized': analysis_key != image_key,
+            'format': analysis_format,
+            'width': width,
+            'height': height,
+            'originalBytes': original_bytes,
+            'analysisBytes': analysis_bytes
+        }
+
+        print(f"Normalization finished in {time.time() - start_time:.3f}s: {result}")
+        return result
+    except Exception as e:
+        print(f"Error normalizing image: {str(e)}")
+        raise
+
+def read_header(header):
+    """
+    Return (format, width, height, orientation) from the first bytes of an
+    image, or (None, 0, 0, 1) when the header alone is not enough
+    """
+    try:
+        with Image.open(io.BytesIO(header)) as img:
+            orientation = 1
+            if img.format == 'JPEG':
+                orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+            return img.format, img.width, img.height, orientation
+    except Exception as e:
+        print(f"Could not read image header: {str(e)}")
+        return None, 0, 0, 1
+
+def needs_normalization(image_format, width, height, orientation, size_bytes):
+    """
+    Decide whether Rekognition can take the original as-is
+    """
+    return (
+        image_format not in ('JPEG', 'PNG')
+        or size_bytes > MAX_PASSTHROUGH_BYTES
+        or max(width, height) > MAX_DIMENSION
+        or orientation != 1
+    )
+
+def normalize_image(image_key):
+    """
+    Write an upright, downscaled JPEG/PNG derivative and return
+    (key, format, width, height, size in bytes)
+    """
+    # Pillow needs a seekable file, so buffer the body in memory
+    body = s3.get_object(Bucket=IMAGE_BUCKET, Key=image_key)['Body']
+    source = io.BytesIO(body.read())
+
+    with Image.open(source) as img:
+        # Let the JPEG decoder skip detail we would throw away anyway
+        if img.format == 'JPEG':
+            img.draft('RGB', (MAX_DIMENSION, MAX_DIMENSION))
+
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        output = io.BytesIO()
+        if has_alpha:
+            img.convert('RGBA').save(output, format='PNG', optimize=True)
+            output_format, extension = 'PNG', '.png'
+        else:
+            img.convert('RGB').save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            output_format, extension = 'JPEG', '.jpg'
+
+        width, height = img.width, img.height
+
+    analysis_key = f"{DERIVED_PREFIX}{os.path.splitext(image_key)[0]}{extension}"
+    s3.put_object(
+        Bucket=IMAGE_BUCKET,
+        Key=analysis_key,
+        Body=output.getvalue(),
+        ContentType=f"image/{output_format.lower()}"
+    )
+
+    print(f"Wrote {output_format} derivative {analysis_key} ({width}x{height}, {output.tell()} bytes)")
+    return analysis_key, output_format, width, height, output.tell()
\ No newline at end of file
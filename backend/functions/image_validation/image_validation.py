@@ -1,48 +1,257 @@
-import json
 import os
+import struct
 import time
+from botocore.exceptions import ClientError
+import aws_clients
+from metrics import instrument
 
+# Initialize AWS clients
+s3 = aws_clients.client('s3')
+
+# Get environment variables
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+# Largest upload accepted; the normalizer downsizes anything Rekognition
+# would refuse, but it has to hold the whole file in memory to do so
+MAX_IMAGE_BYTES = int(os.environ.get('VALIDATION_MAX_BYTES', 50 * 1024 * 1024))
+
+# Largest image accepted, kept below the normalizer's decompression-bomb
+# limit so every image that passes here can be decoded
+MAX_IMAGE_PIXELS = int(os.environ.get('VALIDATION_MAX_PIXELS', 50_000_000))
+
+VALID_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
+
+# Bytes read per range GET while parsing a header
+HEADER_BYTES = 16 * 1024
+
+# JPEG metadata segments (EXIF thumbnails, ICC profiles) can push the frame
+# header past the first read; follow them for this many reads at most, then
+# leave the dimensions to normalization, which decodes the image anyway
+MAX_HEADER_READS = 4
+
+# Bytes read from the end of PNG and GIF files to find their end marker
+TAIL_BYTES = 64
+
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP')
+]
+
+EXTENSION_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.bmp': 'BMP'}
+
+# JPEG start-of-frame markers (the ones carrying the dimensions)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+
+@instrument('ImageValidation')
 def lambda_handler(event, context):
     """
-    Lightweight validation of image parameters before processing
+    Check an upload before any analysis runs on it.
+
+    The object's size comes from head_object, and its format and dimensions
+    from a few KB of header read with range GETs. Nothing is decoded. Empty,
+    oversized, truncated and unrecognized files and images with too many
+    pixels are rejected with 'reasons', a list of {code, message}, so the
+    workflow records the failure without calling Rekognition.
+
+    Only the file itself is grounds for rejection. S3 errors other than a
+    missing object, timeouts and unexpected exceptions are raised, so the
+    state machine retries them instead of failing a valid image for good.
     """
+    # Get the image key from the event
+    image_key = event.get('imageKey')
+    user_id = event.get('userId')
+
+    print(f"Validating image: {image_key}")
+
+    if not image_key or not user_id:
+        return rejected(image_key, user_id, [reason('missing-parameters', 'Missing required parameters')])
+
+    file_extension = os.path.splitext(image_key)[1].lower()
+    if file_extension not in VALID_EXTENSIONS:
+        return rejected(image_key, user_id, [reason('unsupported-extension', f"Unsupported file extension '{file_extension}'")])
+
     try:
-        # Get the image key from the event
-        image_key = event.get('imageKey')
-        user_id = event.get('userId')
-        
-        print(f"Validating image: {image_key}")
-        
-        if not image_key or not user_id:
-            return {
-                'imageKey': image_key,
-                'userId': user_id,
-                'valid': False,
-                'validationMessage': 'Missing required parameters'
-            }
-        
-        # Simple validation - check file extension
-        valid_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp']
-        file_extension = os.path.splitext(image_key)[1].lower()
-        is_valid = file_extension in valid_extensions
-        
-        result = {
-            'imageKey': image_key,
-            'userId': user_id,
-            'valid': is_valid,
-            'timestamp': int(time.time()),
-            'validationMessage': 'Image appears valid' if is_valid else 'Invalid image format'
-        }
-        
-        print(f"Validation result: {result}")
-        return result
-        
-    except Exception as e:
-        print(f"Error validating image: {str(e)}")
-        return {
-            'imageKey': event.get('imageKey', ''),
-            'userId': event.get('userId', ''),
-            'valid': False,
-            'timestamp': int(time.time()),
-            'validationMessage': f'Error during validation: {str(e)}'
-        }
\ No newline at end of file
+        size_bytes = s3.head_object(Bucket=IMAGE_BUCKET, Key=image_key)['ContentLength']
+
+        if size_bytes == 0:
+            return rejected(image_key, user_id, [reason('empty', 'The file is empty')], size_bytes=0)
+        if size_bytes > MAX_IMAGE_BYTES:
+            return rejected(image_key, user_id, [
+                reason('too-large', f"The file is {size_bytes} bytes, more than the {MAX_IMAGE_BYTES} allowed")
+            ], size_bytes=size_bytes)
+
+        header = read_range(image_key, 0, HEADER_BYTES)
+        image_format = sniff_format(header)
+        if not image_format:
+            return rejected(image_key, user_id, [
+                reason('unrecognized-format', 'The file is not a JPEG, PNG, GIF or BMP image')
+            ], size_bytes=size_bytes)
+
+        width, height, problem = read_dimensions(image_key, image_format, header, size_bytes)
+    except ClientError as e:
+        # Deleted since the upload (head_object or one of the range GETs)
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return rejected(image_key, user_id, [reason('missing-object', 'The uploaded file no longer exists')])
+        raise
+    except (struct.error, IndexError, ValueError) as e:
+        return rejected(image_key, user_id, [
+            reason('corrupt', f"The image header could not be parsed: {str(e)}")
+        ], size_bytes=size_bytes)
+
+    reasons = [problem] if problem else []
+    if not problem and width is None:
+        print(f"No dimensions in the first {MAX_HEADER_READS} header reads; leaving them to normalization")
+    elif not problem:
+        if not width or not height:
+            reasons.append(reason('invalid-dimensions', f"The image declares a size of {width}x{height}"))
+        elif width * height > MAX_IMAGE_PIXELS:
+            reasons.append(reason(
+                'too-many-pixels',
+                f"The image is {width}x{height}, more than the {MAX_IMAGE_PIXELS} pixels allowed"
+            ))
+
+    result = {
+        'imageKey': image_key,
+        'userId': user_id,
+        'valid': not reasons,
+        'timestamp': int(time.time()),
+        'validationMessage': reasons[0]['message'] if reasons else 'Image appears valid',
+        'reasons': reasons,
+        'format': image_format,
+        'declaredFormat': EXTENSION_FORMATS[file_extension],
+        'width': width,
+        'height': height,
+        'sizeBytes': size_bytes
+    }
+
+    print(f"Validation result: {result}")
+    return result
+
+def reason(code, message):
+    return {'code': code, 'message': message}
+
+def rejected(image_key, user_id, reasons, size_bytes=None):
+    result = {
+        'imageKey': image_key,
+        'userId': user_id,
+        'valid': False,
+        'timestamp': int(time.time()),
+        'validationMessage': reasons[0]['message'],
+        'reasons': reasons
+    }
+    if size_bytes is not None:
+        result['sizeBytes'] = size_bytes
+    print(f"Validation result: {result}")
+    return result
+
+def read_range(image_key, start, length):
+    """
+    Bytes [start, start + length) of the object (fewer at its end)
+    """
+    return s3.get_object(
+        Bucket=IMAGE_BUCKET,
+        Key=image_key,
+        Range=f"bytes={start}-{start + length - 1}"
+    )['Body'].read()
+
+def sniff_format(header):
+    for signature, image_format in SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+def read_dimensions(image_key, image_format, header, size_bytes):
+    """
+    (width, height, rejection reason or None) of an image whose header
+    starts with 'header'; width and height are None when a JPEG's frame
+    header lies beyond MAX_HEADER_READS reads
+    """
+    truncated = reason('truncated', f"The file ends before its {image_format} header is complete")
+
+    if image_format == 'JPEG':
+        return jpeg_dimensions(image_key, header, size_bytes)
+
+    if image_format == 'PNG':
+        # Signature, then the IHDR chunk: length, type, width, height
+        if len(header) < 24:
+            return 0, 0, truncated
+        if header[12:16] != b'IHDR':
+            return 0, 0, reason('corrupt', 'The PNG file does not start with an IHDR chunk')
+        width, height = struct.unpack('>II', header[16:24])
+        tail = header if size_bytes <= len(header) else read_range(image_key, size_bytes - TAIL_BYTES, TAIL_BYTES)
+        if b'IEND' not in tail[-TAIL_BYTES:]:
+            return width, height, reason('truncated', 'The PNG file has no IEND chunk at its end')
+        return width, height, None
+
+    if image_format == 'GIF':
+        if len(header) < 10:
+            return 0, 0, truncated
+        width, height = struct.unpack('<HH', header[6:10])
+        tail = header if size_bytes <= len(header) else read_range(image_key, size_bytes - TAIL_BYTES, TAIL_BYTES)
+        if not tail.rstrip(b'\x00').endswith(b';'):
+            return width, height, reason('truncated', 'The GIF file has no trailer at its end')
+        return width, height, None
+
+    # BMP: file header, then a core (12-byte) or info (40+ byte) header
+    if len(header) < 26:
+        return 0, 0, truncated
+    declared_bytes, dib_size = struct.unpack('<I', header[2:6])[0], struct.unpack('<I', header[14:18])[0]
+    if dib_size == 12:
+        width, height = struct.unpack('<HH', header[18:22])
+    else:
+        width, height = struct.unpack('<ii', header[18:26])
+    if declared_bytes > size_bytes:
+        return abs(width), abs(height), reason(
+            'truncated', f"The BMP file is {size_bytes} bytes but declares {declared_bytes}"
+        )
+    # A negative height marks a top-down bitmap
+    return abs(width), abs(height), None
+
+def jpeg_dimensions(image_key, data, size_bytes):
+    """
+    Walk the JPEG marker segments up to the start-of-frame header. Data
+    after the end marker is allowed (phones append previews and video), so
+    a JPEG only counts as truncated when it ends inside its headers.
+    """
+    base = 0
+    offset = 2
+    reads = 1
+    while True:
+        # Every segment starts with 0xFF (plus optional fill bytes) and a marker
+        start = offset
+        while offset < len(data) and data[offset] == 0xFF:
+            offset += 1
+        # Marker, length, precision, height and width: the most a segment
+        # needs before it can be parsed
+        if offset + 8 > len(data):
+            if base + len(data) >= size_bytes or base + start >= size_bytes:
+                return 0, 0, reason('truncated', 'The JPEG file ends before its frame header')
+            if reads >= MAX_HEADER_READS:
+                # Unusually large metadata, not a broken file
+                return None, None, None
+            # Read on from the start of this segment
+            base += start
+            data = read_range(image_key, base, HEADER_BYTES)
+            offset = 0
+            reads += 1
+            continue
+
+        if offset == start:
+            return 0, 0, reason('corrupt', f"Invalid JPEG marker at byte {base + offset}")
+        marker = data[offset]
+        offset += 1
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            return 0, 0, reason('corrupt', 'The JPEG file has no frame header before its image data')
+        if marker in JPEG_SOF_MARKERS:
+            # Length, precision, height, width
+            height, width = struct.unpack('>HH', data[offset + 3:offset + 7])
+            return width, height, None
+        offset += struct.unpack('>H', data[offset:offset + 2])[0]
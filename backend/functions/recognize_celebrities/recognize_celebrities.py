@@ -1,15 +1,17 @@
 import json
 import os
-import boto3
-import time
+from rekognition_analysis import analyze_celebrities
+from analysis_progress import save_section, record_failure
+from rate_limiter import rate_limited
+from metrics import instrument
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
+# Initialize AWS clients (Rekognition calls go through the shared rate limiter)
+rekognition = rate_limited('rekognition')
 
 # Get environment variables
 IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
 
+@instrument('RecognizeCelebrities')
 def lambda_handler(event, context):
     """
     Recognize celebrities in an image using Amazon Rekognition
@@ -22,51 +24,11 @@ def lambda_handler(event, context):
         
         print(f"Recognizing celebrities for image: {image_key}")
         
-        # Call Rekognition to recognize celebrities
-        response = rekognition.recognize_celebrities(
-            Image={
-                'S3Object': {
-                    'Bucket': IMAGE_BUCKET,
-                    'Name': image_key
-                }
-            }
-        )
+        # Call Rekognition and format the results
+        result = analyze_celebrities(rekognition, IMAGE_BUCKET, image_key)
         
-        # Process and format the results
-        celebrities = []
-        for celebrity in response.get('CelebrityFaces', []):
-            celebrity_info = {
-                'name': celebrity.get('Name'),
-                'confidence': round(celebrity.get('MatchConfidence'), 2),
-                'boundingBox': celebrity.get('Face', {}).get('BoundingBox', {})
-            }
-            
-            # Add URLs if available
-            urls = celebrity.get('Urls', [])
-            if urls:
-                celebrity_info['urls'] = urls
-            
-            celebrities.append(celebrity_info)
-        
-        # Get information about unrecognized faces
-        unrecognized_faces = []
-        for face in response.get('UnrecognizedFaces', []):
-            unrecognized_faces.append({
-                'boundingBox': face.get('BoundingBox', {}),
-                'confidence': round(face.get('Confidence', 0), 2)
-            })
-        
-        # Sort celebrities by confidence
-        celebrities.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-        
-        result = {
-            'timestamp': int(time.time()),
-            'celebrityCount': len(celebrities),
-            'celebrities': celebrities,
-            'unrecognizedFaces': unrecognized_faces
-        }
-        
-        print(f"Recognized {len(celebrities)} celebrities")
+        # Make the section visible before the other detectors finish
+        save_section(event.get('userId'), event.get('imageId'), 'celebrities', result)
         
         return {
             'imageKey': image_key,
@@ -75,4 +37,5 @@ def lambda_handler(event, context):
         }
     except Exception as e:
         print(f"Error recognizing celebrities: {str(e)}")
+        record_failure(event.get('userId'), event.get('imageId'), 'celebrities')
         raise
\ No newline at end of file
@@ -1,29 +1,41 @@
-import decimal
 import json
 import os
-import boto3
 import time
+from result_storage import PARTIAL_RESULTS, pack_results, build_update, unpack_results
+from result_codec import summary_view
+from decimal_json import floats_to_decimals, dumps as dumps_json
+from analysis_profiles import ANALYSIS_NAMES
+from collection_version import bump_version
+from user_stats import contribution, record_contribution
+from analysis_progress import ANALYSIS_PROGRESS, DONE, FAILED, SKIPPED, REUSED
+import aws_clients
+from metrics import instrument
 
 # Initialize AWS clients
-dynamodb = boto3.resource('dynamodb')
+dynamodb = aws_clients.resource('dynamodb')
+s3 = aws_clients.client('s3')
 
 # Get environment variables
 RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+ANALYSIS_CACHE_TABLE = os.environ.get('ANALYSIS_CACHE_TABLE')
 
-def convert_floats_to_decimals(obj):
-    """Convert all floating point numbers to Decimal for DynamoDB"""
-    if isinstance(obj, float):
-        return decimal.Decimal(str(obj))
-    elif isinstance(obj, dict):
-        return {k: convert_floats_to_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_floats_to_decimals(i) for i in obj]
-    else:
-        return obj
+# How long cached results may be reused before DynamoDB TTL evicts them
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', 30 * 24 * 3600))
 
+# Failure messages kept in the summary are cut to this length
+MAX_FAILURE_LENGTH = 300
+
+@instrument('ResultsProcessor')
 def lambda_handler(event, context):
     """
-    Aggregate and store results from all image analysis steps
+    Aggregate and store results from all image analysis steps.
+
+    The detectors have stored their sections as they finished (see
+    analysis_progress); this writes the final layout and summary from
+    every analysis that succeeded. A detector that failed after its
+    retries is listed under summary['failed'] and the image still
+    completes, unless no analysis succeeded at all.
     """
     try:
         # Get user ID and image ID from the event
@@ -44,59 +56,106 @@ def lambda_handler(event, context):
         
         print(f"Processing results for image: {image_id}")
         
-        # Extract results from each analysis step
-        results = {}
-        
-        # Check for label detection results
-        if 'labels' in event:
-            results['labels'] = event['labels'].get('labels', {})
-        
-        # Check for moderation analysis results
-        if 'moderation' in event:
-            results['moderation'] = event['moderation'].get('moderation', {})
+        # Uploads turned away by validation never reached the detectors, and
+        # a failed workflow (ProcessingFailed) has no results to store
+        if event.get('rejection'):
+            return record_rejection(user_id, image_id, image_key, event['rejection'])
+        if event.get('error'):
+            error = event['error']
+            message = failure_message({'error': error.get('Error'), 'cause': error.get('Cause')})
+            mark_failed(user_id, image_id, message)
+            return {
+                'userId': user_id,
+                'imageId': image_id,
+                'imageKey': image_key,
+                'status': 'failed',
+                'error': message
+            }
         
-        # Check for face detection results
-        if 'faces' in event:
-            results['faces'] = event['faces'].get('faces', {})
+        # Extract results from each analysis step; analyses skipped by the
+        # analysis profile or the cascade return {'skipped': True, 'reason': ...}
+        # and failed branches {'failed': True, 'error': ..., 'cause': ...}.
+        # Both are left out, with the reason kept for the summary.
+        results = {}
+        skipped = {}
+        failed = {}
+        for name in ANALYSIS_NAMES:
+            step_result = event.get(name) or {}
+            if name in step_result:
+                results[name] = step_result[name]
+            elif step_result.get('failed'):
+                failed[name] = failure_message(step_result)
+            elif step_result.get('skipped'):
+                skipped[name] = step_result.get('reason', 'profile')
         
-        # Check for celebrity recognition results
-        if 'celebrities' in event:
-            results['celebrities'] = event['celebrities'].get('celebrities', {})
+        # Analyses switched off because a near-duplicate already has them
+        reused = reuse_results(event.get('nearDuplicate'), user_id, results, skipped)
         
-        # Check for text detection results
-        if 'text' in event:
-            results['text'] = event['text'].get('text', {})
+        if failed and not results:
+            raise RuntimeError(f"Every analysis failed: {'; '.join(f'{name}: {message}' for name, message in failed.items())}")
         
-        # Summarize the results
-        summary = generate_summary(results)
+        # Summarize the results (detectors may have used the compact encoding)
+        summary = generate_summary(summary_view(results))
+        summary['analyses'] = [name for name in ANALYSIS_NAMES if name in results]
+        if skipped:
+            summary['skipped'] = skipped
+        if reused:
+            summary['reused'] = reused
+        if failed:
+            summary['failed'] = failed
         results['summary'] = summary
+        progress = final_progress(results, skipped, failed, reused)
         
         # Store results in DynamoDB
         table = dynamodb.Table(RESULTS_TABLE)
 
-        # Convert all float values to Decimal for DynamoDB
-        results_for_dynamo = convert_floats_to_decimals(results)
+        # Lay the results out for the configured storage mode (inline maps with
+        # floats converted to Decimal, or summary plus a compressed blob)
+        result_attributes = pack_results(results, user_id, image_id, floats_to_decimals, s3, IMAGE_BUCKET)
+        set_clause, remove_clause, names, values = build_update(result_attributes)
+        stats_contribution = contribution(results)
         
+        # ALL_OLD returns the contribution this write replaces (none the first
+        # time), so a retried step does not count the image twice
         response = table.update_item(
             Key={
                 'userId': user_id,
                 'imageId': image_id
             },
-            UpdateExpression="SET #results = :results, #status = :status, #updatedAt = :updatedAt",
+            UpdateExpression=f"SET {set_clause}, #status = :status, #updatedAt = :updatedAt, #statsContribution = :statsContribution, #progress = :progress{remove_clause}",
             ExpressionAttributeNames={
-                '#results': 'results',
+                **names,
                 '#status': 'status',
-                '#updatedAt': 'updatedAt'
+                '#updatedAt': 'updatedAt',
+                '#statsContribution': 'statsContribution',
+                '#progress': ANALYSIS_PROGRESS
             },
             ExpressionAttributeValues={
-                ':results': results_for_dynamo,
+                **values,
                 ':status': 'completed',
-                ':updatedAt': int(time.time())
+                ':updatedAt': int(time.time()),
+                ':statsContribution': stats_contribution,
+                ':progress': progress
             },
-            ReturnValues="UPDATED_NEW"
+            ReturnValues="ALL_OLD"
         )
+        bump_version(user_id)
         
-        print(f"Stored results for image {image_id}: {response}")
+        old_item = response.get('Attributes', {})
+        record_contribution(user_id, old_item.get('statsContribution'), stats_contribution, old_item.get('createdAt'))
+        
+        print(f"Stored results for image {image_id} ({', '.join(result_attributes)})")
+        
+        # Make the results reusable for identical uploads (never cache partial
+        # results, nor results spilled to an object that belongs to this image)
+        if not failed and 'resultsObject' not in result_attributes:
+            cache_attributes = result_attributes
+            if reused:
+                # The cache serves every user; the near-duplicate it names is not theirs
+                shared = {**results, 'summary': {name: value for name, value in summary.items() if name != 'reused'}}
+                cache_attributes = pack_results(shared, user_id, image_id, floats_to_decimals)
+            perceptual_hash = (event.get('nearDuplicate') or {}).get('hash')
+            cache_results(event.get('cacheKey'), user_id, image_id, cache_attributes, perceptual_hash)
         
         return {
             'userId': user_id,
@@ -129,11 +188,152 @@ def lambda_handler(event, context):
                         ':updatedAt': int(time.time())
                     }
                 )
+                bump_version(user_id)
         except Exception as update_error:
             print(f"Error updating failure status: {str(update_error)}")
         
         raise
 
+def record_rejection(user_id, image_id, image_key, validation):
+    """
+    Mark an image failed with the reasons validation rejected it for
+    """
+    reasons = validation.get('reasons') or [{'code': 'invalid', 'message': validation.get('validationMessage', 'Invalid image')}]
+    mark_failed(user_id, image_id, reasons[0]['message'], {'rejection': reasons})
+    
+    print(f"Rejected image {image_id}: {', '.join(reason['code'] for reason in reasons)}")
+    return {
+        'userId': user_id,
+        'imageId': image_id,
+        'imageKey': image_key,
+        'status': 'failed',
+        'rejection': reasons
+    }
+
+def mark_failed(user_id, image_id, message, attributes=None):
+    """
+    Set an existing image's status to 'failed' with 'message' as its error,
+    along with any other 'attributes', and drop the run's partial results
+    and progress
+    """
+    attributes = {'status': 'failed', 'error': message, 'updatedAt': int(time.time()), **(attributes or {})}
+    table = dynamodb.Table(RESULTS_TABLE)
+    try:
+        table.update_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            UpdateExpression="SET " + ', '.join(f"#{name} = :{name}" for name in attributes) +
+                             " REMOVE #partial, #progress",
+            ConditionExpression="attribute_exists(userId)",
+            ExpressionAttributeNames={
+                **{f"#{name}": name for name in attributes},
+                '#partial': PARTIAL_RESULTS,
+                '#progress': ANALYSIS_PROGRESS
+            },
+            ExpressionAttributeValues={f":{name}": value for name, value in attributes.items()}
+        )
+        bump_version(user_id)
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Image {image_id} was deleted before its failure was recorded")
+
+def failure_message(step_result):
+    """
+    Short message for a detector failure caught by the workflow (a Lambda
+    error's cause is its JSON error object)
+    """
+    error = step_result.get('error') or 'Error'
+    cause = step_result.get('cause') or ''
+    try:
+        cause = json.loads(cause).get('errorMessage', cause)
+    except (ValueError, AttributeError):
+        pass
+    return (f"{error}: {cause}" if cause else error)[:MAX_FAILURE_LENGTH]
+
+def final_progress(results, skipped, failed, reused):
+    """
+    Final state of every analysis, as kept in ANALYSIS_PROGRESS
+    """
+    reused_names = (reused or {}).get('analyses', [])
+    progress = {}
+    for name in ANALYSIS_NAMES:
+        if name in failed:
+            progress[name] = FAILED
+        elif name in reused_names:
+            progress[name] = REUSED
+        elif name in results:
+            progress[name] = DONE
+        elif name in skipped:
+            progress[name] = SKIPPED
+    return progress
+
+def reuse_results(near_duplicate, user_id, results, skipped):
+    """
+    Copy the analyses the duplicate detector chose to reuse from the
+    near-duplicate's stored results into 'results'. Returns what the summary
+    records about it, or None. Another user's image is never named.
+    """
+    match = (near_duplicate or {}).get('match')
+    if not match:
+        return None
+    
+    item = dynamodb.Table(RESULTS_TABLE).get_item(
+        Key={
+            'userId': match['userId'],
+            'imageId': match['imageId']
+        }
+    ).get('Item')
+    source = unpack_results(item, s3, IMAGE_BUCKET) if item else {}
+    
+    reused = []
+    for name in match.get('reuse', []):
+        if name in source:
+            # Back to plain JSON: the step's output cannot carry Decimals
+            results[name] = json.loads(dumps_json(source[name]))
+            skipped.pop(name, None)
+            reused.append(name)
+        else:
+            # The near-duplicate was deleted or re-analyzed meanwhile
+            skipped[name] = 'near-duplicate unavailable'
+    
+    if not reused:
+        return None
+    
+    summary = {'analyses': reused, 'distance': match.get('distance')}
+    if match['userId'] == user_id:
+        summary['imageId'] = match['imageId']
+    return summary
+
+def cache_results(cache_key, user_id, image_id, result_attributes, perceptual_hash=None):
+    """
+    Store the packed result attributes in the content-addressed cache, with
+    the image they came from, its owner and its perceptual hash (so images
+    served from the cache can be indexed for near-duplicates)
+    """
+    if not cache_key or not ANALYSIS_CACHE_TABLE:
+        return
+    
+    try:
+        table = dynamodb.Table(ANALYSIS_CACHE_TABLE)
+        timestamp = int(time.time())
+        
+        item = {
+            **result_attributes,
+            'cacheKey': cache_key,
+            'userId': user_id,
+            'imageId': image_id,
+            'createdAt': timestamp,
+            'expiresAt': timestamp + CACHE_TTL_SECONDS
+        }
+        if perceptual_hash:
+            item['perceptualHash'] = perceptual_hash
+        table.put_item(Item=item)
+        print(f"Cached results for image {image_id} under {cache_key}")
+    except Exception as e:
+        # A cache write failure must not fail the analysis
+        print(f"Error caching results: {str(e)}")
+
 def generate_summary(results):
     """
     Generate a summary of the analysis results
@@ -1,9 +1,11 @@
-import boto3
+import aws_clients
 import cfnresponse
 import os
 import json
 import time
+from metrics import instrument
 
+@instrument('S3NotificationSetup')
 def lambda_handler(event, context):
     """
     Custom resource handler to set up S3 notifications and update Lambda environment
@@ -11,16 +13,19 @@ def lambda_handler(event, context):
     print(f"Custom resource event received: {json.dumps(event)}")
     
     # Initialize clients
-    s3 = boto3.client('s3')
-    lambda_client = boto3.client('lambda')
+    s3 = aws_clients.client('s3')
+    lambda_client = aws_clients.client('lambda')
     
     # Get resource properties
     props = event.get('ResourceProperties', {})
     bucket_name = props.get('BucketName')
     function_arn = props.get('FunctionArn')
     state_machine_arn = props.get('StateMachineArn')
+    batch_state_machine_arn = props.get('BatchStateMachineArn')
+    queue_arn = props.get('QueueArn')
     
-    print(f"Properties: bucket={bucket_name}, function={function_arn}, stateMachine={state_machine_arn}")
+    print(f"Properties: bucket={bucket_name}, function={function_arn}, stateMachine={state_machine_arn}, "
+          f"batchStateMachine={batch_state_machine_arn}, queue={queue_arn}")
     
     # Always send a response, even in case of failure
     try:
@@ -35,13 +40,19 @@ def lambda_handler(event, context):
                 
                 # 1. Update workflow trigger function environment
                 print(f"Updating Lambda function environment: {function_arn}")
+                # Keep the variables set by the template (cache table, etc.)
+                current_config = lambda_client.get_function_configuration(FunctionName=function_arn)
+                variables = current_config.get('Environment', {}).get('Variables', {})
+                variables.update({
+                    'STATE_MACHINE_ARN': state_machine_arn,
+                    'RESULTS_TABLE': os.environ.get('RESULTS_TABLE', '')
+                })
+                if batch_state_machine_arn:
+                    variables['BATCH_STATE_MACHINE_ARN'] = batch_state_machine_arn
                 lambda_client.update_function_configuration(
                     FunctionName=function_arn,
                     Environment={
-                        'Variables': {
-                            'STATE_MACHINE_ARN': state_machine_arn,
-                            'RESULTS_TABLE': os.environ.get('RESULTS_TABLE', '')
-                        }
+                        'Variables': variables
                     }
                 )
                 print("Lambda function environment updated successfully")
@@ -49,43 +60,60 @@ def lambda_handler(event, context):
                 # 2. Configure S3 bucket notification
                 print(f"Configuring S3 bucket notification for bucket: {bucket_name}")
                 
-                # Get Lambda name from ARN to add permission
-                lambda_name = function_arn.split(':')[-1]
+                if queue_arn:
+                    # Notifications go through the ingest queue, which invokes
+                    # the function in batches (event source mapping)
+                    s3.put_bucket_notification_configuration(
+                        Bucket=bucket_name,
+                        NotificationConfiguration={
+                            'QueueConfigurations': [
+                                {
+                                    'Events': ['s3:ObjectCreated:*'],
+                                    'QueueArn': queue_arn
+                                }
+                            ]
+                        }
+                    )
+                else:
+                    # Get Lambda name from ARN to add permission
+                    lambda_name = function_arn.split(':')[-1]
+                
+                    # Add Lambda permission for S3 to invoke it
+                    try:
+                        print(f"Adding permission for S3 to invoke Lambda: {lambda_name}")
+                        lambda_client.add_permission(
+                            FunctionName=lambda_name,
+                            StatementId=f'S3InvokeFunction-{int(time.time())}',
+                            Action='lambda:InvokeFunction',
+                            Principal='s3.amazonaws.com',
+                            SourceArn=f'arn:aws:s3:::{bucket_name}'
+                        )
+                        print("Lambda permission added successfully")
+                    except lambda_client.exceptions.ResourceConflictException:
+                        print("Lambda permission already exists - continuing")
+                    except Exception as perm_error:
+                        print(f"Error adding Lambda permission: {str(perm_error)}")
                 
-                # Add Lambda permission for S3 to invoke it
-                try:
-                    print(f"Adding permission for S3 to invoke Lambda: {lambda_name}")
-                    lambda_client.add_permission(
-                        FunctionName=lambda_name,
-                        StatementId=f'S3InvokeFunction-{int(time.time())}',
-                        Action='lambda:InvokeFunction',
-                        Principal='s3.amazonaws.com',
-                        SourceArn=f'arn:aws:s3:::{bucket_name}'
+                    # Configure S3 notification
+                    s3.put_bucket_notification_configuration(
+                        Bucket=bucket_name,
+                        NotificationConfiguration={
+                            'LambdaFunctionConfigurations': [
+                                {
+                                    'Events': ['s3:ObjectCreated:*'],
+                                    'LambdaFunctionArn': function_arn
+                                }
+                            ]
+                        }
                     )
-                    print("Lambda permission added successfully")
-                except lambda_client.exceptions.ResourceConflictException:
-                    print("Lambda permission already exists - continuing")
-                except Exception as perm_error:
-                    print(f"Error adding Lambda permission: {str(perm_error)}")
                 
-                # Configure S3 notification
-                s3.put_bucket_notification_configuration(
-                    Bucket=bucket_name,
-                    NotificationConfiguration={
-                        'LambdaFunctionConfigurations': [
-                            {
-                                'Events': ['s3:ObjectCreated:*'],
-                                'LambdaFunctionArn': function_arn
-                            }
-                        ]
-                    }
-                )
                 print("S3 bucket notification configured successfully")
                 
                 response_data = {
                     'Message': f'Successfully configured notifications for bucket {bucket_name}',
                     'BucketName': bucket_name,
-                    'LambdaFunction': function_arn
+                    'LambdaFunction': function_arn,
+                    'Queue': queue_arn or ''
                 }
                 print(f"Sending SUCCESS response: {json.dumps(response_data)}")
                 cfnresponse.send(event, context, cfnresponse.SUCCESS, response_data)
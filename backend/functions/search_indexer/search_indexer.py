@@ -0,0 +1,142 @@
+import os
+from result_storage import RESULT_ATTRIBUTES, unpack_results
+from search_index import (
+    SEARCH_INDEX_TABLE, extract_terms, postings_for, posting_item, posting_key, manifest_key, diff_postings
+)
+import aws_clients
+from metrics import instrument, put_metric
+
+# Initialize AWS clients
+s3 = aws_clients.client('s3')
+dynamodb = aws_clients.resource('dynamodb')
+
+# Get environment variables
+RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+# Items read per scan page and Lambda time left when a backfill run stops
+BACKFILL_PAGE_SIZE = 100
+BACKFILL_TIME_MARGIN_MS = 10000
+
+_deserializer = None
+
+@instrument('SearchIndexer')
+def lambda_handler(event, context):
+    """
+    Maintains the search index from the ResultsTable stream.
+
+    Only records that change an item's results (or remove it) are indexed.
+    Records are applied in stream order and each is written completely
+    before the next, so a failure is reported from the failed record
+    onwards and the retry repeats idempotent writes only.
+
+    Invoked with {"backfill": true} instead, it indexes the images already
+    in the table, page by page, and returns the 'exclusiveStartKey' to pass
+    to the next invocation while more remain.
+    """
+    if event.get('backfill'):
+        return backfill(event.get('exclusiveStartKey'), context)
+
+    records = event.get('Records') or []
+    indexed = 0
+
+    for record in records:
+        try:
+            if changes_results(record):
+                index_record(record)
+                indexed += 1
+        except Exception as e:
+            print(f"Error indexing stream record {record['dynamodb']['SequenceNumber']}: {str(e)}")
+            put_metric('IndexedImages', indexed, 'Count')
+            return {
+                'batchItemFailures': [{'itemIdentifier': record['dynamodb']['SequenceNumber']}]
+            }
+
+    put_metric('IndexedImages', indexed, 'Count')
+    print(f"Indexed {indexed} of {len(records)} stream records")
+    return {'batchItemFailures': []}
+
+def changes_results(record):
+    """
+    Whether a stream record adds, changes or removes results
+    """
+    data = record['dynamodb']
+    old_image = data.get('OldImage') or {}
+    new_image = data.get('NewImage') or {}
+    if record['eventName'] == 'REMOVE':
+        return any(name in old_image for name in RESULT_ATTRIBUTES)
+    return any(old_image.get(name) != new_image.get(name) for name in RESULT_ATTRIBUTES)
+
+def deserialize(image):
+    """
+    Plain Python item for a stream record image (DynamoDB JSON)
+    """
+    global _deserializer
+    if _deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        _deserializer = TypeDeserializer()
+    return {name: _deserializer.deserialize(value) for name, value in image.items()}
+
+def index_record(record):
+    data = record['dynamodb']
+    keys = deserialize(data['Keys'])
+    item = None if record['eventName'] == 'REMOVE' else deserialize(data.get('NewImage') or {})
+    index_image(keys['userId'], keys['imageId'], item)
+
+def index_image(user_id, image_id, item):
+    """
+    Bring an image's postings in line with 'item' (None removes them all)
+    """
+    table = dynamodb.Table(SEARCH_INDEX_TABLE)
+    manifest_item_key = {'userTerm': manifest_key(user_id), 'imageId': image_id}
+    manifest = table.get_item(Key=manifest_item_key, ConsistentRead=True).get('Item') or {}
+    old = manifest.get('postings') or {}
+
+    new = {}
+    created_at = manifest.get('createdAt', 0)
+    if item is not None:
+        created_at = item.get('createdAt', created_at)
+        new = postings_for(extract_terms(unpack_results(item, s3, IMAGE_BUCKET)))
+
+    writes, deletes = diff_postings(old, new)
+    with table.batch_writer(overwrite_by_pkeys=['userTerm', 'imageId']) as batch:
+        for term in writes:
+            batch.put_item(Item=posting_item(user_id, image_id, term, new[term], created_at))
+        for term in deletes:
+            batch.delete_item(Key={'userTerm': posting_key(user_id, term), 'imageId': image_id})
+
+    # The manifest is written once every posting is, so a failed run is
+    # diffed against the old manifest again when it is retried
+    if new:
+        table.put_item(Item={**manifest_item_key, 'postings': new, 'createdAt': created_at})
+    elif manifest:
+        table.delete_item(Key=manifest_item_key)
+
+    print(f"Indexed image {image_id}: {len(new)} terms, {len(writes)} written, {len(deletes)} removed")
+
+def backfill(exclusive_start_key, context):
+    """
+    Index existing images until the scan ends or time runs short
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+    indexed = 0
+
+    while True:
+        scan_args = {'Limit': BACKFILL_PAGE_SIZE}
+        if exclusive_start_key:
+            scan_args['ExclusiveStartKey'] = exclusive_start_key
+        response = table.scan(**scan_args)
+
+        for item in response.get('Items', []):
+            if any(name in item for name in RESULT_ATTRIBUTES):
+                index_image(item['userId'], item['imageId'], item)
+                indexed += 1
+
+        exclusive_start_key = response.get('LastEvaluatedKey')
+        if not exclusive_start_key:
+            break
+        if context and context.get_remaining_time_in_millis() < BACKFILL_TIME_MARGIN_MS:
+            break
+
+    print(f"Backfill indexed {indexed} images; {'more remain' if exclusive_start_key else 'done'}")
+    return {'indexed': indexed, 'exclusiveStartKey': exclusive_start_key}
@@ -0,0 +1,88 @@
+import os
+from result_storage import RESULT_ATTRIBUTES, unpack_results
+from user_stats import USER_STATS_TABLE, contribution, stats_item
+import aws_clients
+from metrics import instrument, put_metric
+
+# Initialize AWS clients
+s3 = aws_clients.client('s3')
+dynamodb = aws_clients.resource('dynamodb')
+
+# Get environment variables
+RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
+IMAGE_BUCKET = os.environ.get('IMAGE_BUCKET')
+
+@instrument('StatsRebuilder')
+def lambda_handler(event, context):
+    """
+    Recompute users' analytics rollups from scratch.
+
+    Invoked manually with {"userId": "..."} or {"userIds": [...]}. Every
+    record of the user that holds results is read and its contribution is
+    recomputed. Records whose stored 'statsContribution' is missing or
+    differs are corrected, then the stats item is replaced as a whole.
+    Writes for the user that land while a rebuild runs may be lost, so run
+    it when the user is idle.
+    """
+    user_ids = event.get('userIds') or ([event['userId']] if event.get('userId') else [])
+    if not user_ids:
+        raise ValueError("Missing userId or userIds")
+
+    rebuilt = {}
+    for user_id in user_ids:
+        rebuilt[user_id] = rebuild_user(user_id)
+
+    put_metric('RebuiltStats', len(rebuilt), 'Count')
+    return {'rebuilt': rebuilt}
+
+def rebuild_user(user_id):
+    """
+    Replace one user's stats item with totals recomputed from their records
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+    contributions = []
+    corrected = 0
+
+    query_args = {
+        'KeyConditionExpression': "userId = :uid",
+        'ExpressionAttributeValues': {":uid": user_id}
+    }
+    while True:
+        response = table.query(**query_args)
+
+        for item in response.get('Items', []):
+            if not any(name in item for name in RESULT_ATTRIBUTES):
+                continue
+            stats_contribution = contribution(unpack_results(item, s3, IMAGE_BUCKET))
+            contributions.append((stats_contribution, item.get('createdAt')))
+
+            if item.get('statsContribution') != stats_contribution:
+                store_contribution(table, user_id, item['imageId'], stats_contribution)
+                corrected += 1
+
+        if not response.get('LastEvaluatedKey'):
+            break
+        query_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    dynamodb.Table(USER_STATS_TABLE).put_item(Item=stats_item(user_id, contributions))
+
+    print(f"Rebuilt stats for user {user_id}: {len(contributions)} images, {corrected} contributions corrected")
+    return {'images': len(contributions), 'corrected': corrected}
+
+def store_contribution(table, user_id, image_id, stats_contribution):
+    """
+    Set a record's contribution unless the image was deleted meanwhile
+    """
+    try:
+        table.update_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            UpdateExpression="SET #statsContribution = :statsContribution",
+            ConditionExpression="attribute_exists(userId)",
+            ExpressionAttributeNames={'#statsContribution': 'statsContribution'},
+            ExpressionAttributeValues={':statsContribution': stats_contribution}
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Image {image_id} was deleted during the rebuild")
@@ -0,0 +1,33 @@
+from status_events import STATUS_EVENTS_TABLE, transition
+import aws_clients
+from metrics import instrument, put_metric
+
+@instrument('StatusPublisher')
+def lambda_handler(event, context):
+    """
+    Publishes image status transitions from the ResultsTable stream to the
+    status events table read by the image handler's /images/changes feed.
+
+    Only records that change an item's status or analysis progress become
+    events; result writes and other updates that keep both are dropped. Events are keyed by
+    the stream sequence number, so a retried batch rewrites the same items.
+    If the write fails, the batch is reported as failed from its first
+    record and Lambda retries it.
+    """
+    records = event.get('Records') or []
+    events = [item for item in (transition(record) for record in records) if item]
+
+    try:
+        if events:
+            with aws_clients.table(STATUS_EVENTS_TABLE).batch_writer(overwrite_by_pkeys=['userId', 'seq']) as batch:
+                for item in events:
+                    batch.put_item(Item=item)
+    except Exception as e:
+        print(f"Error publishing {len(events)} status events: {str(e)}")
+        return {
+            'batchItemFailures': [{'itemIdentifier': records[0]['dynamodb']['SequenceNumber']}]
+        }
+
+    put_metric('StatusEvents', len(events), 'Count')
+    print(f"Published {len(events)} status events from {len(records)} stream records")
+    return {'batchItemFailures': []}
@@ -1,80 +1,70 @@
+import hashlib
 import json
 import os
-import boto3
 import urllib.parse
 import time
+from result_storage import RESULT_ATTRIBUTES, PARTIAL_RESULTS, build_update, unpack_results
+from analysis_progress import ANALYSIS_PROGRESS
+from analysis_profiles import analysis_flags, resolve_profile, DEFAULT_ANALYSIS_PROFILE
+from collection_version import bump_version
+from user_stats import contribution, record_contribution
+import aws_clients
+from metrics import instrument, put_metric
+import perceptual_hash
 
 # Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-step_functions = boto3.client('stepfunctions')
+s3 = aws_clients.client('s3')
+dynamodb = aws_clients.resource('dynamodb')
+step_functions = aws_clients.client('stepfunctions')
 
 # Get environment variables
 RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
-# STATE_MACHINE_ARN will be set by the custom resource post-deployment
+ANALYSIS_CACHE_TABLE = os.environ.get('ANALYSIS_CACHE_TABLE')
+# STATE_MACHINE_ARN and BATCH_STATE_MACHINE_ARN will be set by the custom resource post-deployment
 
+# Version of the detector settings (MaxLabels, MinConfidence, face attributes...).
+# Bump this whenever a detector changes so old cache entries stop matching.
+ANALYSIS_PARAMS_VERSION = os.environ.get('ANALYSIS_PARAMS_VERSION', 'v1')
+
+# 'fanout' runs one Lambda per detector, 'fused' runs them all in one Lambda,
+# 'cascade' runs them in one Lambda, faces/celebrities/text only when needed
+ANALYZER_MODE = os.environ.get('ANALYZER_MODE', 'fanout')
+
+# Images of one queue batch analyzed at once by the batch state machine's Map
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 10))
+
+# Objects the workflow writes itself (normalized derivatives, spilled results)
+# live under these prefixes and must not start another analysis
+INTERNAL_PREFIXES = (
+    os.environ.get('DERIVED_PREFIX', 'derived/'),
+    os.environ.get('RESULTS_PREFIX', 'results/')
+)
+
+# Key of the item holding the hit/miss counters in the cache table
+CACHE_STATS_KEY = '__stats__'
+
+@instrument('WorkflowTrigger')
 def lambda_handler(event, context):
     """
-    Triggered by S3 upload event, starts the image processing workflow
+    Starts the image processing workflow for new uploads.
+
+    Normally invoked by the ingest SQS queue with a batch of S3
+    notifications: every record is prepared, the workflows are started
+    together, and messages that failed are returned in 'batchItemFailures'
+    so only they are redelivered. Direct S3 notifications (the setup before
+    the queue) are still handled, one execution per record.
     """
+    records = event.get('Records') or []
+    if records and records[0].get('eventSource') == 'aws:sqs':
+        return process_queue_batch(records)
+    
     try:
-        # Get the S3 bucket and key from the event
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'])
-        
-        print(f"Processing new image upload: {bucket}/{key}")
-        
-        # Extract user ID and image ID from the key
-        # Key format is: {userId}/{imageId}.{extension}
-        key_parts = key.split('/')
-        if len(key_parts) < 2:
-            print(f"Invalid key format: {key}")
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'message': 'Invalid key format'})
-            }
-        
-        user_id = key_parts[0]
-        image_id = os.path.splitext(key_parts[1])[0]
-        
-        # Update DynamoDB status to 'processing'
-        update_image_status(user_id, image_id, 'processing')
-        
-        # Get STATE_MACHINE_ARN - it might be updated post-deployment
-        state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
-        if not state_machine_arn:
-            print("STATE_MACHINE_ARN environment variable not set. Using placeholder value.")
-            # Just update status, don't try to process 
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Image received, but processing not yet available',
-                    'userId': user_id,
-                    'imageId': image_id,
-                    'imageKey': key
-                })
-            }
-        
-        # Start the Step Functions workflow
-        response = step_functions.start_execution(
-            stateMachineArn=state_machine_arn,
-            name=f"image-processing-{image_id}-{int(time.time())}",
-            input=json.dumps({
-                'userId': user_id,
-                'imageId': image_id,
-                'imageKey': key,
-                'bucket': bucket
-            })
-        )
-        
-        print(f"Started Step Functions execution: {response['executionArn']}")
-        
+        responses = [process_direct_upload(record['s3']) for record in records]
+        if len(responses) == 1:
+            return responses[0]
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Image processing started',
-                'executionArn': response['executionArn']
-            })
+            'statusCode': max([response['statusCode'] for response in responses], default=200),
+            'body': json.dumps({'uploads': [json.loads(response['body']) for response in responses]})
         }
     except Exception as e:
         print(f"Error in workflow_trigger: {str(e)}")
@@ -83,30 +73,451 @@ def lambda_handler(event, context):
             'body': json.dumps({'message': 'Error starting image processing'})
         }
 
+def process_direct_upload(s3_record):
+    """
+    Prepare one upload from a direct S3 notification and start its workflow
+    """
+    response, execution = prepare_upload(s3_record)
+    if not execution:
+        return response
+    
+    # Get STATE_MACHINE_ARN - it might be updated post-deployment
+    state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+    if not state_machine_arn:
+        print("STATE_MACHINE_ARN environment variable not set. Using placeholder value.")
+        # Just update status, don't try to process 
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Image received, but processing not yet available',
+                'userId': execution['input']['userId'],
+                'imageId': execution['input']['imageId'],
+                'imageKey': execution['input']['imageKey']
+            })
+        }
+    
+    execution_arn = start_image_execution(state_machine_arn, execution)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Image processing started',
+            'executionArn': execution_arn
+        })
+    }
+
+def process_queue_batch(records):
+    """
+    Prepare every upload in a batch of queue messages and start their
+    workflows; returns the partial batch response naming failed messages
+    """
+    failures = []
+    executions = []
+    
+    for message in records:
+        message_id = message['messageId']
+        try:
+            notification = json.loads(message['body'])
+            
+            # S3 sends a test message when the notification is configured
+            if notification.get('Event') == 's3:TestEvent':
+                continue
+            
+            for s3_record in notification.get('Records', []):
+                response, execution = prepare_upload(s3_record['s3'])
+                if execution:
+                    executions.append((message_id, execution))
+        except Exception as e:
+            print(f"Error processing message {message_id}: {str(e)}")
+            failures.append(message_id)
+    
+    # Uploads of a failed message are prepared again when it is redelivered
+    executions = [(message_id, execution) for message_id, execution in executions if message_id not in failures]
+    failures.extend(start_executions(executions))
+    
+    put_metric('BatchMessages', len(records), 'Count')
+    put_metric('FailedMessages', len(set(failures)), 'Count')
+    print(f"Processed {len(records)} messages: {len(executions)} workflows, {len(set(failures))} failed messages")
+    
+    return {
+        'batchItemFailures': [{'itemIdentifier': message_id} for message_id in dict.fromkeys(failures)]
+    }
+
+def prepare_upload(s3_record):
+    """
+    Mark an uploaded image as processing and decide how to analyze it.
+
+    Returns (response, execution): 'execution' is the workflow to start
+    ({'name', 'input'}), or None when the object is ignored or its results
+    were served from the cache, in which case 'response' says why.
+    """
+    # Get the S3 bucket and key from the event
+    bucket = s3_record['bucket']['name']
+    key = urllib.parse.unquote_plus(s3_record['object']['key'])
+    
+    print(f"Processing new image upload: {bucket}/{key}")
+    
+    # Ignore objects created by the workflow itself
+    if key.startswith(INTERNAL_PREFIXES):
+        print(f"Skipping internal object: {key}")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': 'Internal object ignored'})
+        }, None
+    
+    # Extract user ID and image ID from the key
+    # Key format is: {userId}/{imageId}.{extension}
+    key_parts = key.split('/')
+    if len(key_parts) < 2:
+        print(f"Invalid key format: {key}")
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'message': 'Invalid key format'})
+        }, None
+    
+    user_id = key_parts[0]
+    image_id = os.path.splitext(key_parts[1])[0]
+    
+    # Update DynamoDB status to 'processing' and read the analysis profile
+    # requested with the upload URL from the pending record
+    image_record = update_image_status(user_id, image_id, 'processing') or {}
+    if image_record.get('status') == 'completed':
+        print(f"Image {image_id} is already analyzed; ignoring redelivered event")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': 'Image already analyzed'})
+        }, None
+    analysis_profile = get_analysis_profile(image_record)
+    
+    # Reuse stored results if the same bytes were analyzed before
+    cache_key = get_cache_key(bucket, key, s3_record['object'].get('eTag'), analysis_profile)
+    cached = get_cached_results(cache_key)
+    if cached:
+        cached_from = store_cached_results(user_id, image_id, cached)
+        index_cached_image(user_id, image_id, cached)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Image results served from cache',
+                'userId': user_id,
+                'imageId': image_id,
+                'cachedFrom': cached_from
+            })
+        }, None
+    
+    return None, {
+        'name': execution_name(image_id, s3_record['object'].get('sequencer')),
+        'input': {
+            'userId': user_id,
+            'imageId': image_id,
+            'imageKey': key,
+            'bucket': bucket,
+            'cacheKey': cache_key,
+            'analyzerMode': ANALYZER_MODE,
+            'analysisProfile': analysis_profile,
+            'analyses': analysis_flags(analysis_profile)
+        }
+    }
+
+def execution_name(image_id, sequencer=None):
+    """
+    Name of an image's workflow execution. The S3 event's sequencer makes it
+    unique per upload but identical when the same notification is delivered
+    again, so a redelivery cannot start a second workflow.
+    """
+    return f"image-processing-{image_id}-{sequencer or int(time.time())}"[:80]
+
+def start_image_execution(state_machine_arn, execution):
+    """
+    Start one image workflow; returns its ARN (None if it was already started)
+    """
+    try:
+        response = step_functions.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=execution['name'],
+            input=json.dumps(execution['input'])
+        )
+    except step_functions.exceptions.ExecutionAlreadyExists:
+        print(f"Execution {execution['name']} already started")
+        return None
+    
+    print(f"Started Step Functions execution: {response['executionArn']}")
+    return response['executionArn']
+
+def start_executions(executions):
+    """
+    Start the workflows for (message ID, execution) pairs from a queue batch,
+    as one batch execution when BATCH_STATE_MACHINE_ARN is set; returns the
+    IDs of the messages whose workflows could not be started
+    """
+    if not executions:
+        return []
+    
+    batch_arn = os.environ.get('BATCH_STATE_MACHINE_ARN')
+    if batch_arn:
+        names = sorted(execution['name'] for _, execution in executions)
+        batch_name = f"image-batch-{hashlib.sha1(','.join(names).encode('utf-8')).hexdigest()[:32]}"
+        try:
+            response = step_functions.start_execution(
+                stateMachineArn=batch_arn,
+                name=batch_name,
+                input=json.dumps({
+                    'images': [execution for _, execution in executions],
+                    'maxConcurrency': BATCH_MAX_CONCURRENCY
+                })
+            )
+            print(f"Started batch execution for {len(executions)} images: {response['executionArn']}")
+        except step_functions.exceptions.ExecutionAlreadyExists:
+            print(f"Batch execution {batch_name} already started")
+        except Exception as e:
+            print(f"Error starting batch execution: {str(e)}")
+            return [message_id for message_id, _ in executions]
+        return []
+    
+    # Get STATE_MACHINE_ARN - it might be updated post-deployment
+    state_machine_arn = os.environ.get('STATE_MACHINE_ARN')
+    if not state_machine_arn:
+        print("STATE_MACHINE_ARN environment variable not set. Using placeholder value.")
+        return []
+    
+    failures = []
+    for message_id, execution in executions:
+        try:
+            start_image_execution(state_machine_arn, execution)
+        except Exception as e:
+            print(f"Error starting execution {execution['name']}: {str(e)}")
+            failures.append(message_id)
+    return failures
+
 def update_image_status(user_id, image_id, status):
     """
-    Update the image status in DynamoDB
+    Update the image status in DynamoDB and return the record's status and
+    analysis profile (None if the update failed). Also starts the run's
+    partial results and analysis progress afresh (see analysis_progress).
+
+    Only a new upload (no record yet, or one still pending) or a retry of a
+    failed image is reset. A redelivered notification finds the image
+    processing or completed and leaves it alone, so it cannot wipe the
+    sections of a run that is still going or reopen a finished image.
     """
     try:
         table = dynamodb.Table(RESULTS_TABLE)
         
+        # if_not_exists makes UPDATED_NEW return the stored profile as well,
+        # without reading back the whole (possibly large) record
         response = table.update_item(
             Key={
                 'userId': user_id,
                 'imageId': image_id
             },
-            UpdateExpression="SET #status = :status",
+            UpdateExpression="SET #status = :status, #analysisProfile = if_not_exists(#analysisProfile, :defaultProfile), "
+                             "#partial = :empty, #progress = :empty",
+            ConditionExpression="attribute_not_exists(#status) OR #status IN (:pending, :failed)",
             ExpressionAttributeNames={
-                '#status': 'status'
+                '#status': 'status',
+                '#analysisProfile': 'analysisProfile',
+                '#partial': PARTIAL_RESULTS,
+                '#progress': ANALYSIS_PROGRESS
             },
             ExpressionAttributeValues={
-                ':status': status
+                ':status': status,
+                ':defaultProfile': DEFAULT_ANALYSIS_PROFILE,
+                ':empty': {},
+                ':pending': 'pending',
+                ':failed': 'failed'
             },
             ReturnValues="UPDATED_NEW"
         )
+        bump_version(user_id)
         
         print(f"Updated status to '{status}' for image {image_id}: {response}")
-        return True
+        return response.get('Attributes')
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        # Redelivery: the execution name dedupes the workflow itself, so
+        # only the profile is needed to rebuild the same execution input
+        print(f"Image {image_id} is already past 'pending'; status left as is")
+        return get_image_status(table, user_id, image_id)
     except Exception as e:
         print(f"Error updating image status: {str(e)}")
-        return False
\ No newline at end of file
+        return None
+
+def get_image_status(table, user_id, image_id):
+    """
+    Status and analysis profile of an image record (None if unreadable)
+    """
+    try:
+        response = table.get_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            ProjectionExpression="#status, #analysisProfile",
+            ExpressionAttributeNames={
+                '#status': 'status',
+                '#analysisProfile': 'analysisProfile'
+            }
+        )
+        return response.get('Item')
+    except Exception as e:
+        print(f"Error reading image status: {str(e)}")
+        return None
+
+def get_analysis_profile(image_record):
+    """
+    Analysis profile stored on the image record, or the default one
+    """
+    try:
+        return resolve_profile(image_record.get('analysisProfile'))
+    except ValueError as e:
+        print(f"{str(e)}; using '{DEFAULT_ANALYSIS_PROFILE}'")
+        return DEFAULT_ANALYSIS_PROFILE
+
+def get_cache_key(bucket, key, etag=None, analysis_profile='full'):
+    """
+    Build the content-addressed cache key for an uploaded object.
+
+    The S3 ETag is the MD5 of the bytes for single-part uploads (which is how
+    the presigned PUT uploads arrive), so identical uploads share a key.
+    Profiles other than 'full' get their own entries, as their results
+    cover fewer analyses. So does the cascade analyzer, which skips faces,
+    celebrities and text when the labels do not call for them; fanout and
+    fused results are complete and share entries.
+    """
+    if not ANALYSIS_CACHE_TABLE:
+        return None
+    
+    try:
+        if not etag:
+            etag = s3.head_object(Bucket=bucket, Key=key).get('ETag')
+        if not etag:
+            return None
+        
+        etag = etag.strip('"')
+        cache_key = f"{etag}#{ANALYSIS_PARAMS_VERSION}"
+        if analysis_profile != 'full':
+            cache_key += f"#{analysis_profile}"
+        if ANALYZER_MODE == 'cascade':
+            cache_key += '#cascade'
+        return cache_key
+    except Exception as e:
+        print(f"Error building cache key for {key}: {str(e)}")
+        return None
+
+def get_cached_results(cache_key):
+    """
+    Look up previously stored analysis results and record a hit or a miss
+    """
+    if not cache_key:
+        return None
+    
+    try:
+        table = dynamodb.Table(ANALYSIS_CACHE_TABLE)
+        item = table.get_item(Key={'cacheKey': cache_key}).get('Item')
+        
+        # DynamoDB TTL deletion is lazy, so skip entries that already expired
+        if item and item.get('expiresAt', 0) < int(time.time()):
+            item = None
+        
+        record_cache_lookup(table, hit=item is not None)
+        print(f"Analysis cache {'hit' if item else 'miss'} for {cache_key}")
+        return item
+    except Exception as e:
+        print(f"Error reading analysis cache: {str(e)}")
+        return None
+
+def record_cache_lookup(table, hit):
+    """
+    Atomically bump the hit/miss counters kept in the cache table
+    """
+    try:
+        table.update_item(
+            Key={'cacheKey': CACHE_STATS_KEY},
+            UpdateExpression="ADD #counter :one",
+            ExpressionAttributeNames={
+                '#counter': 'hits' if hit else 'misses'
+            },
+            ExpressionAttributeValues={
+                ':one': 1
+            }
+        )
+    except Exception as e:
+        print(f"Error updating cache counters: {str(e)}")
+
+def store_cached_results(user_id, image_id, cached):
+    """
+    Copy cached results into the image record and mark it completed. Returns
+    the 'cachedFrom' recorded: the source image's ID when it belongs to the
+    same user, otherwise '' (the cache is shared, its images are not).
+    """
+    table = dynamodb.Table(RESULTS_TABLE)
+    cached_from = cached.get('imageId', '') if cached.get('userId') == user_id else ''
+    
+    # Cache entries hold the same result attributes as the image records
+    result_attributes = {name: cached[name] for name in RESULT_ATTRIBUTES if name in cached} or {'results': {}}
+    set_clause, remove_clause, names, values = build_update(result_attributes)
+    
+    # Cached results are never spilled to S3, so unpacking reads no object
+    stats_contribution = contribution(unpack_results(result_attributes))
+    
+    response = table.update_item(
+        Key={
+            'userId': user_id,
+            'imageId': image_id
+        },
+        UpdateExpression=f"SET {set_clause}, #status = :status, #updatedAt = :updatedAt, #cachedFrom = :cachedFrom, #statsContribution = :statsContribution{remove_clause}",
+        ExpressionAttributeNames={
+            **names,
+            '#status': 'status',
+            '#updatedAt': 'updatedAt',
+            '#cachedFrom': 'cachedFrom',
+            '#statsContribution': 'statsContribution'
+        },
+        ExpressionAttributeValues={
+            **values,
+            ':status': 'completed',
+            ':updatedAt': int(time.time()),
+            ':cachedFrom': cached_from,
+            ':statsContribution': stats_contribution
+        },
+        ReturnValues='ALL_OLD'
+    )
+    bump_version(user_id)
+    
+    old_item = response.get('Attributes', {})
+    record_contribution(user_id, old_item.get('statsContribution'), stats_contribution, old_item.get('createdAt'))
+    
+    print(f"Stored cached results for image {image_id} (from {cached.get('imageId')})")
+    return cached_from
+
+def index_cached_image(user_id, image_id, cached):
+    """
+    Index an image served from the cache for near-duplicates, as the
+    duplicate detector would have: keep the cached hash on the image record,
+    join its group and write its postings
+    """
+    hash_hex = cached.get('perceptualHash')
+    if not perceptual_hash.HASH_INDEX_TABLE or not hash_hex:
+        # Entries cached before hashes were kept, or with the detector failed
+        print(f"No perceptual hash cached for image {image_id}, not indexing it")
+        return
+
+    try:
+        table = dynamodb.Table(RESULTS_TABLE)
+        table.update_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            UpdateExpression="SET perceptualHash = :hash",
+            ConditionExpression="attribute_exists(userId)",
+            ExpressionAttributeValues={':hash': hash_hex}
+        )
+        group_id = perceptual_hash.index_image(
+            dynamodb.Table(perceptual_hash.HASH_INDEX_TABLE), user_id, image_id, perceptual_hash.from_hex(hash_hex)
+        )
+        print(f"Indexed cached image {image_id}" + (f" in group {group_id}" if group_id else ""))
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"Image {image_id} was deleted before it was indexed")
+    except Exception as e:
+        # The results are stored; a missing index entry must not fail the upload
+        print(f"Error indexing cached image {image_id}: {str(e)}")
@@ -0,0 +1,40 @@
+"""
+Analysis profiles: named subsets of the five Rekognition analyses.
+
+An upload can ask for a profile when it requests its upload URL. The profile
+is stored on the pending ResultsTable item, and workflow_trigger turns it
+into the 'analyses' flags of the execution input ({"labels": true,
+"faces": false, ...}). The state machine skips the branches whose flag is
+false, and the fused analyzer skips the matching calls, so Rekognition is
+billed only for what the profile asks for.
+"""
+import os
+
+# Every analysis, in the order of the state machine's analysisResults array
+ANALYSIS_NAMES = ['labels', 'moderation', 'faces', 'celebrities', 'text']
+
+PROFILES = {
+    'full': ANALYSIS_NAMES,
+    'basic': ['labels', 'moderation'],
+    'people': ['labels', 'moderation', 'faces', 'celebrities'],
+    'document': ['labels', 'moderation', 'text']
+}
+
+DEFAULT_ANALYSIS_PROFILE = os.environ.get('DEFAULT_ANALYSIS_PROFILE', 'full')
+
+def resolve_profile(name):
+    """
+    Return a valid profile name for 'name' (the default when empty);
+    raises ValueError for unknown profiles
+    """
+    name = name or DEFAULT_ANALYSIS_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown analysis profile '{name}' (expected one of {', '.join(PROFILES)})")
+    return name
+
+def analysis_flags(profile):
+    """
+    {analysis name: runs?} for a profile, as passed to the state machine
+    """
+    selected = PROFILES[resolve_profile(profile)]
+    return {name: name in selected for name in ANALYSIS_NAMES}
@@ -0,0 +1,79 @@
+"""
+Per-analysis progress of an image's workflow.
+
+The workflow trigger starts every run with empty 'partialResults' and
+'analysisProgress' maps on the image record. In the parallel workflow each
+detector stores its section in partialResults and marks its analysis
+'done' in analysisProgress as soon as it finishes, or 'failed' when it
+raises, so the API can show the labels while slower detectors still run.
+The results processor then writes the final layout, which drops
+partialResults, and leaves the final state of every analysis in
+analysisProgress: done, failed, skipped or reused.
+
+These writes are best effort. The detectors' results still reach the
+results processor through the workflow, so a write that fails (the image
+was deleted, or the item would grow past 400KB) is only logged.
+"""
+import os
+
+from result_storage import PARTIAL_RESULTS, pack_section
+from decimal_json import floats_to_decimals
+from collection_version import bump_version
+import aws_clients
+
+RESULTS_TABLE = os.environ.get('RESULTS_TABLE')
+
+ANALYSIS_PROGRESS = 'analysisProgress'
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+REUSED = 'reused'
+
+def save_section(user_id, image_id, name, result):
+    """
+    Store one detector's result and mark its analysis done; False when
+    nothing was written
+    """
+    return update_progress(
+        user_id, image_id, name, DONE,
+        "SET #partial.#analysis = :section, #progress.#analysis = :state",
+        {':section': pack_section(result, floats_to_decimals)}
+    )
+
+def record_failure(user_id, image_id, name):
+    """
+    Mark an analysis failed (a retry that succeeds marks it done again)
+    """
+    return update_progress(user_id, image_id, name, FAILED, "SET #progress.#analysis = :state", {})
+
+def update_progress(user_id, image_id, name, state, update_expression, values):
+    # The maps exist only during a parallel run of a live image
+    if not RESULTS_TABLE or not user_id or not image_id:
+        return False
+
+    table = aws_clients.table(RESULTS_TABLE)
+    try:
+        table.update_item(
+            Key={
+                'userId': user_id,
+                'imageId': image_id
+            },
+            UpdateExpression=update_expression,
+            ConditionExpression="attribute_exists(#partial) AND attribute_exists(#progress)",
+            ExpressionAttributeNames={
+                '#partial': PARTIAL_RESULTS,
+                '#progress': ANALYSIS_PROGRESS,
+                '#analysis': name
+            },
+            ExpressionAttributeValues={**values, ':state': state}
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        print(f"No progress kept for image {image_id}; {name} not recorded as {state}")
+        return False
+    except Exception as e:
+        print(f"Error recording {name} as {state} for image {image_id}: {str(e)}")
+        return False
+
+    bump_version(user_id)
+    return True
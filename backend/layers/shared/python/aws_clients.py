@@ -0,0 +1,155 @@
+"""
+Lazily created, per-container boto3 clients with tuned configuration.
+
+Building a botocore client loads and parses the service model, which takes
+tens of milliseconds per client, and importing boto3 itself takes longer. A
+function that creates its clients at import time pays all of that in every
+cold start, including for clients the invocation never uses. client() and
+resource() instead return a stand-in that builds the real object on first
+use; the result is cached for the life of the container and shared by every
+module that asks for the same service.
+
+All clients use client_config() rather than botocore's defaults: a connection
+pool large enough for the fused analyzer's threads, explicit connect and
+read timeouts (per-service read timeouts in READ_TIMEOUTS), the adaptive
+retry mode, which backs off client-side when the service throttles, and TCP
+keepalive so idle pooled connections survive between warm invocations. Each
+setting can be overridden with the environment variables below. Callers that
+retry on their own (the Rekognition rate limiter) ask for a client with a
+single attempt, so retries do not multiply.
+
+The stand-ins are wrapped in metrics.timed_client, so every call counts
+toward the invocation's <Service>Time metric.
+"""
+import os
+import threading
+
+from metrics import timed_client, timed_resource
+
+MAX_POOL_CONNECTIONS = int(os.environ.get('CLIENT_MAX_POOL_CONNECTIONS', 25))
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get('CLIENT_CONNECT_TIMEOUT_SECONDS', 2))
+READ_TIMEOUT_SECONDS = float(os.environ.get('CLIENT_READ_TIMEOUT_SECONDS', 10))
+MAX_ATTEMPTS = int(os.environ.get('CLIENT_MAX_ATTEMPTS', 5))
+RETRY_MODE = os.environ.get('CLIENT_RETRY_MODE', 'adaptive')
+TCP_KEEPALIVE = os.environ.get('CLIENT_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+# Services whose calls can legitimately run longer than READ_TIMEOUT_SECONDS
+READ_TIMEOUTS = {
+    # Large image downloads in normalization
+    's3': 30,
+    # Celebrity recognition and text detection on dense images
+    'rekognition': 20
+}
+
+# boto3 service name -> prefix of its metrics
+METRIC_NAMES = {
+    's3': 'S3',
+    'rekognition': 'Rekognition',
+    'dynamodb': 'DynamoDB',
+    'stepfunctions': 'StepFunctions',
+    'cognito-idp': 'Cognito',
+    'lambda': 'Lambda'
+}
+
+_clients = {}
+_resources = {}
+_session = None
+_lock = threading.Lock()
+
+def read_timeout(service_name):
+    """
+    Read timeout, in seconds, of the clients for 'service_name'
+    """
+    return READ_TIMEOUTS.get(service_name, READ_TIMEOUT_SECONDS)
+
+def client_config(service_name, max_attempts=None):
+    """
+    botocore Config used for 'service_name'
+    """
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        read_timeout=read_timeout(service_name),
+        retries={'mode': RETRY_MODE, 'max_attempts': max_attempts or MAX_ATTEMPTS},
+        tcp_keepalive=TCP_KEEPALIVE
+    )
+
+def get_client(service_name, max_attempts=None):
+    """
+    The container's boto3 client for 'service_name', created on first call
+    """
+    key = (service_name, max_attempts)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import boto3
+                client = boto3.client(service_name, config=client_config(service_name, max_attempts))
+                _clients[key] = client
+    return client
+
+def get_resource(service_name):
+    """
+    The container's boto3 resource for 'service_name', created on first call
+    """
+    resource = _resources.get(service_name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(service_name)
+            if resource is None:
+                import boto3
+                resource = boto3.resource(service_name, config=client_config(service_name))
+                _resources[service_name] = resource
+    return resource
+
+def get_session():
+    """
+    The container's boto3 session, for credentials (e.g. local URL signing)
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    return _session
+
+def get_table(table_name):
+    """
+    DynamoDB Table object from the container's resource
+    """
+    return get_resource('dynamodb').Table(table_name)
+
+class LazyClient:
+    """
+    Stands in for a client or resource until an attribute is first used
+    """
+    def __init__(self, factory, service_name):
+        self._factory = factory
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(self._factory(self._service_name), name)
+
+def client(service_name, max_attempts=None):
+    """
+    Timed, lazily created client for 'service_name'; safe to call at import
+    time. 'max_attempts' overrides MAX_ATTEMPTS (1 disables botocore retries).
+    """
+    factory = get_client if max_attempts is None else lambda name: get_client(name, max_attempts)
+    return timed_client(LazyClient(factory, service_name), METRIC_NAMES.get(service_name, service_name))
+
+def resource(service_name):
+    """
+    Timed, lazily created resource for 'service_name'; safe to call at import time
+    """
+    return timed_resource(LazyClient(get_resource, service_name), METRIC_NAMES.get(service_name, service_name))
+
+def table(table_name):
+    """
+    Timed, lazily created DynamoDB Table; safe to call at import time
+    """
+    return timed_client(LazyClient(get_table, table_name), 'DynamoDB')
@@ -0,0 +1,65 @@
+"""
+Cheap-first cascade for the fused analyzer's 'cascade' mode.
+
+Labels and moderation are run first. Their results then decide whether the
+expensive analyses are worth a call:
+- faces and celebrities run only when a person-like label is present;
+- text runs only when a text-like label is present;
+- an image that fails moderation skips all three.
+
+A label counts when its name or one of its parents is in the gate's set at
+CASCADE_MIN_CONFIDENCE or above. Every skipped analysis gets a reason, stored
+in the results summary, so saved calls can be weighed against missed
+detections (see benchmarks/bench_cascade.py).
+"""
+import os
+
+# Analyses run unconditionally before the gates are evaluated
+FIRST_STAGE = ['labels', 'moderation']
+
+PERSON_LABELS = {
+    'Person', 'Human', 'People', 'Face', 'Head', 'Man', 'Woman', 'Boy', 'Girl', 'Child', 'Kid', 'Baby',
+    'Teen', 'Adult', 'Male', 'Female', 'Crowd', 'Audience', 'Selfie', 'Portrait', 'Pedestrian'
+}
+
+TEXT_LABELS = {
+    'Text', 'Document', 'Page', 'Book', 'Newspaper', 'Letter', 'Handwriting', 'Receipt', 'Invoice',
+    'Menu', 'Sign', 'Signage', 'Poster', 'Billboard', 'Banner', 'Flyer', 'Brochure', 'Label',
+    'Screenshot', 'License Plate', 'Business Card', 'Calendar', 'Whiteboard', 'Diagram', 'Number',
+    'Word', 'Alphabet', 'Logo'
+}
+
+# analysis -> (labels that let it run, reason recorded when none is present)
+GATES = {
+    'faces': (PERSON_LABELS, 'no person-like label'),
+    'celebrities': (PERSON_LABELS, 'no person-like label'),
+    'text': (TEXT_LABELS, 'no text-like label')
+}
+
+# Matches detect_labels' own MinConfidence, i.e. any returned label counts
+CASCADE_MIN_CONFIDENCE = float(os.environ.get('CASCADE_MIN_CONFIDENCE', 70))
+
+def find_trigger(labels_result, names, min_confidence=CASCADE_MIN_CONFIDENCE):
+    """
+    First label (or parent) in 'names' with enough confidence, else None
+    """
+    for label in labels_result.get('labels', []):
+        if (label.get('confidence') or 0) < min_confidence:
+            continue
+        for name in [label.get('name')] + list(label.get('parents', [])):
+            if name in names:
+                return name
+    return None
+
+def plan_cascade(labels_result, moderation_result, min_confidence=CASCADE_MIN_CONFIDENCE):
+    """
+    {analysis: reason} for the gated analyses to skip. A first-stage result
+    that is missing (switched off by the analysis profile) gates nothing.
+    """
+    skipped = {}
+    for name, (names, reason) in GATES.items():
+        if moderation_result is not None and not moderation_result.get('isSafe', True):
+            skipped[name] = 'unsafe'
+        elif labels_result is not None and not find_trigger(labels_result, names, min_confidence):
+            skipped[name] = reason
+    return skipped
@@ -0,0 +1,89 @@
+"""
+Per-user collection versions for conditional reads.
+
+USER_VERSIONS_TABLE holds one item per user ({userId, version}). Every write
+that changes what the user's image list or results look like calls
+bump_version(user_id) after the write:
+- a new upload record;
+- a status update;
+- stored results;
+- a delete.
+
+The image handler builds its ETags from the version and answers a matching
+If-None-Match with 304. That costs one read of the version item and skips
+the image query and the response body.
+
+The bump always follows the write it covers. A reader can therefore briefly
+get a 304 for data that has just changed, which the next request picks up.
+It can never get a new ETag for old data. A failed bump is logged and does
+not fail the write. The ETags also carry the URL signing window, so cached
+bodies never outlive their pre-signed image URLs.
+"""
+import hashlib
+import os
+
+import aws_clients
+
+USER_VERSIONS_TABLE = os.environ.get('USER_VERSIONS_TABLE')
+
+def bump_version(user_id):
+    """
+    Atomically increment the user's version and return it; None when
+    versioning is off or the update failed
+    """
+    if not USER_VERSIONS_TABLE:
+        return None
+
+    try:
+        response = aws_clients.table(USER_VERSIONS_TABLE).update_item(
+            Key={'userId': user_id},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['version'])
+    except Exception as e:
+        print(f"Error bumping collection version for user {user_id}: {str(e)}")
+        return None
+
+def current_version(user_id):
+    """
+    The user's version (0 before their first write); None when versioning
+    is off or the version cannot be read
+    """
+    if not USER_VERSIONS_TABLE:
+        return None
+
+    try:
+        response = aws_clients.table(USER_VERSIONS_TABLE).get_item(
+            Key={'userId': user_id},
+            ProjectionExpression='version',
+            ConsistentRead=True
+        )
+        return int(response.get('Item', {}).get('version', 0))
+    except Exception as e:
+        print(f"Error reading collection version for user {user_id}: {str(e)}")
+        return None
+
+def make_etag(version, *parts):
+    """
+    Weak ETag for a representation at 'version'; 'parts' are everything
+    else the body depends on (resource, query parameters, signing window)
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches 'etag' (weak comparison)
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(',')}
@@ -0,0 +1,68 @@
+"""
+Conversions between JSON-style results (floats) and DynamoDB values (Decimals).
+
+The boto3 DynamoDB resource rejects floats on write and returns every number
+as a Decimal on read. floats_to_decimals walks a results tree once and only
+copies the dicts and lists that actually contain a float, so the string,
+integer and boolean columns of a results tree (and most of the compact
+encoding) are shared with the input instead of being rebuilt. dumps
+serializes Decimals in the same pass as json.dumps, with no pre-walk.
+"""
+import decimal
+import json
+
+Decimal = decimal.Decimal
+
+# Leaf types that need no conversion
+PLAIN_TYPES = (str, int, bool, type(None))
+
+def floats_to_decimals(obj):
+    """
+    Return 'obj' with every float replaced by an equal Decimal; subtrees
+    without floats are returned as-is rather than copied
+    """
+    obj_type = type(obj)
+
+    if obj_type is float:
+        # str() keeps the shortest repr (97.5, not 97.5000000000000...)
+        return Decimal(str(obj))
+
+    if obj_type is dict:
+        converted = None
+        for key, value in obj.items():
+            if type(value) in PLAIN_TYPES:
+                continue
+            new_value = floats_to_decimals(value)
+            if new_value is not value:
+                if converted is None:
+                    converted = dict(obj)
+                converted[key] = new_value
+        return obj if converted is None else converted
+
+    if obj_type is list:
+        converted = None
+        for index, value in enumerate(obj):
+            if type(value) in PLAIN_TYPES:
+                continue
+            new_value = floats_to_decimals(value)
+            if new_value is not value:
+                if converted is None:
+                    converted = list(obj)
+                converted[index] = new_value
+        return obj if converted is None else converted
+
+    return obj
+
+def decimal_default(obj):
+    """
+    json 'default' hook turning DynamoDB Decimals back into floats
+    """
+    if type(obj) is Decimal:
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj, **kwargs):
+    """
+    json.dumps that accepts Decimals (as returned by DynamoDB)
+    """
+    return json.dumps(obj, default=decimal_default, **kwargs)
@@ -0,0 +1,237 @@
+"""
+Per-invocation metrics in CloudWatch Embedded Metric Format (EMF).
+
+Wrap a lambda_handler with @instrument('<Function>') and each invocation
+prints one EMF record to stdout, which CloudWatch Logs turns into metrics
+with no API calls: Duration, ColdStart, Error, InputBytes and OutputBytes,
+plus the time and call count of every AWS call made through a client
+wrapped with timed_client/timed_resource (RekognitionTime, DynamoDBTime,
+S3Time, ...). The image ID and request ID are attached as properties, so a
+slow record can be traced back to its image with Logs Insights.
+
+Code running in worker threads must be submitted through bind() to add to
+the invocation's record. set_sink replaces the stdout writer, which lets the
+local emulator collect the records instead of printing them.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ImageAnalyzer')
+
+# Deployment stage (dev, prod, ...) set for every function by the template
+ENVIRONMENT = os.environ.get('STAGE', 'local')
+
+DIMENSIONS = [['Environment', 'Function']]
+
+# Client methods that make no request, so are not timed
+UNTIMED_METHODS = {'generate_presigned_url', 'generate_presigned_post', 'get_paginator', 'get_waiter', 'can_paginate'}
+
+# Record of the invocation being handled by the current thread/context
+_current = contextvars.ContextVar('metrics_record', default=None)
+
+def print_record(record):
+    print(json.dumps(record, separators=(',', ':')))
+
+_sink = print_record
+
+def set_sink(sink):
+    """
+    Send EMF records to 'sink' (a callable taking the record dict) instead
+    of stdout; returns the previous sink
+    """
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+class Record:
+    """
+    Metrics and properties collected during one invocation
+    """
+    def __init__(self, function, context=None):
+        self.function = function
+        self.context = context
+        self.metrics = {}
+        self.units = {}
+        self.properties = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value, unit):
+        with self.lock:
+            self.metrics[name] = self.metrics.get(name, 0) + value
+            self.units[name] = unit
+
+    def to_emf(self, timestamp):
+        """
+        The EMF document for this record
+        """
+        emf = {
+            '_aws': {
+                'Timestamp': int(timestamp * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': DIMENSIONS,
+                    'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in self.metrics]
+                }]
+            },
+            'Environment': ENVIRONMENT,
+            'Function': self.function
+        }
+        emf.update(self.properties)
+        emf.update({name: round(value, 3) if isinstance(value, float) else value for name, value in self.metrics.items()})
+        return emf
+
+def put_metric(name, value, unit='Milliseconds'):
+    """
+    Add 'value' to metric 'name' of the current invocation; values of the
+    same name are summed. Does nothing outside an instrumented handler.
+    """
+    record = _current.get()
+    if record is not None:
+        record.add(name, value, unit)
+
+def set_property(name, value):
+    """
+    Attach a non-metric value (e.g. imageId) to the current invocation's record
+    """
+    record = _current.get()
+    if record is not None:
+        record.properties[name] = value
+
+def remaining_seconds():
+    """
+    Seconds before the current invocation times out, or None outside an
+    instrumented handler
+    """
+    record = _current.get()
+    get_remaining = getattr(record and record.context, 'get_remaining_time_in_millis', None)
+    return get_remaining() / 1000 if get_remaining else None
+
+@contextmanager
+def timer(name):
+    """
+    Add the wall time of the block to metric 'name', in milliseconds
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        put_metric(name, (time.perf_counter() - start) * 1000)
+
+def bind(func):
+    """
+    Wrap 'func' to run in a copy of the caller's context, so metrics it
+    records from a worker thread land in the caller's invocation
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+class TimedClient:
+    """
+    Proxy for a boto3 client (or resource Table) that records the time and
+    number of calls as <service>Time and <service>Calls
+    """
+    def __init__(self, client, service):
+        self._client = client
+        self._service = service
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name in UNTIMED_METHODS or name.startswith('_') or not callable(attribute) or isinstance(attribute, type):
+            return attribute
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                put_metric(f"{self._service}Time", (time.perf_counter() - start) * 1000)
+                put_metric(f"{self._service}Calls", 1, 'Count')
+        return call
+
+class TimedResource(TimedClient):
+    """
+    Proxy for a boto3 resource; its own batch calls and its Table() objects
+    are timed like a client
+    """
+    def Table(self, name):
+        return TimedClient(self._client.Table(name), self._service)
+
+def timed_client(client, service):
+    return TimedClient(client, service)
+
+def timed_resource(resource, service):
+    return TimedResource(resource, service)
+
+def payload_bytes(payload):
+    """
+    Size of a payload as Lambda serializes it
+    """
+    try:
+        return len(json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
+
+def image_id_of(event):
+    """
+    Best-effort image ID for an event: explicit imageId, the file name of
+    imageKey or an S3 record's key, or the API path parameter
+    """
+    if not isinstance(event, dict):
+        return None
+    if event.get('imageId'):
+        return event['imageId']
+
+    key = event.get('imageKey')
+    records = event.get('Records') or []
+    if not key and records:
+        key = records[0].get('s3', {}).get('object', {}).get('key')
+    if key:
+        return os.path.splitext(os.path.basename(key))[0]
+
+    return (event.get('pathParameters') or {}).get('imageId')
+
+def instrument(function):
+    """
+    Decorator for a lambda_handler that emits one EMF record per invocation
+    under Function=<function>
+    """
+    def decorator(handler):
+        state = {'cold': True}
+
+        def wrapper(event, context):
+            record = Record(function, context)
+            token = _current.set(record)
+            cold, state['cold'] = state['cold'], False
+            start = time.time()
+            error = None
+            result = None
+            try:
+                result = handler(event, context)
+                return result
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                _current.reset(token)
+                record.add('Duration', (time.time() - start) * 1000, 'Milliseconds')
+                record.add('ColdStart', int(cold), 'Count')
+                record.add('Error', int(error is not None), 'Count')
+                record.add('InputBytes', payload_bytes(event), 'Bytes')
+                record.add('OutputBytes', payload_bytes(result), 'Bytes')
+                record.properties.setdefault('imageId', image_id_of(event))
+                record.properties['requestId'] = getattr(context, 'aws_request_id', None)
+                if error:
+                    record.properties['error'] = error
+                try:
+                    _sink(record.to_emf(start))
+                except Exception as e:
+                    print(f"Error emitting metrics: {str(e)}")
+
+        wrapper.__name__ = handler.__name__
+        wrapper.__doc__ = handler.__doc__
+        return wrapper
+    return decorator
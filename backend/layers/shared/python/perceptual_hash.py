@@ -0,0 +1,182 @@
+"""
+Perceptual hashes and a multi-index hash table for near-duplicate images.
+
+The hash is a 64-bit dHash. The image is reduced to 9x8 grayscale pixels,
+and each bit records whether a pixel is brighter than its right neighbour.
+Resizing, recompression and re-exporting barely move it; crops and
+rotations do.
+
+HASH_INDEX_TABLE indexes the hashes with multi-index hashing. A hash is cut
+into CHUNKS = MAX_DISTANCE + 1 chunks (16 bits each at the default distance
+of 3), and every image gets one posting per chunk in each of two scopes: its
+owner's (scope = userId) and the global one (scope = GLOBAL_SCOPE). A
+posting is
+{bucket: "<scope>#<chunk number>#<chunk hex>", ref: "<userId>/<imageId>", hash}.
+
+Two hashes at most MAX_DISTANCE bits apart agree on at least one whole chunk
+(pigeonhole). A lookup therefore reads CHUNKS buckets and keeps the
+candidates within MAX_DISTANCE. It finds every near-duplicate. With 1M
+hashes a 16-bit bucket holds about 15 of them; a larger distance means more,
+narrower chunks, so more and fuller buckets per lookup and more postings
+per image. The layout follows NEAR_DUPLICATE_MAX_DISTANCE, so images indexed
+under another distance are not found (and their postings are not deleted)
+until they are indexed again.
+
+Duplicate groups live in the same table under "<userId>#groups", one item
+per grouped image: {bucket, ref: imageId, groupId}. index_image puts an
+image in its group and writes its postings; the duplicate detector calls it
+for analyzed images and the workflow trigger for images served from the
+analysis cache, whose entries keep the hash.
+"""
+import os
+
+HASH_INDEX_TABLE = os.environ.get('HASH_INDEX_TABLE')
+
+HASH_BITS = 64
+
+# Hamming distance up to which two images are near-duplicates
+MAX_DISTANCE = max(0, min(int(os.environ.get('NEAR_DUPLICATE_MAX_DISTANCE', 3)), 10))
+
+# One more chunk than the distance, so a near-duplicate shares a whole chunk
+CHUNKS = MAX_DISTANCE + 1
+
+# Bits per chunk, the first HASH_BITS % CHUNKS chunks one bit wider
+CHUNK_WIDTHS = [HASH_BITS // CHUNKS + (1 if i < HASH_BITS % CHUNKS else 0) for i in range(CHUNKS)]
+
+# Postings read per bucket. Flat images (blank pages, black frames) share a
+# few hashes, and their buckets are cut off here rather than read whole.
+MAX_BUCKET_ITEMS = 1000
+
+GLOBAL_SCOPE = '*'
+
+# Side of the grayscale image the JPEG decoder is asked for before the
+# final resize, so big photos are decoded at a fraction of their size
+DRAFT_SIZE = 64
+
+def dhash(image):
+    """
+    64-bit difference hash of a PIL image
+    """
+    from PIL import Image
+
+    if image.format == 'JPEG':
+        image.draft('L', (DRAFT_SIZE, DRAFT_SIZE))
+    pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = (value << 1) | (1 if left > pixels[row * 9 + column + 1] else 0)
+    return value
+
+def to_hex(value):
+    return f"{value:016x}"
+
+def from_hex(text):
+    return int(text, 16)
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def image_ref(user_id, image_id):
+    return f"{user_id}/{image_id}"
+
+def split_ref(ref):
+    user_id, image_id = ref.split('/', 1)
+    return user_id, image_id
+
+def chunk_values(value):
+    """
+    The CHUNKS chunks of a hash, most significant first
+    """
+    chunks = []
+    shift = HASH_BITS
+    for width in CHUNK_WIDTHS:
+        shift -= width
+        chunks.append((value >> shift) & ((1 << width) - 1))
+    return chunks
+
+def buckets(scope, value):
+    """
+    Posting partition keys of a hash in one scope, one per chunk
+    """
+    return [
+        f"{scope}#{i}#{chunk:0{(width + 3) // 4}x}"
+        for i, (chunk, width) in enumerate(zip(chunk_values(value), CHUNK_WIDTHS))
+    ]
+
+def posting_items(user_id, image_id, value):
+    """
+    Every posting of an image, in its owner's scope and the global one
+    """
+    ref = image_ref(user_id, image_id)
+    return [
+        {'bucket': bucket, 'ref': ref, 'hash': to_hex(value)}
+        for scope in (user_id, GLOBAL_SCOPE) for bucket in buckets(scope, value)
+    ]
+
+def group_key(user_id):
+    return f"{user_id}#groups"
+
+def index_keys(user_id, image_id, hash_hex):
+    """
+    Keys of every index item of an image: its postings and its group entry
+    """
+    keys = [{'bucket': item['bucket'], 'ref': item['ref']} for item in posting_items(user_id, image_id, from_hex(hash_hex))]
+    keys.append({'bucket': group_key(user_id), 'ref': image_id})
+    return keys
+
+def find_near_duplicates(table, scope, value, exclude_ref=None, max_distance=MAX_DISTANCE):
+    """
+    [(distance, ref)] of the hashes in 'scope' within 'max_distance' of
+    'value', closest first
+    """
+    candidates = {}
+    for bucket in buckets(scope, value):
+        query_args = {
+            'KeyConditionExpression': "#bucket = :bucket",
+            'ExpressionAttributeNames': {'#bucket': 'bucket', '#ref': 'ref', '#hash': 'hash'},
+            'ExpressionAttributeValues': {':bucket': bucket},
+            'ProjectionExpression': "#ref, #hash",
+            'Limit': MAX_BUCKET_ITEMS
+        }
+        items = table.query(**query_args).get('Items', [])
+        if len(items) >= MAX_BUCKET_ITEMS:
+            print(f"Hash bucket {bucket} cut off at {MAX_BUCKET_ITEMS} postings")
+        for item in items:
+            if item['ref'] != exclude_ref:
+                candidates[item['ref']] = from_hex(item['hash'])
+
+    matches = [(hamming(value, other), ref) for ref, other in candidates.items()]
+    return sorted(match for match in matches if match[0] <= max_distance)
+
+def join_group(table, user_id, image_id, matches):
+    """
+    Put the image in the group of its closest near-duplicate (which starts
+    one named after itself when it has none) and return the group ID
+    """
+    closest_id = split_ref(matches[0][1])[1]
+    closest = table.get_item(Key={'bucket': group_key(user_id), 'ref': closest_id}).get('Item')
+    group_id = closest['groupId'] if closest else closest_id
+
+    with table.batch_writer(overwrite_by_pkeys=['bucket', 'ref']) as batch:
+        if not closest:
+            batch.put_item(Item={'bucket': group_key(user_id), 'ref': closest_id, 'groupId': group_id})
+        batch.put_item(Item={'bucket': group_key(user_id), 'ref': image_id, 'groupId': group_id})
+    return group_id
+
+def write_postings(table, user_id, image_id, value):
+    with table.batch_writer(overwrite_by_pkeys=['bucket', 'ref']) as batch:
+        for item in posting_items(user_id, image_id, value):
+            batch.put_item(Item=item)
+
+def index_image(table, user_id, image_id, value):
+    """
+    Group an image with its near-duplicates in its owner's library and index
+    its hash; returns the group ID (None when it has no near-duplicate)
+    """
+    matches = find_near_duplicates(table, user_id, value, exclude_ref=image_ref(user_id, image_id))
+    group_id = join_group(table, user_id, image_id, matches) if matches else None
+    write_postings(table, user_id, image_id, value)
+    return group_id
@@ -0,0 +1,245 @@
+"""
+Client-side Rekognition rate limiting shared by all detector invocations.
+
+Each Rekognition operation has a token bucket stored as one item in the
+RATE_LIMIT_TABLE ({bucketKey, tokens, updatedAt}), refilled at the
+operation's TPS limit and holding at most RATE_LIMIT_BURST_SECONDS worth of
+tokens. A call reserves a token with an optimistic compare-and-set. Once
+the bucket is empty, the balance goes negative and each caller sleeps until
+its own reserved token is due, so waiting invocations queue without polling
+the table. Conflicting updates are retried with jittered backoff. During an
+upload burst, Rekognition therefore sees a steady rate at the quota instead
+of a spike that throttles.
+
+Throttling errors that still reach Rekognition are retried with full-jitter
+exponential backoff, on a client with botocore's own retries turned off. The
+limiter fails open: if the table cannot be read or written, or a bucket stays
+too contended to update, calls go straight through rather than failing the
+image. Only a real shortage of tokens raises.
+
+Waiting for a token and backing off both stop early enough that the call
+itself (up to the client's connect and read timeouts) still fits in the
+invocation's remaining time. A call that cannot get through in time raises
+RateLimitExceeded, which the state machine retries, instead of running the
+Lambda into its timeout.
+
+rate_limited(service_name) returns the plain client when RATE_LIMIT_TABLE is
+not set.
+"""
+import json
+import os
+import random
+import time
+from decimal import Decimal
+
+import aws_clients
+from metrics import put_metric, remaining_seconds
+
+RATE_LIMIT_TABLE = os.environ.get('RATE_LIMIT_TABLE')
+
+# Default per-operation TPS: a little under the 50 TPS default quota of the
+# image APIs, so scheduling jitter in call timing does not trip the service's
+# own bucket. REKOGNITION_TPS_LIMITS overrides single operations, e.g.
+# '{"RecognizeCelebrities": 20}'
+REKOGNITION_TPS = float(os.environ.get('REKOGNITION_TPS', 45))
+REKOGNITION_TPS_LIMITS = json.loads(os.environ.get('REKOGNITION_TPS_LIMITS') or '{}')
+
+# Bucket capacity, in seconds of the operation's rate
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', 1))
+
+# Longest a call waits for a token or retries throttling before giving up;
+# lowered per call to what the invocation's remaining time allows
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', 20))
+
+# Time kept free after the wait, besides the call's own timeouts, for the
+# handler to finish and return
+DEADLINE_MARGIN_SECONDS = 1
+
+# Error codes that mean the service shed the call
+THROTTLING_CODES = {'ThrottlingException', 'ProvisionedThroughputExceededException', 'LimitExceededException'}
+
+# Compare-and-set retries when concurrent invocations update a bucket at once
+CONFLICT_ATTEMPTS = 8
+CONFLICT_BACKOFF_SECONDS = 0.01
+
+# Backoff for throttled calls: full jitter over base * 2^attempt, capped
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 5
+
+_random = random.Random()
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when no token (or successful retry) is available within the
+    maximum wait; retried by the state machine like a throttling error
+    """
+
+class BucketContended(Exception):
+    """
+    Raised when every compare-and-set on a bucket lost to another
+    invocation; says nothing about the tokens left, so callers fail open
+    """
+
+def operation_name(method):
+    """
+    'detect_moderation_labels' -> 'DetectModerationLabels'
+    """
+    return ''.join(part.capitalize() for part in method.split('_'))
+
+class TokenBucketLimiter:
+    """
+    Token buckets, one per operation, shared through a DynamoDB table
+    """
+    def __init__(self, table, default_rate=REKOGNITION_TPS, rates=None, burst_seconds=RATE_LIMIT_BURST_SECONDS,
+                 prefix='rekognition'):
+        self.table = table
+        self.default_rate = default_rate
+        self.rates = rates if rates is not None else REKOGNITION_TPS_LIMITS
+        self.burst_seconds = burst_seconds
+        self.prefix = prefix
+
+    def rate(self, operation):
+        return float(self.rates.get(operation, self.default_rate))
+
+    def reserve(self, operation, max_wait, now=None):
+        """
+        Take the next token for 'operation' and return the seconds until it
+        is due (0 when one is available now). The balance may go negative:
+        callers queue by reserving future tokens, so each waits exactly for
+        its own slot instead of polling the table. Returns None when the slot
+        is more than 'max_wait' away, leaving the bucket untouched.
+        """
+        rate = self.rate(operation)
+        capacity = max(1.0, rate * self.burst_seconds)
+        key = {'bucketKey': f"{self.prefix}#{operation}"}
+
+        for attempt in range(CONFLICT_ATTEMPTS):
+            item = self.table.get_item(Key=key, ConsistentRead=True).get('Item')
+            now_ms = int((time.time() if now is None else now) * 1000)
+            if item:
+                elapsed = max(0, now_ms - int(item['updatedAt'])) / 1000
+                tokens = min(capacity, float(item['tokens']) + elapsed * rate)
+            else:
+                tokens = capacity
+
+            wait = max(0.0, 1 - tokens) / rate
+            if wait > max_wait:
+                return None
+
+            try:
+                if item:
+                    condition = 'updatedAt = :previous AND tokens = :previousTokens'
+                    values = {':previous': item['updatedAt'], ':previousTokens': item['tokens']}
+                else:
+                    condition = 'attribute_not_exists(bucketKey)'
+                    values = {}
+                self.table.update_item(
+                    Key=key,
+                    UpdateExpression='SET tokens = :tokens, updatedAt = :now',
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues={
+                        ':tokens': Decimal(str(round(tokens - 1, 3))),
+                        ':now': now_ms,
+                        **values
+                    }
+                )
+                return wait
+            except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Another invocation reserved first; retry against its state
+                # after a short jittered pause
+                now = None
+                time.sleep(_random.uniform(0, CONFLICT_BACKOFF_SECONDS * 2 ** attempt))
+
+        raise BucketContended(f"{operation} bucket still contended after {CONFLICT_ATTEMPTS} attempts")
+
+    def acquire(self, operation, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS):
+        """
+        Block until a token for 'operation' is due; returns the seconds
+        waited. Raises RateLimitExceeded if that would take over 'max_wait',
+        BucketContended if the bucket could not be updated.
+        """
+        start = time.time()
+        wait = self.reserve(operation, max_wait)
+        if wait is None:
+            raise RateLimitExceeded(f"No {operation} capacity within {max_wait:.0f}s")
+        if wait:
+            time.sleep(wait)
+        return time.time() - start
+
+def is_throttling(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+class RateLimitedClient:
+    """
+    Proxy for a Rekognition client that takes a token from the shared bucket
+    before each operation and retries throttled calls with jittered backoff.
+    'call_seconds' is the longest one call can take (its connect and read
+    timeouts), kept free of the invocation's remaining time.
+    """
+    def __init__(self, client, limiter, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS, call_seconds=0):
+        self._client = client
+        self._limiter = limiter
+        self._max_wait = max_wait
+        self._call_seconds = call_seconds
+
+    def max_wait(self):
+        """
+        Seconds a call may spend waiting in this invocation
+        """
+        remaining = remaining_seconds()
+        if remaining is None:
+            return self._max_wait
+        return max(0, min(self._max_wait, remaining - self._call_seconds - DEADLINE_MARGIN_SECONDS))
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or not name.startswith(('detect_', 'recognize_')):
+            return attribute
+
+        operation = operation_name(name)
+
+        def call(*args, **kwargs):
+            start = time.time()
+            max_wait = self.max_wait()
+            attempt = 0
+            while True:
+                remaining = max_wait - (time.time() - start)
+                try:
+                    waited = self._limiter.acquire(operation, max(0, remaining))
+                except RateLimitExceeded:
+                    raise
+                except Exception as e:
+                    # Fail open: an unavailable or contended limiter table
+                    # (BucketContended) must not fail images
+                    print(f"Rate limiter unavailable, calling {operation} directly: {str(e)}")
+                    waited = 0
+                put_metric('RateLimitWait', waited * 1000)
+
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception as e:
+                    if not is_throttling(e):
+                        raise
+                    put_metric('Throttled', 1, 'Count')
+                    delay = _random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                    if time.time() - start + delay > max_wait:
+                        raise
+                    print(f"{operation} throttled, retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    attempt += 1
+        return call
+
+def rate_limited(service_name='rekognition'):
+    """
+    Client for 'service_name' behind the shared limiter when RATE_LIMIT_TABLE
+    is configured (with a single botocore attempt, since the limiter retries
+    throttling itself); otherwise the plain client
+    """
+    if not RATE_LIMIT_TABLE:
+        return aws_clients.client(service_name)
+    return RateLimitedClient(
+        aws_clients.client(service_name, max_attempts=1),
+        TokenBucketLimiter(aws_clients.table(RATE_LIMIT_TABLE)),
+        call_seconds=aws_clients.CONNECT_TIMEOUT_SECONDS + aws_clients.read_timeout(service_name)
+    )
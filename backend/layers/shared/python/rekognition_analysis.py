@@ -0,0 +1,265 @@
+"""
+Rekognition calls and result formatting shared by the detector functions
+and the fused analyzer. Each analyze_* function makes one Rekognition call
+and returns the formatted result stored under the matching results key.
+"""
+import time
+
+def s3_image(bucket, image_key):
+    """
+    Build the Rekognition Image parameter for an S3 object
+    """
+    return {
+        'S3Object': {
+            'Bucket': bucket,
+            'Name': image_key
+        }
+    }
+
+def analyze_labels(rekognition, bucket, image_key):
+    """
+    Detect labels (objects and scenes) in an image
+    """
+    response = rekognition.detect_labels(
+        Image=s3_image(bucket, image_key),
+        MaxLabels=50,
+        MinConfidence=70  # Only return labels with at least 70% confidence
+    )
+
+    # Process and format the results
+    labels = []
+    for label in response.get('Labels', []):
+        label_info = {
+            'name': label.get('Name'),
+            'confidence': round(label.get('Confidence'), 2),
+            'parents': [parent.get('Name') for parent in label.get('Parents', [])]
+        }
+
+        # Add bounding boxes if available
+        instances = label.get('Instances', [])
+        if instances:
+            label_info['instances'] = []
+            for instance in instances:
+                box = instance.get('BoundingBox', {})
+                label_info['instances'].append({
+                    'confidence': round(instance.get('Confidence'), 2),
+                    'boundingBox': {
+                        'width': box.get('Width'),
+                        'height': box.get('Height'),
+                        'left': box.get('Left'),
+                        'top': box.get('Top')
+                    }
+                })
+
+        labels.append(label_info)
+
+    # Sort labels by confidence (highest first)
+    labels.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+    print(f"Detected {len(labels)} labels")
+
+    return {
+        'timestamp': int(time.time()),
+        'labels': labels
+    }
+
+def analyze_moderation(rekognition, bucket, image_key):
+    """
+    Detect moderation labels in an image
+    """
+    response = rekognition.detect_moderation_labels(
+        Image=s3_image(bucket, image_key),
+        MinConfidence=50  # Only return labels with at least 50% confidence
+    )
+
+    # Process and format the results
+    moderation_labels = []
+    for label in response.get('ModerationLabels', []):
+        label_info = {
+            'name': label.get('Name'),
+            'parentName': label.get('ParentName'),
+            'confidence': round(label.get('Confidence'), 2)
+        }
+        moderation_labels.append(label_info)
+
+    # Sort labels by confidence (highest first)
+    moderation_labels.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+    # Determine overall safety rating
+    is_safe = len(moderation_labels) == 0
+
+    print(f"Detected {len(moderation_labels)} moderation labels")
+
+    return {
+        'timestamp': int(time.time()),
+        'isSafe': is_safe,
+        'moderationLabels': moderation_labels
+    }
+
+def analyze_faces(rekognition, bucket, image_key):
+    """
+    Detect and analyze faces in an image
+    """
+    response = rekognition.detect_faces(
+        Image=s3_image(bucket, image_key),
+        Attributes=['ALL']  # Get all face attributes
+    )
+
+    # Process and format the results
+    faces = []
+    for face in response.get('FaceDetails', []):
+        # Extract main face properties
+        face_info = {
+            'confidence': round(face.get('Confidence'), 2),
+            'boundingBox': face.get('BoundingBox', {}),
+            'ageRange': face.get('AgeRange', {}),
+            'gender': {
+                'value': face.get('Gender', {}).get('Value'),
+                'confidence': round(face.get('Gender', {}).get('Confidence', 0), 2)
+            },
+            'emotions': []
+        }
+
+        # Extract emotion information
+        emotions = face.get('Emotions', [])
+        for emotion in emotions:
+            if emotion.get('Confidence') > 10:  # Only include emotions with reasonable confidence
+                face_info['emotions'].append({
+                    'type': emotion.get('Type'),
+                    'confidence': round(emotion.get('Confidence'), 2)
+                })
+
+        # Sort emotions by confidence
+        face_info['emotions'].sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+        # Extract facial features (smile, eyeglasses, beard, etc.)
+        for feature in ['Smile', 'Eyeglasses', 'Sunglasses', 'Beard', 'Mustache', 'EyesOpen', 'MouthOpen']:
+            if feature in face:
+                face_info[feature.lower()] = {
+                    'value': face.get(feature, {}).get('Value', False),
+                    'confidence': round(face.get(feature, {}).get('Confidence', 0), 2)
+                }
+
+        # Extract quality information
+        if 'Quality' in face:
+            face_info['quality'] = {
+                'brightness': round(face.get('Quality', {}).get('Brightness', 0), 2),
+                'sharpness': round(face.get('Quality', {}).get('Sharpness', 0), 2)
+            }
+
+        # Extract pose information
+        if 'Pose' in face:
+            face_info['pose'] = {
+                'roll': round(face.get('Pose', {}).get('Roll', 0), 2),
+                'yaw': round(face.get('Pose', {}).get('Yaw', 0), 2),
+                'pitch': round(face.get('Pose', {}).get('Pitch', 0), 2)
+            }
+
+        faces.append(face_info)
+
+    # Sort faces by confidence
+    faces.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+    print(f"Detected {len(faces)} faces")
+
+    return {
+        'timestamp': int(time.time()),
+        'faceCount': len(faces),
+        'faces': faces
+    }
+
+def analyze_celebrities(rekognition, bucket, image_key):
+    """
+    Recognize celebrities in an image
+    """
+    response = rekognition.recognize_celebrities(
+        Image=s3_image(bucket, image_key)
+    )
+
+    # Process and format the results
+    celebrities = []
+    for celebrity in response.get('CelebrityFaces', []):
+        celebrity_info = {
+            'name': celebrity.get('Name'),
+            'confidence': round(celebrity.get('MatchConfidence'), 2),
+            'boundingBox': celebrity.get('Face', {}).get('BoundingBox', {})
+        }
+
+        # Add URLs if available
+        urls = celebrity.get('Urls', [])
+        if urls:
+            celebrity_info['urls'] = urls
+
+        celebrities.append(celebrity_info)
+
+    # Get information about unrecognized faces
+    unrecognized_faces = []
+    for face in response.get('UnrecognizedFaces', []):
+        unrecognized_faces.append({
+            'boundingBox': face.get('BoundingBox', {}),
+            'confidence': round(face.get('Confidence', 0), 2)
+        })
+
+    # Sort celebrities by confidence
+    celebrities.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+    print(f"Recognized {len(celebrities)} celebrities")
+
+    return {
+        'timestamp': int(time.time()),
+        'celebrityCount': len(celebrities),
+        'celebrities': celebrities,
+        'unrecognizedFaces': unrecognized_faces
+    }
+
+def analyze_text(rekognition, bucket, image_key):
+    """
+    Detect and extract text from an image
+    """
+    response = rekognition.detect_text(
+        Image=s3_image(bucket, image_key)
+    )
+
+    # Extract text detections, separating words and lines
+    lines = []
+    words = []
+
+    for detection in response.get('TextDetections', []):
+        detection_info = {
+            'detectedText': detection.get('DetectedText'),
+            'confidence': round(detection.get('Confidence'), 2),
+            'boundingBox': detection.get('Geometry', {}).get('BoundingBox', {})
+        }
+
+        # Separate lines and words
+        if detection.get('Type') == 'LINE':
+            lines.append(detection_info)
+        elif detection.get('Type') == 'WORD':
+            words.append(detection_info)
+
+    # Sort by confidence
+    lines.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+    words.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+
+    # Combine all text lines
+    combined_text = ' '.join([line.get('detectedText', '') for line in lines])
+
+    print(f"Detected {len(lines)} text lines and {len(words)} words")
+
+    return {
+        'timestamp': int(time.time()),
+        'hasText': len(lines) > 0,
+        'combinedText': combined_text,
+        'lines': lines,
+        'words': words
+    }
+
+# Analyses in the same order as the ParallelImageProcessing branches,
+# which is the order results_processor reads analysisResults in
+ANALYSES = [
+    ('labels', analyze_labels),
+    ('moderation', analyze_moderation),
+    ('faces', analyze_faces),
+    ('celebrities', analyze_celebrities),
+    ('text', analyze_text)
+]
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+Compact columnar encoding for the labels, faces and text detector outputs.
+
+The verbose shape repeats keys like 'boundingBox', 'confidence', 'width'...
+for every detection, which counts against the 256 KB Step Functions payload
+limit and the 400 KB DynamoDB item limit. The compact shape stores one
+array per field, quantizes confidences to hundredths and box coordinates to
+1/BOX_SCALE, and replaces repeated names with indexes into a string table.
+
+Detectors call encode_result when RESULT_ENCODING is 'compact'. Readers call
+decode_result/decode_results, which pass the verbose shape through
+unchanged, so both shapes can coexist in the table.
+"""
+import os
+
+# 'json' (verbose, the default) or 'compact'
+RESULT_ENCODING = os.environ.get('RESULT_ENCODING', 'json')
+
+ENCODING_NAME = 'columnar-v1'
+
+# Confidences are already rounded to 2 decimals, so hundredths are lossless
+CONFIDENCE_SCALE = 100
+
+# Box coordinates are fractions of the image size; 1e-4 is sub-pixel up to 10k px
+BOX_SCALE = 10000
+
+FACE_FEATURES = ['smile', 'eyeglasses', 'sunglasses', 'beard', 'mustache', 'eyesopen', 'mouthopen']
+
+class StringTable:
+    """
+    Assigns each distinct string an index in first-seen order
+    """
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+def q_confidence(value):
+    return None if value is None else int(round(float(value) * CONFIDENCE_SCALE))
+
+def dq_confidence(value):
+    return None if value is None else round(float(value) / CONFIDENCE_SCALE, 2)
+
+def q_box(box, keys):
+    """
+    Quantize a bounding box into [left, top, width, height] (None if empty)
+    """
+    if not box:
+        return None
+    return [int(round(float(box.get(key) or 0) * BOX_SCALE)) for key in keys]
+
+def dq_box(values, keys):
+    if values is None:
+        return {}
+    return {key: round(float(value) / BOX_SCALE, 4) for key, value in zip(keys, values)}
+
+# Key names used by the verbose shape: label instances use lower case,
+# raw Rekognition boxes (faces, text) keep Rekognition's capitalization
+LOWER_BOX_KEYS = ['left', 'top', 'width', 'height']
+UPPER_BOX_KEYS = ['Left', 'Top', 'Width', 'Height']
+
+def encode_labels(result):
+    strings = StringTable()
+    labels = result.get('labels', [])
+    instance_label = []
+    instance_confidence = []
+    instance_box = []
+
+    for label_index, label in enumerate(labels):
+        for instance in label.get('instances', []):
+            instance_label.append(label_index)
+            instance_confidence.append(q_confidence(instance.get('confidence')))
+            instance_box.append(q_box(instance.get('boundingBox'), LOWER_BOX_KEYS))
+
+    return {
+        'encoding': ENCODING_NAME,
+        'timestamp': result.get('timestamp'),
+        'strings': strings.strings,
+        'name': [strings.add(label.get('name')) for label in labels],
+        'confidence': [q_confidence(label.get('confidence')) for label in labels],
+        'parents': [[strings.add(parent) for parent in label.get('parents', [])] for label in labels],
+        'instanceLabel': instance_label,
+        'instanceConfidence': instance_confidence,
+        'instanceBox': instance_box
+    }
+
+def decode_labels(encoded):
+    strings = encoded.get('strings', [])
+    labels = [
+        {
+            'name': strings[int(name)],
+            'confidence': dq_confidence(confidence),
+            'parents': [strings[int(parent)] for parent in parents]
+        }
+        for name, confidence, parents in zip(encoded.get('name', []), encoded.get('confidence', []), encoded.get('parents', []))
+    ]
+
+    for label_index, confidence, box in zip(encoded.get('instanceLabel', []), encoded.get('instanceConfidence', []), encoded.get('instanceBox', [])):
+        labels[int(label_index)].setdefault('instances', []).append({
+            'confidence': dq_confidence(confidence),
+            'boundingBox': dq_box(box, LOWER_BOX_KEYS)
+        })
+
+    return {
+        'timestamp': encoded.get('timestamp'),
+        'labels': labels
+    }
+
+def encode_faces(result):
+    strings = StringTable()
+    faces = result.get('faces', [])
+
+    def column(path):
+        values = []
+        for face in faces:
+            value = face
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            values.append(value)
+        return values
+
+    encoded = {
+        'encoding': ENCODING_NAME,
+        'timestamp': result.get('timestamp'),
+        'faceCount': result.get('faceCount', len(faces)),
+        'strings': strings.strings,
+        'confidence': [q_confidence(c) for c in column(['confidence'])],
+        'box': [q_box(face.get('boundingBox'), UPPER_BOX_KEYS) for face in faces],
+        'ageLow': column(['ageRange', 'Low']),
+        'ageHigh': column(['ageRange', 'High']),
+        'gender': [None if g is None else strings.add(g) for g in column(['gender', 'value'])],
+        'genderConfidence': [q_confidence(c) for c in column(['gender', 'confidence'])],
+        'emotions': [
+            [[strings.add(emotion.get('type')), q_confidence(emotion.get('confidence'))] for emotion in face.get('emotions', [])]
+            for face in faces
+        ],
+        'quality': [
+            [q_confidence(face['quality'].get('brightness')), q_confidence(face['quality'].get('sharpness'))] if 'quality' in face else None
+            for face in faces
+        ],
+        'pose': [
+            [q_confidence(face['pose'].get(axis)) for axis in ('roll', 'yaw', 'pitch')] if 'pose' in face else None
+            for face in faces
+        ]
+    }
+
+    # Each feature is [value, confidence] per face, or None when absent
+    for feature in FACE_FEATURES:
+        encoded[feature] = [
+            [bool(face[feature].get('value')), q_confidence(face[feature].get('confidence'))] if feature in face else None
+            for face in faces
+        ]
+
+    return encoded
+
+def decode_faces(encoded, limit=None):
+    strings = encoded.get('strings', [])
+    faces = []
+
+    for i, confidence in enumerate(encoded.get('confidence', [])[:limit]):
+        age_low = encoded['ageLow'][i]
+        age_high = encoded['ageHigh'][i]
+        gender = encoded['gender'][i]
+
+        face = {
+            'confidence': dq_confidence(confidence),
+            'boundingBox': dq_box(encoded['box'][i], UPPER_BOX_KEYS),
+            'ageRange': {} if age_low is None and age_high is None else {'Low': int(age_low), 'High': int(age_high)},
+            'gender': {
+                'value': None if gender is None else strings[int(gender)],
+                'confidence': dq_confidence(encoded['genderConfidence'][i])
+            },
+            'emotions': [
+                {'type': strings[int(emotion_type)], 'confidence': dq_confidence(emotion_confidence)}
+                for emotion_type, emotion_confidence in encoded['emotions'][i]
+            ]
+        }
+
+        for feature in FACE_FEATURES:
+            value = encoded.get(feature, [None] * (i + 1))[i]
+            if value is not None:
+                face[feature] = {'value': bool(value[0]), 'confidence': dq_confidence(value[1])}
+
+        if encoded['quality'][i] is not None:
+            brightness, sharpness = encoded['quality'][i]
+            face['quality'] = {'brightness': dq_confidence(brightness), 'sharpness': dq_confidence(sharpness)}
+
+        if encoded['pose'][i] is not None:
+            roll, yaw, pitch = encoded['pose'][i]
+            face['pose'] = {'roll': dq_confidence(roll), 'yaw': dq_confidence(yaw), 'pitch': dq_confidence(pitch)}
+
+        faces.append(face)
+
+    return {
+        'timestamp': encoded.get('timestamp'),
+        'faceCount': int(encoded.get('faceCount', len(encoded.get('confidence', [])))),
+        'faces': faces
+    }
+
+def encode_detections(detections, strings):
+    return {
+        'text': [strings.add(detection.get('detectedText')) for detection in detections],
+        'confidence': [q_confidence(detection.get('confidence')) for detection in detections],
+        'box': [q_box(detection.get('boundingBox'), UPPER_BOX_KEYS) for detection in detections]
+    }
+
+def decode_detections(encoded, strings):
+    return [
+        {
+            'detectedText': strings[int(text)],
+            'confidence': dq_confidence(confidence),
+            'boundingBox': dq_box(box, UPPER_BOX_KEYS)
+        }
+        for text, confidence, box in zip(encoded.get('text', []), encoded.get('confidence', []), encoded.get('box', []))
+    ]
+
+def encode_text(result):
+    # combinedText and hasText are rebuilt from the lines on decode
+    strings = StringTable()
+    return {
+        'encoding': ENCODING_NAME,
+        'timestamp': result.get('timestamp'),
+        'strings': strings.strings,
+        'lines': encode_detections(result.get('lines', []), strings),
+        'words': encode_detections(result.get('words', []), strings)
+    }
+
+def decode_text(encoded, include_words=True):
+    strings = encoded.get('strings', [])
+    lines = decode_detections(encoded.get('lines', {}), strings)
+    words = decode_detections(encoded.get('words', {}), strings) if include_words else []
+    return {
+        'timestamp': encoded.get('timestamp'),
+        'hasText': len(lines) > 0,
+        'combinedText': ' '.join([line.get('detectedText', '') for line in lines]),
+        'lines': lines,
+        'words': words
+    }
+
+ENCODERS = {
+    'labels': encode_labels,
+    'faces': encode_faces,
+    'text': encode_text
+}
+
+DECODERS = {
+    'labels': decode_labels,
+    'faces': decode_faces,
+    'text': decode_text
+}
+
+def encode_result(name, result, encoding=None):
+    """
+    Encode one detector result when the compact encoding is enabled
+    """
+    encoding = encoding or RESULT_ENCODING
+    if encoding != 'compact' or name not in ENCODERS:
+        return result
+    return ENCODERS[name](result)
+
+def decode_result(name, result):
+    """
+    Return the verbose shape of one detector result, whatever its encoding
+    """
+    if isinstance(result, dict) and result.get('encoding') == ENCODING_NAME and name in DECODERS:
+        return DECODERS[name](result)
+    return result
+
+def decode_results(results):
+    """
+    Return a copy of a results dict with every detector result in the verbose shape
+    """
+    return {name: decode_result(name, result) for name, result in results.items()}
+
+def summary_view(results):
+    """
+    Decode only what generate_summary reads: every label, the first face
+    and the text lines. Much cheaper than decode_results for crowded
+    images and documents.
+    """
+    view = {}
+    for name, result in results.items():
+        if isinstance(result, dict) and result.get('encoding') == ENCODING_NAME:
+            if name == 'faces':
+                result = decode_faces(result, limit=1)
+            elif name == 'text':
+                result = decode_text(result, include_words=False)
+            else:
+                result = decode_result(name, result)
+        view[name] = result
+    return view
\ No newline at end of file
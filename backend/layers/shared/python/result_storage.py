@@ -0,0 +1,127 @@
+"""
+Storage layout for analysis results in the ResultsTable.
+
+'inline' (the original layout) stores the whole results tree, summary
+included, as nested maps in the 'results' attribute. 'compressed' keeps only
+'summary' as a map and stores the full tree as zlib-compressed JSON in the
+binary 'resultsBlob' attribute. Blobs larger than BLOB_INLINE_MAX_BYTES
+spill to an S3 object referenced by 'resultsObject'. Readers call
+unpack_results, which understands every layout.
+
+While the workflow runs, each detector stores its own section under
+'partialResults' by analysis name (see analysis_progress), as a map or a
+compressed blob depending on the mode. Writing the final layout removes
+them; unpack_sections reads them back.
+"""
+import json
+import os
+import zlib
+
+# 'inline' or 'compressed'
+RESULTS_STORAGE_MODE = os.environ.get('RESULTS_STORAGE_MODE', 'inline')
+
+# Compressed blobs above this size go to S3 instead of the item
+BLOB_INLINE_MAX_BYTES = int(os.environ.get('RESULTS_BLOB_INLINE_MAX_BYTES', 100 * 1024))
+
+# Prefix for spilled results objects in the image bucket
+RESULTS_PREFIX = os.environ.get('RESULTS_PREFIX', 'results/')
+
+# Every attribute a results layout can use; the unused ones are removed on write
+RESULT_ATTRIBUTES = ['results', 'summary', 'resultsBlob', 'resultsObject']
+
+COMPRESSION_LEVEL = 6
+
+# Map of analysis name -> section stored before the final results are written
+PARTIAL_RESULTS = 'partialResults'
+
+def results_object_key(user_id, image_id):
+    """
+    S3 key holding spilled results for an image
+    """
+    return f"{RESULTS_PREFIX}{user_id}/{image_id}.json.z"
+
+def compress_results(results):
+    """
+    Serialize and compress a results tree (floats or Decimals)
+    """
+    payload = json.dumps(results, separators=(',', ':'), default=float)
+    return zlib.compress(payload.encode('utf-8'), COMPRESSION_LEVEL)
+
+def decompress_results(blob):
+    """
+    Inverse of compress_results; accepts bytes or a boto3 Binary
+    """
+    blob = getattr(blob, 'value', blob)
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def pack_results(results, user_id, image_id, to_dynamo, s3=None, bucket=None, mode=None):
+    """
+    Return the item attributes to store for 'results' (which includes
+    'summary'). 'to_dynamo' converts floats for DynamoDB maps.
+    """
+    mode = mode or RESULTS_STORAGE_MODE
+    if mode != 'compressed':
+        return {'results': to_dynamo(results)}
+
+    blob = compress_results(results)
+    attributes = {'summary': to_dynamo(results.get('summary', {}))}
+
+    if len(blob) <= BLOB_INLINE_MAX_BYTES or not s3:
+        attributes['resultsBlob'] = blob
+    else:
+        object_key = results_object_key(user_id, image_id)
+        s3.put_object(
+            Bucket=bucket,
+            Key=object_key,
+            Body=blob,
+            ContentType='application/octet-stream'
+        )
+        attributes['resultsObject'] = object_key
+        print(f"Spilled {len(blob)} bytes of results to s3://{bucket}/{object_key}")
+
+    return attributes
+
+def pack_section(result, to_dynamo, mode=None):
+    """
+    Value stored in PARTIAL_RESULTS for one detector's result
+    """
+    if (mode or RESULTS_STORAGE_MODE) == 'compressed':
+        return compress_results(result)
+    return to_dynamo(result)
+
+def unpack_sections(item):
+    """
+    Analysis name -> result for the sections stored so far
+    """
+    return {
+        name: decompress_results(value) if isinstance(getattr(value, 'value', value), bytes) else value
+        for name, value in (item.get(PARTIAL_RESULTS) or {}).items()
+    }
+
+def build_update(attributes):
+    """
+    Build the SET/REMOVE clauses and expression names/values that write
+    'attributes' and clear the attributes of the other layouts and the
+    partial sections
+    """
+    set_clauses = [f"#{name} = :{name}" for name in attributes]
+    removed = [name for name in RESULT_ATTRIBUTES + [PARTIAL_RESULTS] if name not in attributes]
+
+    names = {f"#{name}": name for name in list(attributes) + removed}
+    values = {f":{name}": value for name, value in attributes.items()}
+    remove_clause = f" REMOVE {', '.join('#' + name for name in removed)}" if removed else ''
+
+    return ', '.join(set_clauses), remove_clause, names, values
+
+def unpack_results(item, s3=None, bucket=None):
+    """
+    Reassemble the full results tree from an item in any layout
+    """
+    if item.get('resultsBlob') is not None:
+        return decompress_results(item['resultsBlob'])
+
+    if item.get('resultsObject') and s3:
+        body = s3.get_object(Bucket=bucket, Key=item['resultsObject'])['Body'].read()
+        return decompress_results(body)
+
+    return item.get('results', {})
\ No newline at end of file
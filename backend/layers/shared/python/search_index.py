@@ -0,0 +1,121 @@
+"""
+Per-user inverted index over analysis results.
+
+search_indexer keeps SEARCH_INDEX_TABLE in step with the ResultsTable
+stream. There is one posting per (user, term, image):
+{userTerm: "<userId>#<term>", imageId, confidence, sources, createdAt}.
+Terms come from:
+- label names and their parents;
+- moderation label names and parents;
+- celebrity names;
+- the words of the detected text lines.
+
+A posting keeps the highest confidence the term reached in the image and
+the sources it came from ('label', 'moderation', 'celebrity', 'text').
+
+Each indexed image also has a manifest item under "<userId>##terms" listing
+its postings. A change or delete is diffed against the manifest rather
+than the stream's old image, because spilled results objects are
+overwritten or already deleted by the time the record arrives.
+
+Terms are normalized the same way on both sides: lower case, with runs of
+anything but letters and digits collapsed to one space. "T-Shirt" is
+therefore found by "t shirt" or "t-shirt".
+"""
+import os
+import re
+from decimal import Decimal
+
+from result_codec import summary_view
+
+SEARCH_INDEX_TABLE = os.environ.get('SEARCH_INDEX_TABLE')
+
+SOURCES = ['label', 'moderation', 'celebrity', 'text']
+
+# Shortest word of detected text worth indexing
+MIN_TEXT_TOKEN_LENGTH = 2
+
+# Longest term kept; longer ones are cut (they only come from text)
+MAX_TERM_LENGTH = 100
+
+MANIFEST_TERM = '#terms'
+
+SEPARATORS = re.compile(r'[\W_]+')
+
+def normalize_term(text):
+    """
+    Canonical form of a term, '' when nothing searchable is left
+    """
+    return ' '.join(SEPARATORS.sub(' ', str(text or '')).lower().split())[:MAX_TERM_LENGTH]
+
+def posting_key(user_id, term):
+    return f"{user_id}#{term}"
+
+def manifest_key(user_id):
+    return posting_key(user_id, MANIFEST_TERM)
+
+def extract_terms(results):
+    """
+    {term: (confidence, set of sources)} for a results tree in any encoding
+    """
+    terms = {}
+
+    def add(text, confidence, source):
+        term = normalize_term(text)
+        if not term:
+            return
+        confidence = float(confidence or 0)
+        best, sources = terms.get(term, (0.0, set()))
+        terms[term] = (max(best, confidence), sources | {source})
+
+    results = summary_view(results or {})
+
+    for label in (results.get('labels') or {}).get('labels', []):
+        add(label.get('name'), label.get('confidence'), 'label')
+        for parent in label.get('parents') or []:
+            add(parent, label.get('confidence'), 'label')
+
+    for label in (results.get('moderation') or {}).get('moderationLabels', []):
+        add(label.get('name'), label.get('confidence'), 'moderation')
+        add(label.get('parentName'), label.get('confidence'), 'moderation')
+
+    for celebrity in (results.get('celebrities') or {}).get('celebrities', []):
+        add(celebrity.get('name'), celebrity.get('confidence'), 'celebrity')
+
+    # Words of each line get the line's confidence; without lines, the
+    # combined text counts as certain
+    text = results.get('text') or {}
+    lines = text.get('lines') or [{'detectedText': text.get('combinedText', ''), 'confidence': 100}]
+    for line in lines:
+        for token in normalize_term(line.get('detectedText')).split():
+            if len(token) >= MIN_TEXT_TOKEN_LENGTH:
+                add(token, line.get('confidence'), 'text')
+
+    return terms
+
+def postings_for(terms):
+    """
+    Manifest form of extract_terms' output: {term: {confidence, sources}}
+    """
+    return {
+        term: {'confidence': Decimal(str(round(confidence, 2))), 'sources': sorted(sources)}
+        for term, (confidence, sources) in terms.items()
+    }
+
+def posting_item(user_id, image_id, term, posting, created_at):
+    return {
+        'userTerm': posting_key(user_id, term),
+        'imageId': image_id,
+        'confidence': posting['confidence'],
+        'sources': set(posting['sources']),
+        'createdAt': created_at
+    }
+
+def diff_postings(old, new):
+    """
+    (terms to write, terms to delete) to move an image from 'old' to 'new'
+    postings
+    """
+    writes = [term for term, posting in new.items() if old.get(term) != posting]
+    deletes = [term for term in old if term not in new]
+    return writes, deletes
@@ -0,0 +1,164 @@
+"""
+Per-user feed of image status transitions.
+
+status_publisher reads the ResultsTable stream and writes one item per status
+change to STATUS_EVENTS_TABLE:
+{userId, seq, imageId, status, previousStatus, updatedAt, expiresAt}.
+'seq' is the stream record's sequence number, zero-padded so that it sorts
+in stream order. A user's items all share one partition key, so the records
+arrive on one shard in write order.
+
+Records that change an image's analysis progress (a detector storing its
+section while the image is still processing) are published the same way,
+with the changed analyses in 'analyses' ({name: state}).
+
+Clients read the feed with a cursor. The cursor holds the last seq they saw
+and the time it was issued, and each read returns only newer events. Events
+expire after STATUS_EVENT_TTL_SECONDS. A cursor older than that may have
+missed events, so it is answered with 'reset' and the client reloads its
+list instead.
+"""
+import base64
+import json
+import os
+import time
+
+from analysis_progress import ANALYSIS_PROGRESS
+
+STATUS_EVENTS_TABLE = os.environ.get('STATUS_EVENTS_TABLE')
+
+# How long events stay in the feed
+STATUS_EVENT_TTL_SECONDS = int(os.environ.get('STATUS_EVENT_TTL_SECONDS', 86400))
+
+# Stream sequence numbers are up to 40 digits
+SEQ_WIDTH = 40
+START_SEQ = '0' * SEQ_WIDTH
+
+# Status recorded when the image's item is removed
+DELETED_STATUS = 'deleted'
+
+# Failure messages are cut to this length in events
+MAX_ERROR_LENGTH = 500
+
+def seq_of(sequence_number):
+    return sequence_number.zfill(SEQ_WIDTH)
+
+def string_attribute(image, name):
+    """
+    A string attribute of a stream record image (DynamoDB JSON), else None
+    """
+    return ((image or {}).get(name) or {}).get('S')
+
+def progress_changes(old_image, new_image):
+    """
+    Analysis name -> new state for the analyses whose progress a stream
+    record changes
+    """
+    old = ((old_image or {}).get(ANALYSIS_PROGRESS) or {}).get('M') or {}
+    new = ((new_image or {}).get(ANALYSIS_PROGRESS) or {}).get('M') or {}
+    return {name: value.get('S') for name, value in new.items() if old.get(name) != value}
+
+def transition(record):
+    """
+    Status event item for a ResultsTable stream record, or None when the
+    record changes neither the item's status nor its analysis progress
+    """
+    data = record['dynamodb']
+    new_image = data.get('NewImage')
+    old_image = data.get('OldImage')
+
+    if record['eventName'] == 'REMOVE':
+        status = DELETED_STATUS
+    else:
+        status = string_attribute(new_image, 'status')
+    previous_status = string_attribute(old_image, 'status')
+    analyses = progress_changes(old_image, new_image) if record['eventName'] != 'REMOVE' else {}
+    if not status or (status == previous_status and not analyses):
+        return None
+
+    keys = data['Keys']
+    updated_at = int(data.get('ApproximateCreationDateTime') or time.time())
+    item = {
+        'userId': keys['userId']['S'],
+        'seq': seq_of(data['SequenceNumber']),
+        'imageId': keys['imageId']['S'],
+        'status': status,
+        'updatedAt': updated_at,
+        'expiresAt': updated_at + STATUS_EVENT_TTL_SECONDS
+    }
+    if previous_status:
+        item['previousStatus'] = previous_status
+    if analyses:
+        item['analyses'] = analyses
+    error = string_attribute(new_image, 'error')
+    if status == 'failed' and error:
+        item['error'] = error[:MAX_ERROR_LENGTH]
+    return item
+
+def encode_cursor(seq, issued_at=None):
+    """
+    Opaque URL-safe cursor for a position in the feed
+    """
+    cursor = {'seq': seq, 'at': int(time.time() if issued_at is None else issued_at)}
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    (seq, issued at) of a cursor (raises ValueError if malformed)
+    """
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        seq, issued_at = decoded['seq'], int(decoded['at'])
+    except Exception:
+        raise ValueError("Malformed cursor")
+
+    if not isinstance(seq, str) or len(seq) != SEQ_WIDTH or not seq.isdigit():
+        raise ValueError("Malformed cursor")
+    return seq, issued_at
+
+def is_expired(issued_at, now=None):
+    """
+    Whether events after a cursor issued at 'issued_at' may have expired
+    """
+    return (time.time() if now is None else now) - issued_at >= STATUS_EVENT_TTL_SECONDS
+
+def latest_seq(table, user_id):
+    """
+    seq of the user's newest event, or START_SEQ when there is none
+    """
+    response = table.query(
+        KeyConditionExpression='userId = :uid',
+        ExpressionAttributeValues={':uid': user_id},
+        ProjectionExpression='seq',
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0]['seq'] if items else START_SEQ
+
+def read_events(table, user_id, after_seq, limit=100):
+    """
+    The user's events after 'after_seq', oldest first
+    """
+    response = table.query(
+        KeyConditionExpression='userId = :uid AND seq > :seq',
+        ExpressionAttributeValues={':uid': user_id, ':seq': after_seq},
+        Limit=limit
+    )
+    return response.get('Items', [])
+
+def public_event(item):
+    """
+    The fields of an event item returned to clients
+    """
+    event = {
+        'imageId': item['imageId'],
+        'status': item['status'],
+        'previousStatus': item.get('previousStatus'),
+        'updatedAt': int(item['updatedAt'])
+    }
+    if item.get('error'):
+        event['error'] = item['error']
+    if item.get('analyses'):
+        event['analyses'] = item['analyses']
+    return event
@@ -0,0 +1,171 @@
+"""
+Per-user analytics rollups.
+
+USER_STATS_TABLE holds one item per user with a counter attribute per
+statistic:
+- 'images', 'faces', 'unsafeImages', 'textImages': library totals;
+- 'label#<name>', 'moderation#<name>', 'celebrity#<name>': images per name;
+- 'day#<YYYY-MM-DD>': images uploaded per (UTC) day.
+
+Counters are top-level attributes so one update can ADD to any number of
+them atomically, which nested map paths do not allow.
+
+Each completed image record keeps its contribution in 'statsContribution'
+({labels, moderation, celebrities, faces, unsafe, text}); its upload day
+comes from the record's 'createdAt'. Writers swap the contribution on the
+record and apply the difference from the one it replaced:
+- results_processor and the cache-hit path when an image completes;
+- the image handler when an image is deleted.
+A retried completion therefore adds nothing, and a delete only subtracts
+what the record actually contributed. stats_rebuilder recomputes everything
+from the records when the counters need to be trusted again.
+"""
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import aws_clients
+from result_codec import summary_view
+
+USER_STATS_TABLE = os.environ.get('USER_STATS_TABLE')
+
+# Counters written per update_item; a larger delta takes several updates
+MAX_COUNTERS_PER_UPDATE = 100
+
+TOTALS = {
+    'images': 'imageCount',
+    'faces': 'faceCount',
+    'unsafeImages': 'unsafeImageCount',
+    'textImages': 'textImageCount'
+}
+
+def upload_day(created_at):
+    """
+    UTC day ('YYYY-MM-DD') of an upload timestamp; today without one
+    """
+    timestamp = int(created_at) if created_at else int(time.time())
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+def contribution(results):
+    """
+    What one image's results add to its owner's rollups
+    """
+    results = summary_view(results or {})
+
+    def names(entries):
+        return sorted({entry.get('name') for entry in entries if entry.get('name')})
+
+    moderation = results.get('moderation') or {}
+    return {
+        'labels': names((results.get('labels') or {}).get('labels', [])),
+        'moderation': names(moderation.get('moderationLabels', [])),
+        'celebrities': names((results.get('celebrities') or {}).get('celebrities', [])),
+        'faces': int((results.get('faces') or {}).get('faceCount', 0)),
+        'unsafe': not moderation.get('isSafe', True),
+        'text': bool((results.get('text') or {}).get('hasText', False))
+    }
+
+def counters(contrib, created_at):
+    """
+    Counter attribute deltas for a contribution of an image uploaded at
+    'created_at' (empty for None)
+    """
+    if not contrib:
+        return Counter()
+
+    deltas = Counter({
+        'images': 1,
+        'faces': int(contrib.get('faces', 0)),
+        'unsafeImages': 1 if contrib.get('unsafe') else 0,
+        'textImages': 1 if contrib.get('text') else 0,
+        f"day#{upload_day(created_at)}": 1
+    })
+    for prefix, key in (('label', 'labels'), ('moderation', 'moderation'), ('celebrity', 'celebrities')):
+        for name in contrib.get(key) or []:
+            deltas[f"{prefix}#{name}"] += 1
+    return deltas
+
+def delta(old, new, created_at):
+    """
+    Non-zero counter changes that move an image from contribution 'old' to
+    'new'
+    """
+    changes = counters(new, created_at)
+    changes.subtract(counters(old, created_at))
+    return {name: value for name, value in changes.items() if value}
+
+def apply_changes(user_id, changes):
+    """
+    ADD counter changes to the user's stats item. A failure is logged and
+    leaves the counters for stats_rebuilder to correct.
+    """
+    if not USER_STATS_TABLE or not changes:
+        return
+
+    try:
+        table = aws_clients.table(USER_STATS_TABLE)
+        names = list(changes)
+        for start in range(0, len(names), MAX_COUNTERS_PER_UPDATE):
+            batch = names[start:start + MAX_COUNTERS_PER_UPDATE]
+            table.update_item(
+                Key={'userId': user_id},
+                UpdateExpression='ADD ' + ', '.join(f"#c{i} :c{i}" for i in range(len(batch))) + ' SET #updatedAt = :updatedAt',
+                ExpressionAttributeNames={
+                    **{f"#c{i}": name for i, name in enumerate(batch)},
+                    '#updatedAt': 'updatedAt'
+                },
+                ExpressionAttributeValues={
+                    **{f":c{i}": changes[name] for i, name in enumerate(batch)},
+                    ':updatedAt': int(time.time())
+                }
+            )
+    except Exception as e:
+        print(f"Error updating stats for user {user_id}: {str(e)}")
+
+def record_contribution(user_id, old, new, created_at):
+    """
+    Apply the move of one image from contribution 'old' to 'new'
+    """
+    apply_changes(user_id, delta(old, new, created_at))
+
+def stats_item(user_id, contributions):
+    """
+    Stats item recomputed from scratch from every image's
+    (contribution, createdAt)
+    """
+    totals = Counter()
+    for contrib, created_at in contributions:
+        totals.update(counters(contrib, created_at))
+    return {
+        **{name: value for name, value in totals.items() if value},
+        'userId': user_id,
+        'updatedAt': int(time.time())
+    }
+
+def format_stats(item, top=20):
+    """
+    API view of a stats item: totals, the 'top' most frequent labels and
+    celebrities, every moderation label and the per-day upload histogram
+    """
+    item = item or {}
+
+    def ranked(prefix, limit=None):
+        entries = sorted(
+            ((name[len(prefix) + 1:], int(value)) for name, value in item.items()
+             if name.startswith(prefix + '#') and value > 0),
+            key=lambda entry: (-entry[1], entry[0])
+        )
+        return [{'name': name, 'count': count} for name, count in entries[:limit]]
+
+    return {
+        **{field: int(item.get(name, 0)) for name, field in TOTALS.items()},
+        'topLabels': ranked('label', top),
+        'moderation': ranked('moderation'),
+        'celebrities': ranked('celebrity', top),
+        'uploadsByDay': [
+            {'day': name[len('day#'):], 'count': int(value)}
+            for name, value in sorted(item.items()) if name.startswith('day#') and value > 0
+        ],
+        'updatedAt': int(item['updatedAt']) if 'updatedAt' in item else None
+    }
@@ -5,6 +5,7 @@ import Loader from '../Common/Loader';
 const ImageUploader = ({ onUpload, isUploading }) => {
   const [dragActive, setDragActive] = useState(false);
   const [selectedFile, setSelectedFile] = useState(null);
+  const [additionalFiles, setAdditionalFiles] = useState([]);
   const [previewUrl, setPreviewUrl] = useState(null);
   const [error, setError] = useState(null);
   
@@ -27,7 +28,7 @@ const ImageUploader = ({ onUpload, isUploading }) => {
     setDragActive(false);
     
     if (e.dataTransfer.files && e.dataTransfer.files[0]) {
-      handleFile(e.dataTransfer.files[0]);
+      handleFiles(Array.from(e.dataTransfer.files));
     }
   };
   
@@ -35,28 +36,43 @@ const ImageUploader = ({ onUpload, isUploading }) => {
     e.preventDefault();
     
     if (e.target.files && e.target.files[0]) {
-      handleFile(e.target.files[0]);
+      handleFiles(Array.from(e.target.files));
     }
   };
   
-  const handleFile = (file) => {
-    // Reset error state
-    setError(null);
-    
+  const validateFile = (file) => {
     // Validate file type
     if (!config.SUPPORTED_FILE_TYPES.includes(file.type)) {
-      setError('Unsupported file type. Please upload a JPEG, PNG, GIF, or BMP image.');
-      return;
+      return 'Unsupported file type. Please upload a JPEG, PNG, GIF, or BMP image.';
     }
     
     // Validate file size
     if (file.size > config.MAX_FILE_SIZE) {
-      setError(`File is too large. Maximum size is ${config.MAX_FILE_SIZE / (1024 * 1024)}MB.`);
+      return `File is too large. Maximum size is ${config.MAX_FILE_SIZE / (1024 * 1024)}MB.`;
+    }
+    
+    return null;
+  };
+  
+  const handleFiles = (files) => {
+    // Reset error state
+    setError(null);
+    
+    const validFiles = files.filter(file => !validateFile(file));
+    if (validFiles.length === 0) {
+      setError(validateFile(files[0]));
       return;
     }
     
-    // Set the selected file
+    if (validFiles.length < files.length) {
+      setError(`${files.length - validFiles.length} file(s) skipped (unsupported type or too large).`);
+    }
+    
+    const [file, ...rest] = validFiles;
+    
+    // Set the selected files
     setSelectedFile(file);
+    setAdditionalFiles(rest);
     
     // Create a preview URL
     const reader = new FileReader();
@@ -68,7 +84,7 @@ const ImageUploader = ({ onUpload, isUploading }) => {
   
   const handleUploadClick = () => {
     if (selectedFile) {
-      onUpload(selectedFile);
+      onUpload([selectedFile, ...additionalFiles]);
     }
   };
   
@@ -78,6 +94,7 @@ const ImageUploader = ({ onUpload, isUploading }) => {
   
   const handleRemoveFile = () => {
     setSelectedFile(null);
+    setAdditionalFiles([]);
     setPreviewUrl(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
@@ -98,13 +115,14 @@ const ImageUploader = ({ onUpload, isUploading }) => {
             ref={fileInputRef}
             type="file" 
             accept="image/jpeg,image/png,image/gif,image/bmp"
+            multiple
             onChange={handleChange}
             className="file-input"
           />
           
           <div className="upload-prompt">
             <div className="upload-icon">📁</div>
-            <h3>Drag & drop an image here</h3>
+            <h3>Drag & drop images here</h3>
             <p>or</p>
             <button 
               className="browse-button"
@@ -141,6 +159,9 @@ const ImageUploader = ({ onUpload, isUploading }) => {
           <div className="file-info">
             <p className="file-name">{selectedFile.name}</p>
             <p className="file-size">{(selectedFile.size / 1024).toFixed(1)} KB</p>
+            {additionalFiles.length > 0 && (
+              <p className="file-count">and {additionalFiles.length} more image(s)</p>
+            )}
           </div>
           
           <button 
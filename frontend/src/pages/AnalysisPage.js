@@ -7,6 +7,7 @@ import FacesAnalysis from '../components/Analysis/FacesAnalysis';
 import TextDisplay from '../components/Analysis/TextDisplay';
 import ModerationLabels from '../components/Analysis/ModerationLabels';
 import { getImageResults } from '../services/api';
+import { watchStatusChanges } from '../services/statusFeed';
 
 const AnalysisPage = () => {
   const { imageId } = useParams();
@@ -18,14 +19,25 @@ const AnalysisPage = () => {
   useEffect(() => {
     loadImageResults();
     
-    // Poll for results if the image is still processing
+    // Wait for the analysis to finish: follow the status feed when the API
+    // provides one, otherwise poll for results
     let interval;
-    if (imageData && imageData.status === 'processing') {
+    let stopFeed;
+    const inProgress = imageData && (imageData.status === 'pending' || imageData.status === 'processing');
+    if (inProgress && imageData.changesCursor) {
+      stopFeed = watchStatusChanges(imageData.changesCursor, {
+        onChanges: changes => {
+          if (changes.some(change => change.imageId === imageId)) loadImageResults();
+        },
+        onReset: loadImageResults
+      });
+    } else if (imageData && imageData.status === 'processing') {
       interval = setInterval(loadImageResults, 5000); // Check every 5 seconds
     }
     
     return () => {
       if (interval) clearInterval(interval);
+      if (stopFeed) stopFeed();
     };
   }, [imageId, imageData?.status]);
 
@@ -68,7 +80,9 @@ const AnalysisPage = () => {
     );
   }
 
-  const { imageUrl, fileName, status, results } = imageData;
+  const { imageUrl, fileName, status, results, rejection, analysisProgress } = imageData;
+  // Detectors store their results as they finish, before the summary exists
+  const hasSections = results && Object.keys(results).length > 0;
 
   return (
     <div className="analysis-page">
@@ -92,11 +106,18 @@ const AnalysisPage = () => {
             <div className="processing-indicator">
               <Loader size="small" />
               <p>Processing your image. This may take a minute...</p>
+              {analysisProgress && Object.keys(analysisProgress).length > 0 && (
+                <ul className="analysis-progress">
+                  {Object.entries(analysisProgress).map(([analysis, state]) => (
+                    <li key={analysis}>{analysis}: {state}</li>
+                  ))}
+                </ul>
+              )}
             </div>
           )}
         </div>
         
-        {status === 'completed' && (
+        {(status === 'completed' || (status === 'processing' && hasSections)) && (
           <div className="analysis-results">
             <div className="tabs">
               <button 
@@ -135,6 +156,14 @@ const AnalysisPage = () => {
               {activeTab === 'summary' && (
                 <div className="summary-tab">
                   <h3>Analysis Summary</h3>
+                  {!results.summary && (
+                    <p>The summary appears once every analysis has finished. Finished analyses are in their tabs.</p>
+                  )}
+                  {results.summary && results.summary.failed && (
+                    <p className="analysis-warning">
+                      Some analyses failed and are missing: {Object.keys(results.summary.failed).join(', ')}
+                    </p>
+                  )}
                   
                   {results.summary && (
                     <div className="summary-cards">
@@ -266,12 +295,25 @@ const AnalysisPage = () => {
         {status === 'failed' && (
           <div className="analysis-error">
             <h3>Analysis Failed</h3>
-            <p>Sorry, we couldn't analyze this image. This could be due to:</p>
-            <ul>
-              <li>Unsupported image format</li>
-              <li>Image too large or too small</li>
-              <li>Service unavailable</li>
-            </ul>
+            {rejection && rejection.length > 0 ? (
+              <>
+                <p>Sorry, this image could not be analyzed:</p>
+                <ul>
+                  {rejection.map((reason) => (
+                    <li key={reason.code}>{reason.message}</li>
+                  ))}
+                </ul>
+              </>
+            ) : (
+              <>
+                <p>Sorry, we couldn't analyze this image. This could be due to:</p>
+                <ul>
+                  <li>Unsupported image format</li>
+                  <li>Image too large or too small</li>
+                  <li>Service unavailable</li>
+                </ul>
+              </>
+            )}
             <p>Please try again with a different image.</p>
             <Link to="/" className="button primary-button">Upload Another Image</Link>
           </div>
@@ -4,7 +4,8 @@ import { Link } from 'react-router-dom';
 import ImageGallery from '../components/Images/ImageGallery';
 import Loader from '../components/Common/Loader';
 import ErrorDisplay from '../components/Common/ErrorDisplay';
-import { getImages, deleteImage } from '../services/api';
+import { getImages, deleteImage, deleteAllImages } from '../services/api';
+import { watchStatusChanges } from '../services/statusFeed';
 
 const GalleryPage = () => {
   const [images, setImages] = useState([]);
@@ -12,15 +13,30 @@ const GalleryPage = () => {
   const [error, setError] = useState(null);
   const [deleteInProgress, setDeleteInProgress] = useState(false);
   const [isPolling, setIsPolling] = useState(false);
+  const [nextToken, setNextToken] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const intervalRef = useRef(null);
+  const stopFeedRef = useRef(null);
+  const changesCursorRef = useRef(null);
+  const imagesRef = useRef(images);
 
   // Initial load of images
   useEffect(() => {
     loadImages();
+    
+    // Stop following the status feed on unmount
+    return () => {
+      if (stopFeedRef.current) {
+        stopFeedRef.current();
+        stopFeedRef.current = null;
+      }
+    };
   }, []);
 
   // Polling mechanism that correctly handles image status changes
   useEffect(() => {
+    imagesRef.current = images;
+    
     // Function to check image status and manage polling
     const checkAndUpdatePolling = () => {
       // Check if any images are still processing
@@ -30,6 +46,27 @@ const GalleryPage = () => {
       
       console.log("Checking images:", hasProcessingImages ? "Some processing" : "None processing");
       
+      // Follow the status feed when the API provides one; it delivers
+      // only the changes instead of reloading the whole list
+      if (hasProcessingImages && changesCursorRef.current) {
+        if (!stopFeedRef.current) {
+          console.log("Following status changes");
+          stopFeedRef.current = watchStatusChanges(changesCursorRef.current, {
+            onChanges: applyStatusChanges,
+            onReset: () => loadImages(true),
+            onCursor: cursor => { changesCursorRef.current = cursor; }
+          });
+        }
+        if (!isPolling) setIsPolling(true);
+        return;
+      }
+      
+      if (stopFeedRef.current) {
+        console.log("Stopping status feed - no processing images");
+        stopFeedRef.current();
+        stopFeedRef.current = null;
+      }
+      
       // Clear any existing interval
       if (intervalRef.current) {
         console.log("Clearing existing polling interval");
@@ -79,9 +116,20 @@ const GalleryPage = () => {
     setError(null);
     
     try {
-      const imageData = await getImages();
+      const { images: imageData, nextToken: token, changesCursor } = await getImages();
       console.log("Loaded images:", imageData.map(img => `${img.imageId}: ${img.status}`));
-      setImages(imageData);
+      if (changesCursor) changesCursorRef.current = changesCursor;
+      
+      if (isPoll) {
+        // Refresh the first page in place, keeping any older pages already loaded
+        setImages(prevImages => {
+          const refreshedIds = new Set(imageData.map(img => img.imageId));
+          return [...imageData, ...prevImages.filter(img => !refreshedIds.has(img.imageId))];
+        });
+      } else {
+        setImages(imageData);
+        setNextToken(token);
+      }
     } catch (err) {
       console.error('Error loading images:', err);
       // Only show errors for initial loads, not polling failures
@@ -93,6 +141,67 @@ const GalleryPage = () => {
     }
   };
 
+  // Apply status changes from the feed to the loaded images
+  const applyStatusChanges = (changes) => {
+    const latest = {};
+    changes.forEach(change => { latest[change.imageId] = change; });
+    
+    setImages(prevImages => prevImages
+      .filter(img => latest[img.imageId]?.status !== 'deleted')
+      .map(img => latest[img.imageId] ? { ...img, status: latest[img.imageId].status } : img));
+    
+    // Images uploaded elsewhere are not in the list yet
+    const loadedIds = new Set(imagesRef.current.map(img => img.imageId));
+    if (changes.some(change => change.status !== 'deleted' && !loadedIds.has(change.imageId))) {
+      loadImages(true);
+    }
+  };
+
+  const handleDeleteAll = async () => {
+    if (!window.confirm('Are you sure you want to delete ALL of your images? This cannot be undone.')) {
+      return;
+    }
+    
+    setDeleteInProgress(true);
+    
+    try {
+      const { failed } = await deleteAllImages();
+      const failedIds = new Set(failed.map(item => item.imageId));
+      setImages(prevImages => prevImages.filter(img => failedIds.has(img.imageId)));
+      setNextToken(null);
+      
+      if (failed.length > 0) {
+        setError(`${failed.length} image(s) could not be deleted. Please try again.`);
+      }
+    } catch (err) {
+      console.error('Error deleting images:', err);
+      setError('Failed to delete your images. Please try again.');
+    } finally {
+      setDeleteInProgress(false);
+    }
+  };
+
+  // Append the next page of older images
+  const loadMoreImages = async () => {
+    if (!nextToken) return;
+    
+    setLoadingMore(true);
+    
+    try {
+      const { images: imageData, nextToken: token } = await getImages(nextToken);
+      setImages(prevImages => {
+        const loadedIds = new Set(prevImages.map(img => img.imageId));
+        return [...prevImages, ...imageData.filter(img => !loadedIds.has(img.imageId))];
+      });
+      setNextToken(token);
+    } catch (err) {
+      console.error('Error loading more images:', err);
+      setError('Failed to load more images. Please try again.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDeleteImage = async (imageId) => {
     if (!window.confirm('Are you sure you want to delete this image?')) {
       return;
@@ -119,7 +228,18 @@ const GalleryPage = () => {
     <div className="gallery-page">
       <div className="gallery-header">
         <h1>Your Image Gallery</h1>
-        <Link to="/" className="upload-button">Upload New Image</Link>
+        <div className="gallery-actions">
+          {images.length > 0 && (
+            <button 
+              className="button delete-all-button" 
+              onClick={handleDeleteAll}
+              disabled={deleteInProgress}
+            >
+              Delete All
+            </button>
+          )}
+          <Link to="/" className="upload-button">Upload New Image</Link>
+        </div>
       </div>
       
       {error && <ErrorDisplay message={error} />}
@@ -138,6 +258,18 @@ const GalleryPage = () => {
         />
       )}
       
+      {nextToken && (
+        <div className="gallery-load-more">
+          <button 
+            className="button primary-button" 
+            onClick={loadMoreImages}
+            disabled={loadingMore}
+          >
+            {loadingMore ? 'Loading...' : 'Load More'}
+          </button>
+        </div>
+      )}
+      
       <div className="gallery-help">
         <h3>Image Analysis Status</h3>
         <div className="status-legend">
@@ -1,21 +1,30 @@
 import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import ImageUploader from '../components/Images/ImageUploader';
-import { uploadImage } from '../services/api';
+import { uploadImage, uploadImages } from '../services/api';
 
 const HomePage = () => {
   const [isUploading, setIsUploading] = useState(false);
   const [uploadError, setUploadError] = useState(null);
   const navigate = useNavigate();
 
-  const handleUpload = async (file) => {
-    if (!file) return;
+  const handleUpload = async (files) => {
+    if (!files || files.length === 0) return;
     
     setIsUploading(true);
     setUploadError(null);
     
     try {
-      const imageId = await uploadImage(file);
+      if (files.length === 1) {
+        await uploadImage(files[0]);
+      } else {
+        // One upload-URL request per batch instead of one per file
+        const { imageIds, failed } = await uploadImages(files);
+        if (failed.length > 0) {
+          setUploadError(`${failed.length} of ${files.length} images failed to upload.`);
+          if (imageIds.length === 0) return;
+        }
+      }
       
       // Navigate to the gallery page after successful upload
       navigate('/gallery');
@@ -83,12 +83,14 @@ export const register = async (email, password) => {
 /**
  * Image related functions
  */
-export const uploadImage = async (file) => {
-  // Step 1: Get a pre-signed URL
+export const uploadImage = async (file, analysisProfile) => {
+  // Step 1: Get a pre-signed URL (analysisProfile picks the analyses to run,
+  // e.g. 'basic' for labels and moderation only; the server defaults to 'full')
   const urlResponse = await apiRequest('/images/upload-url', {
     method: 'POST',
     body: JSON.stringify({
-      fileName: file.name
+      fileName: file.name,
+      analysisProfile
     })
   });
   
@@ -108,9 +110,121 @@ export const uploadImage = async (file) => {
   return urlResponse.imageId;
 };
 
-export const getImages = async () => {
-  const response = await apiRequest('/images');
-  return response.images || [];
+/**
+ * Upload several files using one upload-URL request per batch of files,
+ * all with the same optional analysis profile.
+ * Returns the uploaded image IDs and the files that failed.
+ */
+export const uploadImages = async (files, analysisProfile) => {
+  const batchSize = config.UPLOAD_BATCH_SIZE || 100;
+  const concurrency = config.UPLOAD_CONCURRENCY || 4;
+  const imageIds = [];
+  const failed = [];
+  
+  for (let start = 0; start < files.length; start += batchSize) {
+    const batch = files.slice(start, start + batchSize);
+    
+    // Step 1: Get pre-signed URLs for the whole batch
+    const urlResponse = await apiRequest('/images/upload-urls', {
+      method: 'POST',
+      body: JSON.stringify({
+        files: batch.map(file => ({ fileName: file.name })),
+        analysisProfile
+      })
+    });
+    
+    (urlResponse.failed || []).forEach(item => {
+      failed.push({ fileName: item.fileName, message: item.message });
+    });
+    
+    // Step 2: Upload the files to S3 with bounded concurrency
+    const uploads = [...(urlResponse.uploads || [])];
+    const worker = async () => {
+      while (uploads.length > 0) {
+        const upload = uploads.shift();
+        const file = batch[upload.index];
+        
+        try {
+          const uploadResponse = await fetch(upload.uploadUrl, {
+            method: 'PUT',
+            body: file,
+            headers: {
+              'Content-Type': file.type
+            }
+          });
+          
+          if (!uploadResponse.ok) {
+            throw new Error('Failed to upload image to storage');
+          }
+          imageIds.push(upload.imageId);
+        } catch (err) {
+          failed.push({ fileName: file.name, message: err.message });
+        }
+      }
+    };
+    
+    await Promise.all(Array.from({ length: concurrency }, worker));
+  }
+  
+  return { imageIds, failed };
+};
+
+export const getImages = async (nextToken = null, limit = null) => {
+  const params = new URLSearchParams();
+  if (nextToken) params.append('nextToken', nextToken);
+  if (limit) params.append('limit', limit);
+  
+  const query = params.toString();
+  const response = await apiRequest(`/images${query ? `?${query}` : ''}`);
+  return {
+    images: response.images || [],
+    nextToken: response.nextToken || null,
+    changesCursor: response.changesCursor || null
+  };
+};
+
+/**
+ * Wait for status changes after 'cursor' (a long poll that returns as soon
+ * as there are any, or empty after 'wait' seconds)
+ */
+export const getStatusChanges = async (cursor, wait = null, signal = undefined) => {
+  const params = new URLSearchParams();
+  if (cursor) params.append('cursor', cursor);
+  if (wait !== null) params.append('wait', wait);
+  
+  const response = await apiRequest(`/images/changes?${params.toString()}`, { signal });
+  return {
+    changes: response.changes || [],
+    cursor: response.cursor || null,
+    reset: Boolean(response.reset)
+  };
+};
+
+/**
+ * Search images by label, moderation label, celebrity or detected word.
+ * 'terms' is a list; options: op ('and' | 'or'), minConfidence, field, limit, nextToken
+ */
+export const searchImages = async (terms, options = {}) => {
+  const params = new URLSearchParams({ q: terms.join(',') });
+  ['op', 'minConfidence', 'field', 'limit', 'nextToken'].forEach(name => {
+    if (options[name] !== undefined && options[name] !== null) params.append(name, options[name]);
+  });
+  
+  const response = await apiRequest(`/images/search?${params.toString()}`);
+  return {
+    images: response.images || [],
+    nextToken: response.nextToken || null,
+    totalMatches: response.totalMatches || 0
+  };
+};
+
+export const getImageStats = async (top) => {
+  const query = top ? `?top=${top}` : '';
+  return apiRequest(`/images/stats${query}`);
+};
+
+export const getDuplicateGroups = async () => {
+  return apiRequest('/images/duplicates');
 };
 
 export const getImageResults = async (imageId) => {
@@ -123,4 +237,36 @@ export const deleteImage = async (imageId) => {
     method: 'DELETE'
   });
   return true;
+};
+
+/**
+ * Delete several images in one request. Returns { deleted, failed }.
+ */
+export const deleteImages = async (imageIds) => {
+  const response = await apiRequest('/images/bulk-delete', {
+    method: 'POST',
+    body: JSON.stringify({ imageIds })
+  });
+  return { deleted: response.deleted || [], failed: response.failed || [] };
+};
+
+/**
+ * Delete all of the user's images, repeating while the API reports more.
+ */
+export const deleteAllImages = async () => {
+  const deleted = [];
+  const failed = [];
+  let hasMore = true;
+  
+  while (hasMore) {
+    const response = await apiRequest('/images/bulk-delete', {
+      method: 'POST',
+      body: JSON.stringify({ all: true })
+    });
+    deleted.push(...(response.deleted || []));
+    failed.push(...(response.failed || []));
+    hasMore = response.hasMore === true;
+  }
+  
+  return { deleted, failed };
 };
\ No newline at end of file
@@ -0,0 +1,50 @@
+import { config } from '../utils/config';
+import { getStatusChanges } from './api';
+
+// Longest pause between attempts after failed feed requests
+const MAX_RETRY_DELAY = 60000;
+
+/**
+ * Follow the status feed from 'cursor' with back-to-back long polls.
+ *
+ * onChanges(changes) gets every batch of status changes, onReset() is called
+ * when the cursor was too old and the caller should reload, and
+ * onCursor(cursor) sees each new cursor so the caller can resume later.
+ * Returns a function that stops following.
+ */
+export const watchStatusChanges = (cursor, { onChanges, onReset, onCursor }) => {
+  const controller = new AbortController();
+  let stopped = false;
+
+  const follow = async () => {
+    let retryDelay = config.POLLING_INTERVAL || 3000;
+
+    while (!stopped) {
+      try {
+        const response = await getStatusChanges(cursor, null, controller.signal);
+        if (stopped) break;
+
+        cursor = response.cursor;
+        if (onCursor) onCursor(cursor);
+        if (response.reset) {
+          if (onReset) onReset();
+        } else if (response.changes.length > 0) {
+          onChanges(response.changes);
+        }
+        retryDelay = config.POLLING_INTERVAL || 3000;
+      } catch (err) {
+        if (stopped) break;
+        console.error('Status feed error, retrying:', err);
+        await new Promise(resolve => setTimeout(resolve, retryDelay));
+        retryDelay = Math.min(retryDelay * 2, MAX_RETRY_DELAY);
+      }
+    }
+  };
+
+  follow();
+
+  return () => {
+    stopped = true;
+    controller.abort();
+  };
+};
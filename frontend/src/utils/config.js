@@ -16,5 +16,11 @@ export const config = {
     SUPPORTED_FILE_TYPES: ['image/jpeg', 'image/png', 'image/gif', 'image/bmp'],
     
     // Polling interval for processing status (in milliseconds)
-    POLLING_INTERVAL: 3000
+    POLLING_INTERVAL: 3000,
+    
+    // Files per batch upload-URL request (must not exceed the API maximum)
+    UPLOAD_BATCH_SIZE: 100,
+    
+    // Number of files uploaded to S3 at the same time
+    UPLOAD_CONCURRENCY: 4
   };
\ No newline at end of file
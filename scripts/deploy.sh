@@ -6,6 +6,19 @@ STACK_NAME="image-recognition-app"
 REGION="us-east-1"  # Set to your AWS Academy region
 S3_BUCKET="${STACK_NAME}-deployment-$(aws sts get-caller-identity --query Account --output text)"
 EC2_KEY_NAME="${STACK_NAME}-key"
+# Detector execution mode: "fanout" (one Lambda per detector), "fused", or
+# "cascade" (fused, with faces/celebrities/text gated on labels and moderation)
+ANALYZER_MODE="${ANALYZER_MODE:-fanout}"
+# Results layout: "inline" (nested DynamoDB maps) or "compressed" (summary + blob)
+RESULTS_STORAGE_MODE="${RESULTS_STORAGE_MODE:-inline}"
+# Detector result shape: "json" (verbose) or "compact" (columnar, quantized)
+RESULT_ENCODING="${RESULT_ENCODING:-json}"
+# Per-operation Rekognition calls per second shared by all detectors
+# (slightly under the account's TPS quota)
+REKOGNITION_TPS="${REKOGNITION_TPS:-45}"
+# Hamming distance up to which uploads count as near-duplicates (changing it
+# re-lays the hash index; images indexed before are matched once re-indexed)
+NEAR_DUPLICATE_MAX_DISTANCE="${NEAR_DUPLICATE_MAX_DISTANCE:-3}"
 
 echo "Starting deployment of $STACK_NAME..."
 
@@ -17,10 +30,16 @@ aws s3 mb s3://$S3_BUCKET --region $REGION || true
 echo "Uploading EC2 user data script..."
 aws s3 cp backend/user_data/ec2_setup.sh s3://$S3_BUCKET/ec2_setup.sh
 
-# Install dependencies for Lambda layer
+# Install dependencies for Lambda layer. Pillow (and cryptography) are
+# compiled, so fetch the wheels built for the Lambda runtime (python3.9 on
+# x86_64 Linux) rather than for whatever machine runs this script
 echo "Installing Lambda layer dependencies..."
 mkdir -p backend/layers/common_dependencies/python
-pip install -r backend/requirements.txt -t backend/layers/common_dependencies/python --upgrade
+pip install -r backend/requirements.txt -t backend/layers/common_dependencies/python --upgrade \
+  --platform manylinux2014_x86_64 \
+  --implementation cp \
+  --python-version 3.9 \
+  --only-binary=:all:
 
 # Create or update EC2 key pair
 echo "Creating EC2 key pair..."
@@ -53,7 +72,12 @@ aws cloudformation deploy \
     AppName=$STACK_NAME \
     KeyPairName=$EC2_KEY_NAME \
     UserDataBucket=$S3_BUCKET \
-    UserDataKey=ec2_setup.sh
+    UserDataKey=ec2_setup.sh \
+    AnalyzerMode=$ANALYZER_MODE \
+    ResultsStorageMode=$RESULTS_STORAGE_MODE \
+    ResultEncoding=$RESULT_ENCODING \
+    RekognitionTps=$REKOGNITION_TPS \
+    NearDuplicateMaxDistance=$NEAR_DUPLICATE_MAX_DISTANCE
 
 if [ $? -ne 0 ]; then
   echo "CloudFormation deployment failed. Exiting."
@@ -85,7 +109,9 @@ export const config = {
   },
   MAX_FILE_SIZE: 5 * 1024 * 1024, // 5MB
   SUPPORTED_FILE_TYPES: ['image/jpeg', 'image/png', 'image/gif', 'image/bmp'],
-  POLLING_INTERVAL: 3000
+  POLLING_INTERVAL: 3000,
+  UPLOAD_BATCH_SIZE: 100,
+  UPLOAD_CONCURRENCY: 4
 };
 EOF
 